@@ -0,0 +1,283 @@
+"""
+Offline load generator for the bot's command handlers.
+
+Builds stand-in discord.Interaction objects whose response/followup record timings, and
+drives the DiceCommands, SkillCommands and LogCommands callbacks directly on one event
+loop, through the same command-tree check (timing and rate limiting) used in production.
+Runs against a temporary skills.db/config.json; nothing is sent to Discord.
+
+    python benchmarks/loadtest.py --rate 500 --duration 10 --concurrency 200 \\
+        --mix roll=60,coc=25,skill-show=8,skill-add=2,log-mode=4,log-export=1
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import discord  # noqa: E402
+
+DEFAULT_MIX = "roll=60,coc=25,skill-show=8,skill-add=2,log-mode=4,log-export=1"
+ROLL_EXPRESSIONS = ["d20+5", "2d6+1", "1d100>=50", "+3 d6", "4d8-2", "+10 1d20+7>=15"]
+SKILL_NAMES = ["火球術", "偵查", "聆聽", "閃避", "圖書館使用", "說服"]
+
+_ids = itertools.count(10 ** 17)
+
+
+class FakeResponse:
+    """Stands in for discord.InteractionResponse and records when the reply was sent"""
+
+    def __init__(self, interaction: 'FakeInteraction', api_latency: float):
+        self._interaction = interaction
+        self._api_latency = api_latency
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _reply(self):
+        if self._done:
+            raise RuntimeError("interaction already responded to")
+        self._done = True
+        self._interaction.responded_at = time.perf_counter()
+        if self._api_latency:
+            await asyncio.sleep(self._api_latency)
+
+    async def send_message(self, content: Optional[str] = None, **kwargs):
+        self._interaction.replies.append(content if content is not None else kwargs.get('embed'))
+        await self._reply()
+
+    async def defer(self, **kwargs):
+        await self._reply()
+
+    async def edit_message(self, **kwargs):
+        await self._reply()
+
+
+class FakeFollowup:
+    """Stands in for the interaction followup webhook"""
+
+    def __init__(self, interaction: 'FakeInteraction', api_latency: float):
+        self._interaction = interaction
+        self._api_latency = api_latency
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        attachment = kwargs.get('file')
+        if attachment is not None:
+            # Read the attachment like the HTTP client would
+            attachment.fp.read()
+        self._interaction.replies.append(content)
+        self._interaction.completed_at = time.perf_counter()
+        if self._api_latency:
+            await asyncio.sleep(self._api_latency)
+
+
+class FakeInteraction:
+    """The subset of discord.Interaction used by the cogs and the command tree"""
+
+    def __init__(self, bot, command, namespace: Dict[str, Any], guild, user, channel, api_latency: float):
+        self.id = next(_ids)
+        self.type = discord.InteractionType.application_command
+        self.client = bot
+        self.command = command
+        self.namespace = SimpleNamespace(**namespace)
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.extras: Dict[str, Any] = {}
+        self.response = FakeResponse(self, api_latency)
+        self.followup = FakeFollowup(self, api_latency)
+        self.replies: List[Any] = []
+        self.responded_at: Optional[float] = None
+        self.completed_at: Optional[float] = None
+
+    async def original_response(self):
+        return SimpleNamespace(id=next(_ids))
+
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown command in mix: {name} (expected {', '.join(SCENARIOS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def choice(value: str) -> discord.app_commands.Choice:
+    return discord.app_commands.Choice(name=value, value=value)
+
+
+# Each scenario returns (cog name, command attribute, keyword arguments)
+SCENARIOS = {
+    'roll': lambda rng: ('DiceCommands', 'roll', {'expression': rng.choice(ROLL_EXPRESSIONS)}),
+    'coc': lambda rng: ('DiceCommands', 'coc', {'skill': str(rng.randint(1, 100)), 'times': rng.randint(1, 3)}),
+    'skill-show': lambda rng: ('SkillCommands', 'skill', {'action': choice('show'), 'name': rng.choice(SKILL_NAMES)}),
+    'skill-add': lambda rng: ('SkillCommands', 'skill', {
+        'action': choice('add'), 'name': rng.choice(SKILL_NAMES),
+        'skill_type': '法術', 'level': str(rng.randint(1, 9)), 'effect': '造成傷害'
+    }),
+    'log-mode': lambda rng: ('LogCommands', 'log_stream_mode', {'mode': choice(rng.choice(['live', 'batch']))}),
+    'log-export': lambda rng: ('LogCommands', 'log_export', {
+        'start': '2000-01-01', 'end': '2100-01-01', 'output_format': choice('gzip')
+    }),
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure_loop_lag(samples: List[float], interval: float, stop: asyncio.Event):
+    """Sample how late a short sleep wakes up; the overshoot is the event-loop lag"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def run_load(args) -> Dict[str, Any]:
+    from utils.bot import TRPGDiscordBot
+    from cogs.dice_commands import DiceCommands
+    from cogs.skill_commands import SkillCommands
+    from cogs.log_commands import LogCommands
+
+    bot = TRPGDiscordBot(sync_commands=False)
+    cogs = {cog.__class__.__name__: cog for cog in (DiceCommands(bot), SkillCommands(bot), LogCommands(bot))}
+    for cog in cogs.values():
+        await bot.add_cog(cog)
+    # Queued journal rows are written in worker threads, as in the running bot
+    bot.start_flusher()
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    guilds = [SimpleNamespace(id=1000 + i, name=f"guild {i}", filesize_limit=25 * 2 ** 20) for i in range(args.guilds)]
+    users = [SimpleNamespace(id=5000 + i, mention=f"<@{5000 + i}>", display_name=f"player{i}") for i in range(args.users)]
+    channel = SimpleNamespace(id=42, mention="<#42>")
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    first_errors: Dict[str, str] = {}
+    rejected: Dict[str, int] = defaultdict(int)
+    lag_samples: List[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    in_flight = set()
+
+    async def invoke(scenario: str):
+        cog_name, attribute, kwargs = SCENARIOS[scenario](rng)
+        cog = cogs[cog_name]
+        command = getattr(cog, attribute)
+        interaction = FakeInteraction(
+            bot, command, kwargs, rng.choice(guilds), rng.choice(users), channel, args.api_latency / 1000
+        )
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if await bot.tree.interaction_check(interaction):
+                    await command.callback(cog, interaction, **kwargs)
+                    bot._observe_command(interaction, command.qualified_name)
+                else:
+                    rejected[scenario] += 1
+                    return
+            except Exception as e:
+                errors[scenario] += 1
+                first_errors.setdefault(scenario, f"{type(e).__name__}: {e}")
+                return
+            finished = interaction.completed_at or interaction.responded_at or time.perf_counter()
+            latencies[scenario].append(finished - started)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lag_samples, 0.01, stop))
+    interval = 1 / args.rate
+    start = time.perf_counter()
+    issued = 0
+    while time.perf_counter() - start < args.duration:
+        # Open-loop arrivals: issue every request that is due, then yield to the loop
+        due = int((time.perf_counter() - start) / interval) + 1
+        while issued < due:
+            task = asyncio.create_task(invoke(rng.choices(names, weights)[0]))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            issued += 1
+        await asyncio.sleep(min(interval, 0.005))
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    bot._journal_flush_task.cancel()
+    bot.event_journal.flush()
+
+    return {
+        'issued': issued,
+        'elapsed': elapsed,
+        'latencies': latencies,
+        'errors': errors,
+        'first_errors': first_errors,
+        'rejected': rejected,
+        'lag': lag_samples,
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    latencies = result['latencies']
+    completed = sum(len(values) for values in latencies.values())
+    print(f"issued {result['issued']} commands in {result['elapsed']:.2f}s, "
+          f"completed {completed} ({completed / result['elapsed']:.1f}/s)")
+    print(f"{'command':<12} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} {'limited':>8}")
+    for name in sorted(set(latencies) | set(result['errors']) | set(result['rejected'])):
+        values = latencies.get(name, [])
+        print(f"{name:<12} {len(values):>7} {percentile(values, 0.5) * 1000:>8.2f} "
+              f"{percentile(values, 0.9) * 1000:>8.2f} {percentile(values, 0.99) * 1000:>8.2f} "
+              f"{(max(values) if values else 0) * 1000:>8.2f} {result['errors'].get(name, 0):>7} "
+              f"{result['rejected'].get(name, 0):>8}")
+    for name, message in result['first_errors'].items():
+        print(f"first error in {name}: {message}")
+    lag = result['lag']
+    print(f"event-loop lag: p50 {percentile(lag, 0.5) * 1000:.2f} ms, p99 {percentile(lag, 0.99) * 1000:.2f} ms, "
+          f"max {(max(lag) if lag else 0) * 1000:.2f} ms ({len(lag)} samples)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the command handlers")
+    parser.add_argument("--rate", type=float, default=500, help="commands issued per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to generate load")
+    parser.add_argument("--concurrency", type=int, default=200, help="maximum handlers in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted command mix (default {DEFAULT_MIX})")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--api-latency", type=float, default=0, help="simulated Discord API latency in ms")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as workdir:
+        # skills.db and config.json are created relative to the working directory
+        os.chdir(workdir)
+        try:
+            result = asyncio.run(run_load(args))
+        finally:
+            os.chdir(ROOT)
+    print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Reproducible RSS comparison of the memory profiles in utils/memory_profile.py.
+
+Each profile runs in a fresh interpreter that builds a TRPGDiscordBot and feeds it the
+same synthetic gateway payloads (GUILD_CREATE with members, then MESSAGE_CREATE if the
+profile's intents would receive them), exactly as discord.py's state parser caches them.
+No network access or token is needed.
+
+    python benchmarks/memory_profile.py --guilds 2000 --members 50 --messages 20000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def user_payload(user_id: int):
+    return {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': '0', 'avatar': None, 'global_name': None}
+
+
+def guild_payload(guild_id: int, members: int):
+    first_user = guild_id * 1000
+    return {
+        'id': str(guild_id),
+        'name': f"guild {guild_id}",
+        'owner_id': str(first_user),
+        'member_count': members,
+        'features': [],
+        'emojis': [],
+        'stickers': [],
+        'roles': [{
+            'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0,
+            'color': 0, 'hoist': False, 'managed': False, 'mentionable': False
+        }],
+        'channels': [{
+            'id': str(guild_id * 10 + i), 'type': 0, 'name': f"channel-{i}",
+            'position': i, 'permission_overwrites': []
+        } for i in range(5)],
+        'members': [{
+            'user': user_payload(first_user + i), 'roles': [],
+            'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0
+        } for i in range(members)],
+        'voice_states': [],
+        'presences': [],
+        'threads': [],
+        'unavailable': False,
+    }
+
+
+def message_payload(message_id: int, guild_id: int):
+    author_id = guild_id * 1000
+    return {
+        'id': str(message_id), 'channel_id': str(guild_id * 10), 'guild_id': str(guild_id),
+        'author': user_payload(author_id),
+        'member': {'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0},
+        'content': '/roll 2d6+1 ' + 'x' * 40, 'timestamp': '2024-01-01T00:00:00+00:00',
+        'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+        'mention_roles': [], 'attachments': [], 'embeds': [], 'pinned': False, 'type': 0,
+    }
+
+
+async def measure(profile: str, guilds: int, members: int, messages: int):
+    from utils.bot import TRPGDiscordBot
+    from utils.memory_profile import read_rss_bytes
+
+    gc.collect()
+    baseline = read_rss_bytes()
+    bot = TRPGDiscordBot(memory_profile=profile)
+    state = bot._connection
+    for guild_id in range(1, guilds + 1):
+        state._add_guild_from_data(guild_payload(guild_id, members))
+    if bot.intents.guild_messages and state._messages is not None:
+        for message_id in range(messages):
+            guild_id = message_id % guilds + 1
+            state._messages.append(discord_message(state, message_payload(10 ** 9 + message_id, guild_id)))
+    gc.collect()
+    return {
+        'profile': profile,
+        'rss_mb': round((read_rss_bytes() - baseline) / 2 ** 20, 1),
+        'cached_guilds': len(bot.guilds),
+        'cached_messages': len(state._messages) if state._messages is not None else 0,
+    }
+
+
+def discord_message(state, data):
+    import discord
+    channel, _ = state._get_guild_channel(data)
+    return discord.Message(channel=channel, data=data, state=state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory profile RSS benchmark")
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=50, help="members per guild in GUILD_CREATE (parsed, but neither profile caches them)")
+    parser.add_argument("--messages", type=int, default=10000, help="MESSAGE_CREATE events (if received)")
+    parser.add_argument("--run-profile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        result = asyncio.run(measure(args.run_profile, args.guilds, args.members, args.messages))
+        print(json.dumps(result))
+        return
+
+    from utils.memory_profile import MEMORY_PROFILES
+    print(f"guilds={args.guilds} members/guild={args.members} messages={args.messages}")
+    print(f"{'profile':<10} {'RSS delta':>10} {'guilds':>8} {'messages':>9}")
+    for profile in MEMORY_PROFILES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--run-profile', profile, '--guilds', str(args.guilds),
+             '--members', str(args.members), '--messages', str(args.messages)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{result['profile']:<10} {result['rss_mb']:>8.1f}MB {result['cached_guilds']:>8} "
+              f"{result['cached_messages']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
 # Cogs package initialization
 # Note: Individual command classes are imported in bot.py to avoid slash_command issues during import
 
-__all__ = ['DiceCommands', 'SkillCommands', 'LogCommands', 'AdminCommands', 'HelpCommands']
\ No newline at end of file
+__all__ = ['DiceCommands', 'SkillCommands', 'LogCommands', 'AdminCommands', 'HelpCommands', 'SheetCommands', 'MacroCommands', 'SessionCommands']
\ No newline at end of file
@@ -1,49 +1,101 @@
 import discord
 import asyncio
+import io
+import time
+import weakref
 from discord.ext import commands
 from models.config import ConfigManager
-from typing import Optional
+from utils.diagnostics import build_stats_embed
+from utils.heap_profiler import HeapProfiler, MAX_TRACE_FRAMES, object_counts
+from typing import Any, Dict, List, Optional
 
 
 # View for admin action confirmation
 class AdminConfirmView(discord.ui.View):
-    def __init__(self, bot, action: str, author: discord.User):
-        super().__init__(timeout=30)
+    def __init__(self, bot, action: str, author: discord.abc.Snowflake, timeout: Optional[float] = 30,
+                 argument: Optional[str] = None):
+        super().__init__(timeout=timeout)
         self.bot = bot
         self.action = action
+        self.argument = argument
         self.author = author
+        self.message_id: Optional[int] = None
+        self.expires_at = time.time() + (timeout or 0)
 
-    @discord.ui.button(label="確認", style=discord.ButtonStyle.primary)
+    def to_state(self) -> Dict[str, Any]:
+        """Serializable state for the restart snapshot"""
+        return {
+            'message_id': self.message_id,
+            'action': self.action,
+            'argument': self.argument,
+            'author_id': self.author.id,
+            'expires_at': self.expires_at
+        }
+
+    @classmethod
+    def from_state(cls, bot, state: Dict[str, Any]) -> Optional['AdminConfirmView']:
+        """Re-attach a view to its message after a restart; None if it has expired"""
+        remaining = state['expires_at'] - time.time()
+        if remaining <= 0:
+            return None
+        # add_view requires timeout=None, so the remaining lifetime is scheduled separately
+        view = cls(bot, state['action'], discord.Object(id=state['author_id']), timeout=None,
+                   argument=state.get('argument'))
+        view.message_id = state['message_id']
+        view.expires_at = state['expires_at']
+        bot.add_view(view, message_id=view.message_id)
+        asyncio.get_running_loop().call_later(remaining, view.stop)
+        return view
+
+    @discord.ui.button(label="確認", style=discord.ButtonStyle.primary, custom_id="admin_confirm:confirm")
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.author.id:
             await interaction.response.send_message("您無法執行此操作", ephemeral=True)
             return
         
+        self.stop()
         await interaction.response.edit_message(content=f"已確認，機器人即將{self.action}……", view=None)
+        self.bot.global_stream.publish("admin", f"{interaction.user.mention} 確認執行 {self.action}")
         
         if self.action == "restart":
             # Schedule restart
-            asyncio.create_task(self.restart_bot())
+            asyncio.create_task(self.restart_bot(interaction))
         elif self.action == "shutdown":
             # Schedule shutdown
             asyncio.create_task(self.shutdown_bot())
+        elif self.action == "restore":
+            asyncio.create_task(self.restore_backup(interaction))
 
-    @discord.ui.button(label="取消", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="取消", style=discord.ButtonStyle.secondary, custom_id="admin_confirm:cancel")
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.author.id:
             await interaction.response.send_message("您無法執行此操作", ephemeral=True)
             return
         
+        self.stop()
         await interaction.response.edit_message(content="操作已取消", view=None)
 
-    async def restart_bot(self):
-        """Restart the bot (in a real implementation, this would restart the process)"""
-        # In a real implementation, this would restart the bot process
-        # For now, we'll just log the event
+    async def restart_bot(self, interaction: discord.Interaction):
+        """Restart the bot process, handing in-flight state to the new process"""
         import logging
         logger = logging.getLogger('trpg_bot')
         logger.info("Restart command received")
-        # await self.bot.close()
+        try:
+            await self.bot.restart()
+        except Exception as e:
+            logger.error(f"Restart failed: {e}")
+            await interaction.followup.send(f"重新啟動失敗：{e}", ephemeral=True)
+
+    async def restore_backup(self, interaction: discord.Interaction):
+        """Restore the chosen backup generation, then restart"""
+        import logging
+        logger = logging.getLogger('trpg_bot')
+        logger.info(f"Restore of backup {self.argument} confirmed")
+        try:
+            await self.bot.restore_backup(self.argument)
+        except Exception as e:
+            logger.error(f"Restore failed: {e}")
+            await interaction.followup.send(f"還原失敗：{e}", ephemeral=True)
 
     async def shutdown_bot(self):
         """Shutdown the bot (in a real implementation, this would shut down the process)"""
@@ -62,27 +114,52 @@ class AdminAction(discord.app_commands.Choice[str]):
     dev_add = discord.app_commands.Choice(name="dev-add", value="dev-add")
     dev_remove = discord.app_commands.Choice(name="dev-remove", value="dev-remove")
     dev_list = discord.app_commands.Choice(name="dev-list", value="dev-list")
+    sync = discord.app_commands.Choice(name="sync", value="sync")
+    stats = discord.app_commands.Choice(name="stats", value="stats")
+    watchdog = discord.app_commands.Choice(name="watchdog", value="watchdog")
+    heap = discord.app_commands.Choice(name="heap", value="heap")
+    backup = discord.app_commands.Choice(name="backup", value="backup")
 
 # Admin commands
 class AdminCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Confirmation views still waiting for a click, keyed by message id
+        self.open_views: "weakref.WeakValueDictionary[int, AdminConfirmView]" = weakref.WeakValueDictionary()
+        self.heap_profiler = HeapProfiler()
+        bot.handoff.register('admin_views', self.dump_views, self.load_views)
+
+    def dump_views(self) -> List[Dict[str, Any]]:
+        return [view.to_state() for view in list(self.open_views.values()) if not view.is_finished()]
+
+    def load_views(self, states: List[Dict[str, Any]]):
+        for state in states:
+            view = AdminConfirmView.from_state(self.bot, state)
+            if view:
+                self.open_views[view.message_id] = view
 
     @discord.app_commands.command(name="admin", description="管理指令")
     @discord.app_commands.describe(
-        action="操作類型 (restart, shutdown, dev-add, dev-remove, dev-list)",
-        user="要操作的用戶 (dev-add 和 dev-remove 時必須)"
+        action="操作類型 (restart, shutdown, dev-add, dev-remove, dev-list, sync, stats, watchdog, heap, backup)",
+        user="要操作的用戶 (dev-add 和 dev-remove 時必須)",
+        argument="附加參數 (watchdog: on, off, dump；heap: start [層數], stop, snapshot <名稱>, list, top <名稱>, diff <舊> <新>, objects；backup: now, list, restore <名稱>)"
     )
     @discord.app_commands.choices(action=[
         discord.app_commands.Choice(name="restart", value="restart"),
         discord.app_commands.Choice(name="shutdown", value="shutdown"),
         discord.app_commands.Choice(name="dev-add", value="dev-add"),
         discord.app_commands.Choice(name="dev-remove", value="dev-remove"),
-        discord.app_commands.Choice(name="dev-list", value="dev-list")
+        discord.app_commands.Choice(name="dev-list", value="dev-list"),
+        discord.app_commands.Choice(name="sync", value="sync"),
+        discord.app_commands.Choice(name="stats", value="stats"),
+        discord.app_commands.Choice(name="watchdog", value="watchdog"),
+        discord.app_commands.Choice(name="heap", value="heap"),
+        discord.app_commands.Choice(name="backup", value="backup")
     ])
     async def admin(self, interaction: discord.Interaction, 
                     action: discord.app_commands.Choice[str],
-                    user: Optional[discord.User] = None):
+                    user: Optional[discord.User] = None,
+                    argument: Optional[str] = None):
         """管理指令"""
         # Check if user is a developer
         if not self.bot.config_manager.is_developer(interaction.user.id):
@@ -90,9 +167,39 @@ class AdminCommands(commands.Cog):
             return
         
         # Validate action
-        valid_actions = ["restart", "shutdown", "dev-add", "dev-remove", "dev-list"]
+        valid_actions = ["restart", "shutdown", "dev-add", "dev-remove", "dev-list", "sync", "stats", "watchdog", "heap", "backup"]
         if action.value not in valid_actions:
-            await interaction.response.send_message("操作必須是 'restart', 'shutdown', 'dev-add', 'dev-remove', 'dev-list' 之一", ephemeral=True)
+            await interaction.response.send_message("操作必須是 'restart', 'shutdown', 'dev-add', 'dev-remove', 'dev-list', 'sync', 'stats', 'watchdog', 'heap', 'backup' 之一", ephemeral=True)
+            return
+        
+        if action.value == "sync":
+            # Force a sync even if the stored command tree hash matches
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            try:
+                await self.bot.sync_command_tree(force=True)
+            except Exception as e:
+                # Replace the "thinking" state with an error, then let the tree's error handler log it
+                await interaction.followup.send(f"同步斜線指令失敗：{e}", ephemeral=True)
+                raise
+            await interaction.followup.send("已強制同步斜線指令", ephemeral=True)
+            self.bot.global_stream.publish("admin", f"{interaction.user.mention} 強制同步斜線指令")
+            return
+        
+        if action.value == "stats":
+            # Built from in-memory counters only, so it answers without deferring
+            await interaction.response.send_message(embed=build_stats_embed(self.bot), ephemeral=True)
+            return
+        
+        if action.value == "watchdog":
+            await self.handle_watchdog(interaction, (argument or "dump").lower())
+            return
+        
+        if action.value == "heap":
+            await self.handle_heap(interaction, (argument or "").split() or ["objects"])
+            return
+        
+        if action.value == "backup":
+            await self.handle_backup(interaction, (argument or "").split() or ["list"])
             return
         
         if action.value == "dev-list":
@@ -113,16 +220,147 @@ class AdminCommands(commands.Cog):
         if action.value == "dev-add":
             if self.bot.config_manager.add_developer(user.id):
                 await interaction.response.send_message(f"用戶 {user.mention} 已添加到開發者列表")
+                self.bot.global_stream.publish("admin", f"{interaction.user.mention} 將 {user.mention} 加入開發者列表")
             else:
                 await interaction.response.send_message(f"用戶 {user.mention} 已經是開發者")
         
         elif action.value == "dev-remove":
             if self.bot.config_manager.remove_developer(user.id):
                 await interaction.response.send_message(f"用戶 {user.mention} 已從開發者列表移除")
+                self.bot.global_stream.publish("admin", f"{interaction.user.mention} 將 {user.mention} 移出開發者列表")
             else:
                 await interaction.response.send_message(f"用戶 {user.mention} 不在開發者列表中")
         
         elif action.value in ["restart", "shutdown"]:
+            if action.value == "restart":
+                try:
+                    self.bot.check_restart_config()
+                except ValueError as e:
+                    await interaction.response.send_message(f"無法重新啟動：{e}", ephemeral=True)
+                    return
             # Confirmation view for dangerous operations
             view = AdminConfirmView(self.bot, action.value, interaction.user)
-            await interaction.response.send_message(f"確認執行{action.value}操作？", view=view, ephemeral=True)
\ No newline at end of file
+            await interaction.response.send_message(f"確認執行{action.value}操作？", view=view, ephemeral=True)
+            view.message_id = (await interaction.original_response()).id
+            self.open_views[view.message_id] = view
+
+    async def handle_watchdog(self, interaction: discord.Interaction, argument: str):
+        """Start or stop the event-loop watchdog, or send its recorded stalls"""
+        watchdog = self.bot.watchdog
+        if argument == "on":
+            watchdog.start()
+            await interaction.response.send_message(
+                f"事件迴圈監視已啟動（門檻 {watchdog.threshold * 1000:.0f} ms）", ephemeral=True
+            )
+        elif argument == "off":
+            watchdog.stop()
+            await interaction.response.send_message("事件迴圈監視已停止，已記錄的資料仍可匯出", ephemeral=True)
+        elif argument == "dump":
+            if not watchdog.records:
+                state = "執行中" if watchdog.running else "未啟動"
+                await interaction.response.send_message(f"事件迴圈監視{state}，尚無阻塞紀錄", ephemeral=True)
+                return
+            report = discord.File(io.BytesIO(watchdog.dump().encode('utf-8')), filename="watchdog.txt")
+            await interaction.response.send_message(
+                f"最近 {len(watchdog.records)} 次事件迴圈阻塞", file=report, ephemeral=True
+            )
+        else:
+            await interaction.response.send_message("watchdog 參數必須是 'on', 'off', 'dump' 之一", ephemeral=True)
+
+    async def handle_heap(self, interaction: discord.Interaction, args: List[str]):
+        """tracemalloc control, named snapshots and diffs; reports are sent as attachments"""
+        profiler = self.heap_profiler
+        command = args[0].lower()
+        if command == "start":
+            frames = int(args[1]) if len(args) > 1 and args[1].isdigit() else 1
+            if len(args) > 1 and not (args[1].isdigit() and 1 <= frames <= MAX_TRACE_FRAMES):
+                await interaction.response.send_message(
+                    f"堆疊層數必須是 1 到 {MAX_TRACE_FRAMES} 之間的整數，例如 `/admin heap start 10`", ephemeral=True
+                )
+                return
+            profiler.start(frames)
+            await interaction.response.send_message(f"tracemalloc 已啟動（{frames} 層堆疊）", ephemeral=True)
+            return
+        if command == "stop":
+            profiler.stop()
+            await interaction.response.send_message("tracemalloc 已停止，既有快照仍可比較", ephemeral=True)
+            return
+        if command == "list":
+            listing = "\n".join(profiler.list_snapshots()) or "尚無快照"
+            state = "追蹤中" if profiler.tracing else "未追蹤"
+            await interaction.response.send_message(f"tracemalloc {state}\n```\n{listing}\n```", ephemeral=True)
+            return
+        
+        # Snapshots, diffs and object scans walk the whole heap, so answer after deferring
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            if command == "snapshot" and len(args) == 2:
+                snapshot = await asyncio.to_thread(profiler.take_snapshot, args[1])
+                await interaction.followup.send(f"已建立快照 {args[1]}（{len(snapshot.traces)} 筆配置）", ephemeral=True)
+                return
+            if command == "top" and len(args) == 2:
+                report, filename = await asyncio.to_thread(profiler.top, args[1]), f"heap-{args[1]}.txt"
+            elif command == "diff" and len(args) == 3:
+                report, filename = await asyncio.to_thread(profiler.diff, args[1], args[2]), f"heap-{args[1]}-{args[2]}.txt"
+            elif command == "objects":
+                report = await asyncio.to_thread(object_counts)
+                report += (
+                    f"\nConfigManager.guilds: {len(self.bot.config_manager.guilds)} resident / "
+                    f"{self.bot.config_manager.configured_count()} configured\n"
+                    f"persistent views: {len(self.bot.persistent_views)}\n"
+                    f"open admin confirmations: {len(self.open_views)}\n"
+                )
+                filename = "objects.txt"
+            else:
+                await interaction.followup.send(
+                    "heap 參數必須是 start [層數], stop, snapshot <名稱>, list, top <名稱>, diff <舊> <新>, objects 之一",
+                    ephemeral=True
+                )
+                return
+        except (KeyError, RuntimeError) as e:
+            await interaction.followup.send(str(e.args[0]), ephemeral=True)
+            return
+        await interaction.followup.send(file=discord.File(io.BytesIO(report.encode('utf-8')), filename=filename), ephemeral=True)
+
+    async def handle_backup(self, interaction: discord.Interaction, args: List[str]):
+        """Take or list backup generations, or validate one and ask before restoring it"""
+        backups = self.bot.backups
+        command = args[0].lower()
+        if command == "list":
+            lines = [line for line in map(backups.describe, backups.list_backups()) if line]
+            listing = "\n".join(lines) or "尚無備份"
+            await interaction.response.send_message(
+                f"備份目錄 `{backups.backup_dir}`（保留 {backups.keep} 份）\n```\n{listing}\n```", ephemeral=True
+            )
+            return
+        if command not in ["now", "restore"] or (command == "restore" and len(args) != 2):
+            await interaction.response.send_message("backup 參數必須是 now, list, restore <名稱> 之一", ephemeral=True)
+            return
+        
+        # Copying and validating read whole files, so answer after deferring
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        if command == "now":
+            try:
+                name = await self.bot.create_backup()
+            except Exception as e:
+                await interaction.followup.send(f"備份失敗：{e}", ephemeral=True)
+                return
+            await interaction.followup.send(f"已建立備份 {name}", ephemeral=True)
+            self.bot.global_stream.publish("admin", f"{interaction.user.mention} 建立備份 {name}")
+            return
+        
+        try:
+            problems = await asyncio.to_thread(backups.validate, args[1])
+        except KeyError as e:
+            await interaction.followup.send(str(e.args[0]), ephemeral=True)
+            return
+        if problems:
+            await interaction.followup.send(f"備份 {args[1]} 驗證失敗：\n" + "\n".join(problems), ephemeral=True)
+            return
+        view = AdminConfirmView(self.bot, "restore", interaction.user, argument=args[1])
+        message = await interaction.followup.send(
+            f"備份 {args[1]} 驗證通過。確認還原？目前狀態會先另存一份備份，還原後機器人將重新啟動。",
+            view=view, ephemeral=True, wait=True
+        )
+        view.message_id = message.id
+        self.open_views[view.message_id] = view
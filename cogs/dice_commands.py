@@ -1,14 +1,39 @@
 import discord
+import time
 from discord.ext import commands
 from core.dice_roller import DiceRoller
-from core.coc_roller import CoCRoller
-from typing import List, Tuple
+from core.coc_roller import CoCRoller, MAX_BONUS_DICE
+from core.group_roll import GroupEntry, parse_group_entries
+from utils.metrics import metrics
+from utils.rate_limit import charge_command, estimate_cost, roll_cost
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+# Users whose last /coc check is remembered for pushing
+MAX_TRACKED_CHECKS = 4096
+# Text users whose last throttled roll got a ⏳ reaction
+MAX_THROTTLE_NOTICES = 4096
+# Discord's limit on plain-text message content
+MAX_REPLY_LENGTH = 2000
+
+
+def fit_reply(text: str, suffix: str = "") -> str:
+    """Clip a plain-text reply to what Discord accepts, always keeping the suffix"""
+    limit = MAX_REPLY_LENGTH - len(suffix)
+    if len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return text + suffix
 
 
 # Dice commands
 class DiceCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # (guild_id, user_id) -> last single /coc check, for push
+        self.last_checks: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+        # (guild_id, user_id) -> monotonic time until which throttled text rolls stay silent
+        self.throttle_notices: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
 
     @discord.app_commands.command(name="roll", description="D&D 骰子指令 - 擲骰子")
     async def roll(self, interaction: discord.Interaction, expression: str):
@@ -20,8 +45,26 @@ class DiceCommands(commands.Cog):
         config = self.bot.config_manager.get_guild_config(interaction.guild.id)
         rules = config.dnd_rules
         
+        if expression.strip().lower().startswith('verify'):
+            await self.verify_roll(interaction, expression.strip()[len('verify'):].strip())
+            return
+        
         try:
-            results = DiceRoller.roll_multiple_dice(expression, rules)
+            if expression.strip().startswith('@'):
+                # Saved macros are rolled from their compiled form, skipping parsing
+                macro = self.bot.macros.get_macro(interaction.guild.id, expression.strip()[1:], rules)
+                if macro is None:
+                    raise ValueError(f"找不到巨集 {expression.strip()}")
+                if macro.compiled is None:
+                    raise ValueError(f"巨集 @{macro.name} 不符合目前的擲骰規則：{macro.error}")
+                compiled = macro.compiled
+                expression = f"@{macro.name} ({macro.expression})"
+            else:
+                compiled = DiceRoller.compile_expression(expression, rules)
+            
+            # In audit mode the faces come from the guild seed and the next roll counter
+            audit_id, rng = self.bot.roll_audit.begin_roll(interaction.guild.id) if config.roll_audit else (None, None)
+            results = DiceRoller.roll_compiled(compiled, rng)
             
             if len(results) == 1:
                 result = results[0]
@@ -69,8 +112,15 @@ class DiceCommands(commands.Cog):
                     color=0x7289DA
                 )
             
+            if audit_id:
+                embed.set_footer(text=f"稽核編號 {audit_id} · /roll verify {audit_id}")
+                # Stored before replying so an id that reaches the channel can always be verified
+                self.bot.roll_audit.record(audit_id, interaction.guild.id, interaction.user.id, expression, compiled)
             await interaction.response.send_message(embed=embed)
             
+            totals = ", ".join(str(result['total']) for result in results)
+            self.record_event(interaction, "roll", f"/roll {expression} → {totals}")
+            
         except ValueError as e:
             embed = discord.Embed(
                 title="D&D 擲骰錯誤",
@@ -81,19 +131,60 @@ class DiceCommands(commands.Cog):
 
     @discord.app_commands.command(name="coc", description="CoC 7e 指令")
     @discord.app_commands.describe(
-        skill="技能值 (1-100)",
-        times="擲骰次數 (1-10) [可選]"
+        skill="技能值 (1-100) 或角色卡上的技能名稱",
+        times="擲骰次數 (1-10) [可選]",
+        bonus="獎勵骰 (正數) 或懲罰骰 (負數)，-2 到 2 [可選]",
+        opponent="對抗擲骰：對手的技能值 (1-100) [可選]",
+        push="孤注一擲：重擲上一次失敗的同一技能檢定 [可選]"
     )
-    async def coc(self, interaction: discord.Interaction, skill: discord.app_commands.Range[int, 1, 100], times: discord.app_commands.Range[int, 1, 10] = 1):
+    async def coc(self, interaction: discord.Interaction, skill: str,
+                  times: discord.app_commands.Range[int, 1, 10] = 1,
+                  bonus: discord.app_commands.Range[int, -MAX_BONUS_DICE, MAX_BONUS_DICE] = 0,
+                  opponent: Optional[discord.app_commands.Range[int, 1, 100]] = None,
+                  push: bool = False):
         """CoC 7e 指令"""
         if not interaction.guild:
             await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
             return
 
+        try:
+            skill_value, skill_label = self.resolve_skill(interaction.guild.id, interaction.user.id, skill)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        if (push or opponent is not None) and times > 1:
+            await interaction.response.send_message("對抗擲骰與孤注一擲只能擲一次", ephemeral=True)
+            return
+        if push and opponent is not None:
+            await interaction.response.send_message("對抗擲骰不能孤注一擲", ephemeral=True)
+            return
+
+        check_key = (interaction.guild.id, interaction.user.id)
+        if push:
+            # Only a failed, not yet pushed check of the same skill may be pushed
+            last = self.last_checks.get(check_key)
+            if last is None or last['skill'] != skill_label or last['success_level'] != 5 or last['pushed']:
+                await interaction.response.send_message(
+                    f"只能對上一次失敗且尚未孤注一擲的 {skill_label} 檢定孤注一擲", ephemeral=True
+                )
+                return
+
         config = self.bot.config_manager.get_guild_config(interaction.guild.id)
         rules = config.coc_rules
         
-        results = CoCRoller.roll_coc_multi(skill, times, rules)
+        results = CoCRoller.roll_coc_multi(skill_value, times, rules, bonus)
+        opponent_result = CoCRoller.roll_coc(opponent, rules) if opponent is not None else None
+        
+        # Remember single unopposed checks so a failure can be pushed next
+        self.last_checks.pop(check_key, None)
+        if times == 1 and opponent_result is None:
+            self.last_checks[check_key] = {
+                'skill': skill_label,
+                'success_level': results[0]['success_level'],
+                'pushed': push
+            }
+            if len(self.last_checks) > MAX_TRACKED_CHECKS:
+                self.last_checks.popitem(last=False)
         
         # Get author and channel for critical event logging
         author = interaction.user
@@ -120,13 +211,32 @@ class DiceCommands(commands.Cog):
                     f"{author.mention} 在 `/coc {skill}` {prefix}擲出 {roll_values}，觸發大失敗（頻道：{channel.mention}）"
                 ))
 
-        if len(results) == 1:
+        bonus_text = ""
+        if bonus:
+            bonus_text = f"{'獎勵骰' if bonus > 0 else '懲罰骰'} {abs(bonus)} 顆\n"
+
+        if opponent_result is not None:
+            result = results[0]
+            winner = CoCRoller.resolve_opposed(result, opponent_result)
+            outcome = {1: f"🏆 {author.display_name} 勝出", -1: "🏆 對手勝出", 0: "⚖️ 平手（無人勝出）"}[winner]
+            description = (
+                f"{bonus_text}"
+                f"**{author.display_name}** ({skill_label}): {self.format_coc_roll(result)} → "
+                f"{CoCRoller.format_success_level(result['success_level'])}\n"
+                f"**對手** ({opponent}): {opponent_result['roll']} → "
+                f"{CoCRoller.format_success_level(opponent_result['success_level'])}\n"
+                f"{outcome}"
+            )
+            embed = discord.Embed(title="CoC 7e 對抗擲骰結果", description=description, color=0x7289DA)
+            embed.set_footer(text=CoCRoller.format_chances(CoCRoller.success_chances(skill_value, rules, bonus)))
+        elif len(results) == 1:
             result = results[0]
             success_text = CoCRoller.format_success_level(result['success_level'])
             
             description = (
-                f"技能值: {skill}\n"
-                f"骰子結果: {result['roll']}\n"
+                f"技能值: {skill_label}\n"
+                f"{bonus_text}"
+                f"骰子結果: {self.format_coc_roll(result)}\n"
                 f"判定結果: {success_text}"
             )
             
@@ -134,40 +244,469 @@ class DiceCommands(commands.Cog):
                 description += " ✨ 大成功!"
             elif result['is_critical_fail']:
                 description += " 💥 大失敗!"
+            if push and result['success_level'] > 4:
+                description += "\n⚠️ 孤注一擲失敗，由守密人決定後果"
             
             embed = discord.Embed(
-                title="CoC 7e 擲骰結果",
+                title="CoC 7e 孤注一擲結果" if push else "CoC 7e 擲骰結果",
                 description=description,
                 color=0x7289DA
             )
+            embed.set_footer(text=CoCRoller.format_chances(CoCRoller.success_chances(skill_value, rules, bonus)))
         else:
-            description = f"連續擲骰次數: {len(results)}\n技能值: {skill}\n"
+            description = f"連續擲骰次數: {len(results)}\n技能值: {skill_label}\n{bonus_text}"
             for i, result in enumerate(results, 1):
                 success_text = CoCRoller.format_success_level(result['success_level'])
                 crit = " ✨" if result['is_critical_success'] else " 💥" if result['is_critical_fail'] else ""
-                status = " ✅" if result['comparison_result'] else " ❌" if result['comparison_result'] is False else ""
-                description += f"{i}. {result['roll']} → {success_text}{crit}{status}\n"
+                status = " ✅" if result['success_level'] <= 4 else " ❌"
+                description += f"{i}. {self.format_coc_roll(result)} → {success_text}{crit}{status}\n"
             
             embed = discord.Embed(
                 title="CoC 7e 連續擲骰結果",
                 description=description,
                 color=0x7289DA
             )
+            embed.set_footer(text=CoCRoller.format_chances(CoCRoller.success_chances(skill_value, rules, bonus)))
         
         await interaction.response.send_message(embed=embed)
         
+        outcomes = ", ".join(
+            f"{result['roll']} {CoCRoller.format_success_level(result['success_level'])}" for result in results
+        )
+        if opponent_result is not None:
+            outcomes += f" vs {opponent}: {opponent_result['roll']} {CoCRoller.format_success_level(opponent_result['success_level'])}"
+        self.record_event(interaction, "coc", f"/coc {skill}{' (push)' if push else ''} → {outcomes}")
+        
         # Log critical events if in a guild
         if interaction.guild:
             await self.log_critical_events(interaction, interaction.guild.id, crit_events)
 
+    @staticmethod
+    def format_coc_roll(result) -> str:
+        """The d100 result, with every tens die when bonus or penalty dice were rolled"""
+        if not result.get('bonus'):
+            return str(result['roll'])
+        tens = ", ".join(f"{ten}0" for ten in result['tens'])
+        return f"{result['roll']}（十位 {tens}；個位 {result['units']}）"
+
+    @discord.app_commands.command(name="roll-group", description="團體擲骰 - 一次擲出所有參與者")
+    @discord.app_commands.describe(
+        entries="參與者與骰子表達式，例如「Alice d20+3, @Bob d20+1」",
+        party="使用已儲存的隊伍",
+        save="將此次的參與者儲存為隊伍",
+        order="排序方式 (initiative: 總和由高到低，listed: 依輸入順序)"
+    )
+    @discord.app_commands.choices(order=[
+        discord.app_commands.Choice(name="initiative", value="initiative"),
+        discord.app_commands.Choice(name="listed", value="listed")
+    ])
+    async def roll_group(self, interaction: discord.Interaction,
+                         entries: Optional[str] = None,
+                         party: Optional[str] = None,
+                         save: Optional[str] = None,
+                         order: Optional[discord.app_commands.Choice[str]] = None):
+        """團體擲骰 - 一次擲出所有參與者"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+        
+        rules = self.bot.config_manager.get_guild_config(interaction.guild.id).dnd_rules
+        try:
+            group = self.load_group(interaction.guild.id, entries, party, save)
+            for entry in group:
+                if not entry.argument:
+                    raise ValueError(f"{entry.label} 缺少骰子表達式")
+            results = DiceRoller.roll_batch([entry.argument for entry in group], rules)
+        except ValueError as e:
+            embed = discord.Embed(
+                title="團體擲骰錯誤",
+                description=f"錯誤: {str(e)}",
+                color=0xFF0000
+            )
+            await interaction.response.send_message(embed=embed)
+            return
+        
+        ranked = list(zip(group, results))
+        if not order or order.value == "initiative":
+            # Stable sort keeps the listed order between equal totals
+            ranked.sort(key=lambda pair: pair[1]['total'], reverse=True)
+        
+        description = ""
+        for i, (entry, result) in enumerate(ranked, 1):
+            rolls_str = " + ".join(map(str, result['rolls']))
+            modifier = f" {result['modifier']:+d}" if result['modifier'] else ""
+            crit = " ✨" if result['is_critical_success'] else " 💥" if result['is_critical_fail'] else ""
+            comparison = "" if result['comparison_result'] is None else " ✅" if result['comparison_result'] else " ❌"
+            description += f"{i}. **{entry.label}** `{entry.argument}` → ({rolls_str}){modifier} = **{result['total']}**{crit}{comparison}\n"
+        
+        embed = discord.Embed(
+            title="團體擲骰結果" + ("（先攻順序）" if not order or order.value == "initiative" else ""),
+            description=description,
+            color=0x7289DA
+        )
+        await interaction.response.send_message(embed=embed)
+        
+        totals = ", ".join(f"{entry.label} {result['total']}" for entry, result in ranked)
+        self.record_event(interaction, "roll", f"/roll-group → {totals}")
+        await self.log_critical_events(interaction, interaction.guild.id, self.group_crit_events(
+            interaction, "/roll-group",
+            [entry.label for entry, result in ranked if result['is_critical_success']],
+            [entry.label for entry, result in ranked if result['is_critical_fail']]
+        ))
+
+    @discord.app_commands.command(name="coc-group", description="CoC 7e 團體擲骰 - 一次判定所有參與者")
+    @discord.app_commands.describe(
+        entries="參與者與技能值或技能名稱，例如「Alice 60, @Bob 偵查, @Carol」",
+        skill="未指定技能的參與者使用此技能值或技能名稱",
+        party="使用已儲存的隊伍",
+        save="將此次的參與者儲存為隊伍",
+        order="排序方式 (opposed: 依成功等級排序，listed: 依輸入順序)"
+    )
+    @discord.app_commands.choices(order=[
+        discord.app_commands.Choice(name="opposed", value="opposed"),
+        discord.app_commands.Choice(name="listed", value="listed")
+    ])
+    async def coc_group(self, interaction: discord.Interaction,
+                        entries: Optional[str] = None,
+                        skill: Optional[str] = None,
+                        party: Optional[str] = None,
+                        save: Optional[str] = None,
+                        order: Optional[discord.app_commands.Choice[str]] = None):
+        """CoC 7e 團體擲骰 - 一次判定所有參與者"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+        
+        rules = self.bot.config_manager.get_guild_config(interaction.guild.id).coc_rules
+        try:
+            group = self.load_group(interaction.guild.id, entries, party, save)
+            resolved = []
+            for entry in group:
+                argument = entry.argument or skill
+                if not argument:
+                    raise ValueError(f"{entry.label} 缺少技能值或技能名稱")
+                try:
+                    resolved.append(self.resolve_skill(interaction.guild.id, entry.user_id, argument))
+                except ValueError as e:
+                    raise ValueError(f"{entry.label}：{e}")
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        
+        results = CoCRoller.roll_coc_batch([value for value, _ in resolved], rules)
+        ranked = [(entry, label, result) for entry, (_, label), result in zip(group, resolved, results)]
+        if not order or order.value == "opposed":
+            # Opposed rolls: better success level wins, then the higher skill value
+            ranked.sort(key=lambda item: (item[2]['success_level'], -item[2]['skill_value']))
+        
+        description = ""
+        for i, (entry, label, result) in enumerate(ranked, 1):
+            success_text = CoCRoller.format_success_level(result['success_level'])
+            crit = " ✨" if result['is_critical_success'] else " 💥" if result['is_critical_fail'] else ""
+            status = " ✅" if result['success_level'] <= 4 else " ❌"
+            description += f"{i}. **{entry.label}** {label} → {result['roll']} {success_text}{crit}{status}\n"
+        
+        embed = discord.Embed(
+            title="CoC 7e 團體擲骰結果" + ("（對抗排序）" if not order or order.value == "opposed" else ""),
+            description=description,
+            color=0x7289DA
+        )
+        await interaction.response.send_message(embed=embed)
+        
+        outcomes = ", ".join(
+            f"{entry.label} {result['roll']} {CoCRoller.format_success_level(result['success_level'])}"
+            for entry, _, result in ranked
+        )
+        self.record_event(interaction, "coc", f"/coc-group → {outcomes}")
+        await self.log_critical_events(interaction, interaction.guild.id, self.group_crit_events(
+            interaction, "/coc-group",
+            [entry.label for entry, _, result in ranked if result['is_critical_success']],
+            [entry.label for entry, _, result in ranked if result['is_critical_fail']]
+        ))
+
+    @discord.app_commands.command(name="roll-audit", description="擲骰稽核模式開關")
+    @discord.app_commands.describe(
+        state="on 或 off"
+    )
+    @discord.app_commands.choices(state=[
+        discord.app_commands.Choice(name="on", value="on"),
+        discord.app_commands.Choice(name="off", value="off")
+    ])
+    async def roll_audit(self, interaction: discord.Interaction, state: discord.app_commands.Choice[str]):
+        """擲骰稽核模式開關"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+        
+        config = self.bot.config_manager.edit_guild_config(interaction.guild.id)
+        config.roll_audit = state.value == "on"
+        self.bot.config_manager.set_guild_config(interaction.guild.id, config)
+        if config.roll_audit:
+            commitment = self.bot.roll_audit.commitment(interaction.guild.id)
+            await interaction.response.send_message(
+                f"擲骰稽核已開啟，`/roll` 結果會附上稽核編號，可用 `/roll verify <編號>` 重現\n"
+                f"種子承諾：`{commitment}`（驗證結果會顯示相同的承諾值）"
+            )
+        else:
+            await interaction.response.send_message("擲骰稽核已關閉")
+
+    async def verify_roll(self, interaction: discord.Interaction, audit_id: str):
+        """Recompute an audited /roll from its seed and counter"""
+        if not audit_id:
+            await interaction.response.send_message("請提供稽核編號，例如 `/roll verify 1-42`", ephemeral=True)
+            return
+        try:
+            record = self.bot.roll_audit.verify(interaction.guild.id, audit_id)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        if record is None:
+            await interaction.response.send_message(f"找不到稽核編號 `{audit_id}`", ephemeral=True)
+            return
+        
+        lines = []
+        for result in record['results']:
+            rolls_str = " + ".join(map(str, result['rolls']))
+            if result['modifier'] != 0:
+                lines.append(f"({rolls_str}) + {result['modifier']} = {result['total']}")
+            else:
+                lines.append(f"{rolls_str} = {result['total']}")
+        embed = discord.Embed(
+            title=f"擲骰稽核 {record['audit_id']}",
+            description=(
+                f"**擲骰者**: <@{record['user_id']}>\n"
+                f"**時間**: <t:{int(record['created_at'])}:f>\n"
+                f"**算式**: {record['expression']}\n"
+                f"**重現結果**:\n" + "\n".join(lines)
+            ),
+            color=0x7289DA
+        )
+        embed.set_footer(text=f"種子承諾 {record['commitment']}")
+        await interaction.response.send_message(embed=embed)
+
+    async def quick_roll(self, message: discord.Message):
+        """
+        Text fast path for "!r <expression>" and "!coc <skill> [+N|-N]": rolls through the
+        compiled dice path and answers with a single plain-text reply, skipping the
+        interaction round-trip and embed rendering of the slash commands.
+        """
+        started_at = time.perf_counter()
+        command_name, _, argument = message.content.partition(' ')
+        argument = argument.strip()
+        if not argument or message.guild is None:
+            return
+        self.bot.watchdog.track(command_name)
+        
+        guild_id = message.guild.id
+        config = self.bot.config_manager.get_guild_config(guild_id)
+        if command_name == '!r':
+            cost = roll_cost(argument, self.bot.macros, guild_id, config.dnd_rules)
+        else:
+            cost = estimate_cost('coc', SimpleNamespace(expression=argument))
+        retry_after = charge_command(self.bot.rate_limiter, config.rate_limit, guild_id, message.author.id, cost)
+        if retry_after:
+            metrics.inc('trpg_rate_limited_total', command_name)
+            await self.notify_throttled(message, retry_after)
+            return
+        
+        try:
+            if command_name == '!r':
+                reply, crit_events, journal = self.quick_dice(message, config, argument)
+            else:
+                reply, crit_events, journal = self.quick_coc(message, config, argument)
+        except ValueError as e:
+            await message.reply(fit_reply(f"⚠️ {e}"), mention_author=False)
+            metrics.observe('trpg_command_duration_seconds', command_name, time.perf_counter() - started_at)
+            return
+        
+        await message.reply(fit_reply(reply), mention_author=False)
+        metrics.observe('trpg_command_duration_seconds', command_name, time.perf_counter() - started_at)
+        self.journal_event(guild_id, message.channel.id, message.author, journal[0], journal[1])
+        await self.post_critical_events(guild_id, message.channel.id, message.author, crit_events)
+
+    async def notify_throttled(self, message: discord.Message, retry_after: float):
+        """React with ⏳ to a throttled text roll, at most once per bucket window"""
+        now = time.monotonic()
+        key = (message.guild.id, message.author.id)
+        if self.throttle_notices.get(key, 0.0) > now:
+            return
+        self.throttle_notices.pop(key, None)
+        self.throttle_notices[key] = now + retry_after
+        if len(self.throttle_notices) > MAX_THROTTLE_NOTICES:
+            self.throttle_notices.popitem(last=False)
+        try:
+            await message.add_reaction("⏳")
+        except discord.HTTPException:
+            pass
+
+    def quick_dice(self, message: discord.Message, config, expression: str):
+        """Roll a "!r" expression or @macro; returns (reply, crit events, journal entry)"""
+        if expression.startswith('@'):
+            macro = self.bot.macros.get_macro(message.guild.id, expression[1:], config.dnd_rules)
+            if macro is None:
+                raise ValueError(f"找不到巨集 {expression}")
+            if macro.compiled is None:
+                raise ValueError(f"巨集 @{macro.name} 不符合目前的擲骰規則：{macro.error}")
+            compiled = macro.compiled
+            expression = f"@{macro.name} ({macro.expression})"
+        else:
+            compiled = DiceRoller.compile_expression(expression, config.dnd_rules)
+        
+        audit_id, rng = self.bot.roll_audit.begin_roll(message.guild.id) if config.roll_audit else (None, None)
+        results = DiceRoller.roll_compiled(compiled, rng)
+        if audit_id:
+            self.bot.roll_audit.record(audit_id, message.guild.id, message.author.id, expression, compiled)
+        
+        lines = []
+        summary = []
+        crit_events = []
+        for result in results:
+            rolls_str = " + ".join(map(str, result['rolls']))
+            line = f"({rolls_str}) + {result['modifier']}" if result['modifier'] else rolls_str
+            marks = ""
+            if result['is_critical_success']:
+                marks += " ✨"
+                crit_events.append(("success", f"{message.author.mention} 在 `!r {expression}` 擲出 {rolls_str}，觸發大成功（頻道：{message.channel.mention}）"))
+            elif result['is_critical_fail']:
+                marks += " 💥"
+                crit_events.append(("fail", f"{message.author.mention} 在 `!r {expression}` 擲出 {rolls_str}，觸發大失敗（頻道：{message.channel.mention}）"))
+            if result['comparison_result'] is not None:
+                marks += " ✅" if result['comparison_result'] else " ❌"
+            lines.append(f"{line} = **{result['total']}**{marks}")
+            summary.append(f"**{result['total']}**{marks}")
+        audit_line = f"\n`稽核 {audit_id}`" if audit_id else ""
+        reply = f"🎲 {expression}: " + ("\n".join(lines) if len(lines) == 1 else "\n" + "\n".join(lines)) + audit_line
+        if len(reply) > MAX_REPLY_LENGTH:
+            # Per-die detail does not fit in one message; keep only the totals
+            reply = fit_reply(f"🎲 {expression}: " + ", ".join(summary), "\n（骰子明細過長，僅顯示總和）" + audit_line)
+        totals = ", ".join(str(result['total']) for result in results)
+        return reply, crit_events, ("roll", f"!r {expression} → {totals}")
+
+    def quick_coc(self, message: discord.Message, config, argument: str):
+        """Resolve a "!coc" check; returns (reply, crit events, journal entry)"""
+        skill, bonus = argument, 0
+        parts = argument.rsplit(None, 1)
+        if len(parts) == 2 and parts[1][:1] in '+-' and parts[1][1:].isdigit():
+            skill, bonus = parts[0], int(parts[1])
+            if abs(bonus) > MAX_BONUS_DICE:
+                raise ValueError(f"獎勵骰/懲罰骰最多 {MAX_BONUS_DICE} 顆")
+        skill_value, skill_label = self.resolve_skill(message.guild.id, message.author.id, skill)
+        
+        result = CoCRoller.roll_coc(skill_value, config.coc_rules, bonus)
+        check_key = (message.guild.id, message.author.id)
+        self.last_checks.pop(check_key, None)
+        self.last_checks[check_key] = {'skill': skill_label, 'success_level': result['success_level'], 'pushed': False}
+        if len(self.last_checks) > MAX_TRACKED_CHECKS:
+            self.last_checks.popitem(last=False)
+        
+        success_text = CoCRoller.format_success_level(result['success_level'])
+        crit_events = []
+        if result['is_critical_success']:
+            crit_events.append(("success", f"{message.author.mention} 在 `!coc {argument}` 擲出 {result['roll']}，觸發大成功（頻道：{message.channel.mention}）"))
+        if result['is_critical_fail']:
+            crit_events.append(("fail", f"{message.author.mention} 在 `!coc {argument}` 擲出 {result['roll']}，觸發大失敗（頻道：{message.channel.mention}）"))
+        reply = f"🎲 {skill_label}: {self.format_coc_roll(result)} → **{success_text}**"
+        return reply, crit_events, ("coc", f"!coc {argument} → {result['roll']} {success_text}")
+
+    def load_group(self, guild_id: int, entries: Optional[str], party: Optional[str], save: Optional[str]) -> List[GroupEntry]:
+        """Participants from the entries option or a saved party; optionally save them"""
+        if save and not entries:
+            raise ValueError("儲存隊伍時請提供參與者列表")
+        if entries:
+            group = parse_group_entries(entries)
+            if save and not self.bot.character_sheets.save_party(guild_id, save, entries):
+                raise ValueError("無法儲存隊伍")
+            return group
+        if party:
+            text = self.bot.character_sheets.get_party(guild_id, party)
+            if text is None:
+                raise ValueError(f"找不到隊伍 `{party}`")
+            return parse_group_entries(text)
+        raise ValueError("請提供參與者列表或隊伍名稱")
+
+    def group_crit_events(self, interaction: discord.Interaction, command: str,
+                          successes: List[str], fails: List[str]) -> List[Tuple[str, str]]:
+        """One aggregated crit message per kind instead of one per participant"""
+        events = []
+        channel = interaction.channel.mention
+        if successes:
+            events.append(("success", f"{interaction.user.mention} 的 `{command}` 中 {'、'.join(successes)} 觸發大成功（頻道：{channel}）"))
+        if fails:
+            events.append(("fail", f"{interaction.user.mention} 的 `{command}` 中 {'、'.join(fails)} 觸發大失敗（頻道：{channel}）"))
+        return events
+
+    @roll.autocomplete('expression')
+    async def roll_expression_autocomplete(self, interaction: discord.Interaction, current: str) -> List[discord.app_commands.Choice[str]]:
+        """Suggest the guild's macros once the input starts with @"""
+        if not interaction.guild or not current.startswith('@'):
+            return []
+        rules = self.bot.config_manager.get_guild_config(interaction.guild.id).dnd_rules
+        query = current[1:].lower()
+        return [
+            discord.app_commands.Choice(name=f"@{macro.name} ({macro.expression})"[:100], value=f"@{macro.name}")
+            for macro in self.bot.macros.list_macros(interaction.guild.id, rules)
+            if query in macro.name.lower() and macro.compiled is not None
+        ][:25]
+
+    @coc.autocomplete('skill')
+    async def coc_skill_autocomplete(self, interaction: discord.Interaction, current: str) -> List[discord.app_commands.Choice[str]]:
+        """Suggest skills from the user's active character sheet"""
+        if not interaction.guild:
+            return []
+        sheet = self.bot.character_sheets.get_active_sheet(interaction.guild.id, interaction.user.id)
+        if sheet is None:
+            return []
+        return [
+            discord.app_commands.Choice(name=f"{name} ({value})"[:100], value=name[:100])
+            for name, value in sheet.matching(current)
+        ]
+
+    def resolve_skill(self, guild_id: int, user_id: Optional[int], skill: str) -> Tuple[int, str]:
+        """A numeric skill value, or the value of a named skill on the user's active sheet"""
+        skill = skill.strip()
+        if skill.isdigit():
+            value, label = int(skill), skill
+        elif user_id is None:
+            raise ValueError(f"技能 `{skill}` 需要以 @提及 指定玩家才能查詢角色卡")
+        else:
+            sheet = self.bot.character_sheets.get_active_sheet(guild_id, user_id)
+            if sheet is None:
+                raise ValueError("請輸入 1-100 的技能值，或先以 `/sheet import` 匯入角色卡")
+            found = sheet.lookup(skill)
+            if found is None:
+                raise ValueError(f"角色 {sheet.name} 沒有技能 `{skill}`")
+            name, value = found
+            label = f"{name} {value}（{sheet.name}）"
+        if not 1 <= value <= 100:
+            raise ValueError("技能值必須介於 1-100")
+        return value, label
+
+    def record_event(self, interaction: discord.Interaction, kind: str, content: str):
+        """Append an event to the journal used by /log-export"""
+        if not interaction.guild:
+            return
+        self.journal_event(interaction.guild.id, interaction.channel_id, interaction.user, kind, content)
+
+    def journal_event(self, guild_id: int, channel_id: Optional[int], user: discord.abc.User, kind: str, content: str):
+        self.bot.event_journal.record(guild_id, channel_id, user.id, user.display_name, kind, content)
+
     async def log_critical_events(self, interaction: discord.Interaction, guild_id: int, events: List[Tuple[str, str]]):
         """Log critical success/fail events to dedicated channels"""
+        await self.post_critical_events(guild_id, interaction.channel_id, interaction.user, events)
+
+    async def post_critical_events(self, guild_id: int, channel_id: Optional[int], user: discord.abc.User,
+                                   events: List[Tuple[str, str]]):
+        """Journal critical events, mirror them to the global stream and post them to the crit channels"""
         if not events:
             return
 
         config = self.bot.config_manager.get_guild_config(guild_id)
+        source_channel_id = channel_id
         
         for kind, content in events:
+            self.journal_event(guild_id, source_channel_id, user, f"crit_{kind}", content)
+            self.bot.global_stream.publish(f"crit_{kind}", content, guild_id)
+            
             channel_id = None
             title = ""
             colour = 0
@@ -182,7 +721,7 @@ class DiceCommands(commands.Cog):
                 colour = 0x8B0000  # DARK_RED
             
             if channel_id:
-                channel = interaction.client.get_channel(channel_id)
+                channel = self.bot.get_channel(channel_id)
                 if channel:
                     embed = discord.Embed(
                         title=title,
@@ -3,54 +3,80 @@ from discord.ext import commands
 import logging
 
 
+# (button label, custom_id, description) for each help topic; custom_ids must stay stable
+# so buttons on messages sent before a restart keep resolving to the persistent view
+HELP_TOPICS = [
+    ("D&D 擲骰", "help_roll",
+        "**/roll <骰子表達式>**\n支援 `2d6`、`d20+5`、`1d10>=15`、`+3 d6` 等格式，解析骰數、面數、修正值與比較條件。預設最多 50 次擲骰。\n**/roll @名稱**：擲出以 `/macro add <名稱> <表達式>` 儲存的巨集，`/macro list|delete` 管理巨集。\n**/roll-group <參與者列表>**：一次擲出所有參與者並依先攻排序，例如 `Alice d20+3, @Bob d20+1`。\n**/init <add|next|show|remove|end>**：頻道先攻追蹤；**/hp <名稱> <=12|-1d6>** 追蹤 HP。\n**!r <表達式>** / **!coc <技能> [+N|-N]**：文字快速擲骰，以一則簡短回覆顯示結果。\n**/roll-audit <on|off>**：開啟後 `/roll` 附上稽核編號，`/roll verify <編號>` 可重現該次結果。"),
+    ("CoC 擲骰", "help_coc",
+        "**/coc <技能值或技能名稱> [次數]**\n技能值 1-100，或輸入角色卡上的技能名稱，可設定 1-10 次連續擲骰。自動判斷普通/困難/極限成功、大成功（1）與大失敗（技能<50 時 96-100，否則 100）。\n`bonus` 設定獎勵骰（正數）或懲罰骰（負數，最多 2 顆），`opponent` 與對手技能值進行對抗擲骰，`push` 對上一次失敗的檢定孤注一擲；結果附上各成功等級的機率。\n**/san <名稱> <=50|-1d6|1/1d6>**：追蹤 SAN，`成功/失敗` 格式會進行理智檢定。\n**/coc-group <參與者列表> [技能]**：一次判定所有參與者並依成功等級排序。"),
+    ("技能指令", "help_skill",
+        "**技能指令**\n`/skill add <名稱> <類型> <等級> <效果>`：新增或更新技能紀錄。\n`/skill show <名稱>`：支援模糊搜尋技能名稱，查詢技能。\n`/skill delete <名稱>`：刪除此伺服器中的技能。\n`/sheet import <角色名> <技能列表>`：匯入角色卡，`/sheet show|list|use|delete` 管理角色。"),
+    ("日誌指令", "help_logs",
+        "**日誌相關指令**\n`/log-stream on <頻道>`：啟用串流並綁定頻道。\n`/log-stream off`：關閉串流。\n`/log-stream-mode <live|batch>`：切換即時或批次。\n`/log-export <開始> <結束> [格式]`：匯出時間範圍內的紀錄檔。\n`/crit <success|fail> [頻道]`：設定大成功/大失敗紀錄頻道，留空則清除設定。"),
+    ("管理指令", "help_admin",
+        "**管理指令（需開發者）**\n`/admin restart`：確認後重新啟動機器人。\n`/admin shutdown`：確認後關閉機器人。\n`/admin dev-add <用戶>` / `/admin dev-remove <用戶>`：維護開發者名單。\n`/admin dev-list`：列出所有已註冊開發者。\n`/admin sync`：強制重新同步斜線指令。\n`/admin stats`：顯示執行狀態與效能統計。\n`/admin watchdog [on|off|dump]`：控制事件迴圈監視器或匯出阻塞紀錄。\n`/admin heap <start|stop|snapshot|list|top|diff|objects>`：記憶體快照與比較。\n`/admin backup [now|list|restore <名稱>]`：線上備份、列出與驗證後還原。"),
+]
+
+
+def build_help_embed() -> discord.Embed:
+    return discord.Embed(
+        title="TRPG Discord Bot 指令說明",
+        description=(
+            "請點擊下方按鈕查看各指令的詳細說明。\n"
+            "擲骰：`/roll`、`/coc`、`/roll-group`、`/coc-group`、`/macro`、`/roll-audit`、`!r`、`!coc`\n"
+            "追蹤：`/init`、`/hp`、`/san`\n"
+            "角色：`/skill add`、`/skill show`、`/skill delete`、`/sheet`\n"
+            "日誌：`/log-stream`、`/log-stream-mode`、`/log-export`、`/crit`\n"
+            "管理：`/admin`"
+        ),
+        color=0x77B255
+    )
+
+
+def build_topic_embed(description: str) -> discord.Embed:
+    return discord.Embed(
+        title="指令說明",
+        description=description,
+        color=0x77B255
+    )
+
+
 class HelpButton(discord.ui.Button):
-    def __init__(self, label: str, custom_id: str, description: str):
+    def __init__(self, label: str, custom_id: str, embed: discord.Embed):
         super().__init__(label=label, custom_id=custom_id, style=discord.ButtonStyle.secondary)
-        self.description = description
+        self.embed = embed
 
     async def callback(self, interaction: discord.Interaction):
-        embed = discord.Embed(
-            title="指令說明",
-            description=self.description,
-            color=0x77B255
-        )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        await interaction.response.send_message(embed=self.embed, ephemeral=True)
 
 
-# View for help command
+# Persistent view for help command
 class HelpView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=120)
-        
+    def __init__(self, topic_embeds: dict):
+        super().__init__(timeout=None)
+
         # Add buttons for different help topics
-        self.add_item(HelpButton("D&D 擲骰", "help_roll", 
-            "**/roll <骰子表達式>**\n支援 `2d6`、`d20+5`、`1d10>=15`、`+3 d6` 等格式，解析骰數、面數、修正值與比較條件。預設最多 50 次擲骰。"))
-        self.add_item(HelpButton("CoC 擲骰", "help_coc", 
-            "**/coc <技能值> [次數]**\n技能值 1-100，可設定 1-10 次連續擲骰。自動判斷普通/困難/極限成功、大成功（1）與大失敗（技能<50 時 96-100，否則 100）。"))
-        self.add_item(HelpButton("技能指令", "help_skill", 
-            "**技能指令**\n`/skill add <名稱> <類型> <等級> <效果>`：新增或更新技能紀錄。\n`/skill show <名稱>`：支援模糊搜尋技能名稱，查詢技能。\n`/skill delete <名稱>`：刪除此伺服器中的技能。"))
-        self.add_item(HelpButton("日誌指令", "help_logs", 
-            "**日誌相關指令**\n`/log-stream on <頻道>`：啟用串流並綁定頻道。\n`/log-stream off`：關閉串流。\n`/log-stream-mode <live|batch>`：切換即時或批次。\n`/crit <success|fail> [頻道]`：設定大成功/大失敗紀錄頻道，留空則清除設定。"))
-        self.add_item(HelpButton("管理指令", "help_admin", 
-            "**管理指令（需開發者）**\n`/admin restart`：確認後重新啟動機器人。\n`/admin shutdown`：確認後關閉機器人。\n`/admin dev-add <用戶>` / `/admin dev-remove <用戶>`：維護開發者名單。\n`/admin dev-list`：列出所有已註冊開發者。"))
+        for label, custom_id, _ in HELP_TOPICS:
+            self.add_item(HelpButton(label, custom_id, topic_embeds[custom_id]))
 
 
 # Help commands
 class HelpCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Embeds and views are static, so they are built once per process
+        self.help_embed = build_help_embed()
+        self.topic_embeds = {custom_id: build_topic_embed(description) for _, custom_id, description in HELP_TOPICS}
+        # Registered without a message_id, this view answers the help buttons on every message
+        self.view = HelpView(self.topic_embeds)
+        bot.add_view(self.view)
+        # Sending a finished view only serializes its buttons; a live one would be stored
+        # again under each new message id and never released
+        self.message_view = HelpView(self.topic_embeds)
+        self.message_view.stop()
 
     @discord.app_commands.command(name="help", description="顯示指令說明")
     async def help(self, interaction: discord.Interaction):
         """顯示指令說明"""
-        embed = discord.Embed(
-            title="TRPG Discord Bot 指令說明",
-            description=(
-                "請點擊下方按鈕查看各指令的詳細說明。\n"
-                "支援 `/roll`、`/coc`、`/skill add`、`/skill show`、`/log-stream`、`/log-stream-mode`、`/crit`、`/admin`。"
-            ),
-            color=0x77B255
-        )
-        
-        view = HelpView()
-        await interaction.response.send_message(embed=embed, view=view)
\ No newline at end of file
+        await interaction.response.send_message(embed=self.help_embed, view=self.message_view)
@@ -1,6 +1,12 @@
+import asyncio
 import discord
 from discord.ext import commands
 from typing import Optional
+from utils.transcript import iter_transcript_parts, parse_time_range, transcript_filename
+
+
+# Leave room for multipart framing below the guild's upload limit
+UPLOAD_MARGIN = 64 * 1024
 
 
 # Define choices for log actions
@@ -36,7 +42,7 @@ class LogCommands(commands.Cog):
             await interaction.response.send_message("請提供要啟用串流的文字頻道", ephemeral=True)
             return
         
-        config = self.bot.config_manager.get_guild_config(interaction.guild.id)
+        config = self.bot.config_manager.edit_guild_config(interaction.guild.id)
         if state.value == "on":
             config.log_channel = channel.id
             self.bot.config_manager.set_guild_config(interaction.guild.id, config)
@@ -67,7 +73,7 @@ class LogCommands(commands.Cog):
             await interaction.response.send_message("模式必須是 'live' 或 'batch' 之一", ephemeral=True)
             return
         
-        config = self.bot.config_manager.get_guild_config(interaction.guild.id)
+        config = self.bot.config_manager.edit_guild_config(interaction.guild.id)
         config.stream_mode = mode.value
         self.bot.config_manager.set_guild_config(interaction.guild.id, config)
         await interaction.response.send_message(f"串流模式已設定為: {mode.value}")
@@ -99,7 +105,7 @@ class LogCommands(commands.Cog):
             await interaction.response.send_message("類型必須是 'success' 或 'fail' 之一", ephemeral=True)
             return
         
-        config = self.bot.config_manager.get_guild_config(interaction.guild.id)
+        config = self.bot.config_manager.edit_guild_config(interaction.guild.id)
         
         if kind.value == "success":
             config.crit_success_channel = channel.id if channel else None
@@ -120,4 +126,69 @@ class LogCommands(commands.Cog):
             description=description,
             color=0x7289DA
         )
-        await interaction.response.send_message(embed=embed)
\ No newline at end of file
+        await interaction.response.send_message(embed=embed)
+
+    @discord.app_commands.command(name="log-export", description="匯出指定時間範圍的擲骰紀錄")
+    @discord.app_commands.describe(
+        start="開始時間 (例如 2026-10-19 20:00)",
+        end="結束時間 (例如 2026-10-19 23:30，只填日期則包含整天)",
+        output_format="輸出格式 (預設 gzip)"
+    )
+    @discord.app_commands.rename(output_format="format")
+    @discord.app_commands.choices(output_format=[
+        discord.app_commands.Choice(name="gzip", value="gzip"),
+        discord.app_commands.Choice(name="csv", value="csv"),
+        discord.app_commands.Choice(name="markdown", value="markdown")
+    ])
+    async def log_export(self, interaction: discord.Interaction,
+                         start: str,
+                         end: str,
+                         output_format: Optional[discord.app_commands.Choice[str]] = None):
+        """匯出指定時間範圍的擲骰紀錄"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+        
+        try:
+            start_time, end_time = parse_time_range(start, end)
+        except ValueError as e:
+            await interaction.response.send_message(f"時間格式錯誤: {e}", ephemeral=True)
+            return
+        
+        fmt = output_format.value if output_format else "gzip"
+        max_bytes = interaction.guild.filesize_limit - UPLOAD_MARGIN
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        
+        events = self.bot.event_journal.iter_events(
+            interaction.guild.id, start_time.timestamp(), end_time.timestamp()
+        )
+        parts = iter_transcript_parts(events, fmt, max_bytes)
+        index = 0
+        delivered = 0
+        try:
+            # Build each part in a worker thread so reading and compressing never block the loop
+            while True:
+                part = await asyncio.to_thread(next, parts, None)
+                if part is None:
+                    break
+                index += 1
+                with part:
+                    filename = transcript_filename(fmt, start_time, end_time, index)
+                    await interaction.followup.send(file=discord.File(part, filename=filename), ephemeral=True)
+                delivered += 1
+        except Exception:
+            # Replace the "thinking" state with an error, then let the tree's error handler log it
+            try:
+                await interaction.followup.send(
+                    f"匯出失敗，已送出 {delivered} 個檔案" if delivered else "匯出失敗，未送出任何檔案",
+                    ephemeral=True
+                )
+            except discord.HTTPException:
+                pass
+            raise
+        finally:
+            await asyncio.to_thread(parts.close)
+            await asyncio.to_thread(events.close)
+        
+        if index == 0:
+            await interaction.followup.send("此時間範圍內沒有任何紀錄", ephemeral=True)
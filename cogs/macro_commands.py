@@ -0,0 +1,83 @@
+import discord
+from discord.ext import commands
+from typing import List, Optional
+
+
+# Dice macro commands
+class MacroCommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @discord.app_commands.command(name="macro", description="擲骰巨集指令")
+    @discord.app_commands.describe(
+        action="操作 add、list 或 delete",
+        name="巨集名稱 (add、delete 必填)，以 /roll @名稱 使用",
+        expression="骰子表達式 (add 必填)，例如 +6 1d20+7>=15"
+    )
+    @discord.app_commands.choices(action=[
+        discord.app_commands.Choice(name="add", value="add"),
+        discord.app_commands.Choice(name="list", value="list"),
+        discord.app_commands.Choice(name="delete", value="delete")
+    ])
+    async def macro(self, interaction: discord.Interaction,
+                    action: discord.app_commands.Choice[str],
+                    name: Optional[str] = None,
+                    expression: Optional[str] = None):
+        """擲骰巨集指令"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+
+        rules = self.bot.config_manager.get_guild_config(interaction.guild.id).dnd_rules
+
+        if action.value == "list":
+            macros = self.bot.macros.list_macros(interaction.guild.id, rules)
+            if not macros:
+                await interaction.response.send_message("此伺服器尚無巨集，請使用 `/macro add`", ephemeral=True)
+                return
+            lines = [
+                f"`@{macro.name}` {macro.expression}" + (f" ⚠️ {macro.error}" if macro.compiled is None else "")
+                for macro in macros
+            ]
+            embed = discord.Embed(title="擲骰巨集", description="\n".join(lines)[:4000], color=0x7289DA)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        if not name or not name.strip():
+            await interaction.response.send_message("請提供巨集名稱", ephemeral=True)
+            return
+
+        if action.value == "add":
+            if not expression or not expression.strip():
+                await interaction.response.send_message("請提供骰子表達式", ephemeral=True)
+                return
+            try:
+                macro = self.bot.macros.add_macro(interaction.guild.id, name, expression, rules)
+            except ValueError as e:
+                embed = discord.Embed(title="巨集儲存失敗", description=f"錯誤: {str(e)}", color=0xFF0000)
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            embed = discord.Embed(
+                title="巨集已儲存",
+                description=f"`@{macro.name}` → {macro.expression}\n使用 `/roll @{macro.name}` 擲骰",
+                color=0x00AA00
+            )
+            await interaction.response.send_message(embed=embed)
+
+        elif action.value == "delete":
+            if self.bot.macros.delete_macro(interaction.guild.id, name):
+                await interaction.response.send_message(f"已刪除巨集 `@{name.strip().lstrip('@')}`")
+            else:
+                await interaction.response.send_message(f"找不到巨集 `@{name.strip().lstrip('@')}`", ephemeral=True)
+
+    @macro.autocomplete('name')
+    async def macro_name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[discord.app_commands.Choice[str]]:
+        if not interaction.guild:
+            return []
+        rules = self.bot.config_manager.get_guild_config(interaction.guild.id).dnd_rules
+        query = current.lstrip('@').lower()
+        return [
+            discord.app_commands.Choice(name=f"@{macro.name} ({macro.expression})"[:100], value=macro.name)
+            for macro in self.bot.macros.list_macros(interaction.guild.id, rules)
+            if query in macro.name.lower()
+        ][:25]
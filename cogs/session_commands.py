@@ -0,0 +1,218 @@
+import discord
+from discord.ext import commands
+from core.coc_roller import CoCRoller
+from core.dice_roller import DiceRoller
+from models.session_tracker import ChannelSession, Combatant
+from typing import Any, Dict, Optional, Tuple
+
+
+def roll_amount(text: str, rules: Dict[str, Any], maximum: bool = False) -> Tuple[int, str]:
+    """An integer, or the total of a dice expression (its highest total if maximum); returns (value, detail)"""
+    text = text.strip()
+    if text.isdigit():
+        return int(text), ""
+    compiled = DiceRoller.compile_expression(text, rules)
+    if compiled['roll_count'] != 1 or compiled['comparison']:
+        raise ValueError(f"無法使用的骰子表達式：{text}")
+    if maximum:
+        total = compiled['count'] * compiled['sides'] + compiled['modifier']
+        return total, f"{text} 最大值 {total}"
+    result = DiceRoller.roll_compiled(compiled)[0]
+    return result['total'], f"{text} → {' + '.join(map(str, result['rolls']))}"
+
+
+def parse_change(text: str, rules: Dict[str, Any]) -> Tuple[Optional[int], Optional[int], str]:
+    """"=12" sets a value, "+3", "-1d6" change it; returns (delta, value, detail)"""
+    text = text.strip()
+    if text.startswith('='):
+        value = text[1:].strip()
+        if not value.isdigit():
+            raise ValueError("設定值必須是非負整數，例如 `=12`")
+        return None, int(value), ""
+    if not text or text[0] not in '+-':
+        raise ValueError("請以 `=數值` 設定，或以 `+數值`、`-1d6` 等增減")
+    amount, detail = roll_amount(text[1:], rules)
+    return (amount if text[0] == '+' else -amount), None, detail
+
+
+def format_combatant(combatant: Combatant) -> str:
+    parts = [combatant.name]
+    if combatant.initiative is not None:
+        parts.append(f"先攻 {combatant.initiative}")
+    if combatant.hp is not None:
+        parts.append(f"HP {combatant.hp}/{combatant.max_hp}")
+    if combatant.san is not None:
+        parts.append(f"SAN {combatant.san}")
+    return " · ".join(parts)
+
+
+# Per-channel initiative, HP and SAN tracking
+class SessionCommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @discord.app_commands.command(name="init", description="先攻追蹤指令")
+    @discord.app_commands.describe(
+        action="操作 add、next、show、remove 或 end",
+        name="角色名稱 (add、remove 必填)",
+        initiative="先攻值或骰子表達式，例如 15 或 d20+3 (add 必填)"
+    )
+    @discord.app_commands.choices(action=[
+        discord.app_commands.Choice(name="add", value="add"),
+        discord.app_commands.Choice(name="next", value="next"),
+        discord.app_commands.Choice(name="show", value="show"),
+        discord.app_commands.Choice(name="remove", value="remove"),
+        discord.app_commands.Choice(name="end", value="end")
+    ])
+    async def init(self, interaction: discord.Interaction,
+                   action: discord.app_commands.Choice[str],
+                   name: Optional[str] = None,
+                   initiative: Optional[str] = None):
+        """先攻追蹤指令"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+
+        tracker = self.bot.sessions
+        channel_id = interaction.channel_id
+        guild_id = interaction.guild.id
+
+        if action.value in ["add", "remove"] and (not name or not name.strip()):
+            await interaction.response.send_message("請提供角色名稱", ephemeral=True)
+            return
+
+        if action.value == "show":
+            session = tracker.get(channel_id, guild_id)
+            if session is None or not session.combatants:
+                await interaction.response.send_message("此頻道沒有進行中的追蹤，請使用 `/init add`", ephemeral=True)
+                return
+            await interaction.response.send_message(embed=self.build_session_embed(session))
+
+        elif action.value == "end":
+            if tracker.end(channel_id):
+                await interaction.response.send_message("已結束此頻道的先攻與狀態追蹤")
+            else:
+                await interaction.response.send_message("此頻道沒有進行中的追蹤", ephemeral=True)
+
+        elif action.value == "add":
+            if not initiative:
+                await interaction.response.send_message("請提供先攻值或骰子表達式", ephemeral=True)
+                return
+            rules = self.bot.config_manager.get_guild_config(guild_id).dnd_rules
+            try:
+                value, detail = roll_amount(initiative, rules)
+                with tracker.editing(channel_id, guild_id) as session:
+                    combatant = session.set_initiative(name, value)
+            except ValueError as e:
+                await interaction.response.send_message(f"錯誤: {e}", ephemeral=True)
+                return
+            detail = f"（{detail}）" if detail else ""
+            await interaction.response.send_message(f"⚔️ {combatant.name} 先攻 {value}{detail}")
+
+        elif action.value == "remove":
+            # Only open the session for writing when there is something to remove
+            session = tracker.get(channel_id, guild_id)
+            removed = False
+            if session is not None and name.strip().lower() in session.combatants:
+                with tracker.editing(channel_id, guild_id) as session:
+                    removed = session.remove(name)
+            if removed:
+                await interaction.response.send_message(f"已移除 {name.strip()}")
+            else:
+                await interaction.response.send_message(f"找不到角色 `{name}`", ephemeral=True)
+
+        elif action.value == "next":
+            session = tracker.get(channel_id, guild_id)
+            if session is None or not session.order:
+                await interaction.response.send_message("先攻順序是空的，請使用 `/init add`", ephemeral=True)
+                return
+            with tracker.editing(channel_id, guild_id) as session:
+                combatant = session.advance()
+                round_number = session.round
+            await interaction.response.send_message(f"▶ 第 {round_number} 輪：輪到 **{format_combatant(combatant)}**")
+
+    @discord.app_commands.command(name="hp", description="調整角色 HP")
+    @discord.app_commands.describe(
+        name="角色名稱",
+        change="=數值 設定 (首次即為上限)，+數值 或 -1d6 等增減"
+    )
+    async def hp(self, interaction: discord.Interaction, name: str, change: str):
+        """調整角色 HP"""
+        await self.change_stat(interaction, name, change, "hp")
+
+    @discord.app_commands.command(name="san", description="調整角色 SAN 或進行理智檢定")
+    @discord.app_commands.describe(
+        name="角色名稱",
+        change="=數值 設定，+數值 或 -1d6 等增減，或 成功/失敗 損失 (例如 1/1d6) 進行理智檢定"
+    )
+    async def san(self, interaction: discord.Interaction, name: str, change: str):
+        """調整角色 SAN 或進行理智檢定"""
+        if '/' in change:
+            await self.sanity_check(interaction, name, change)
+        else:
+            await self.change_stat(interaction, name, change, "san")
+
+    async def change_stat(self, interaction: discord.Interaction, name: str, change: str, stat: str):
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+        rules = self.bot.config_manager.get_guild_config(interaction.guild.id).dnd_rules
+        try:
+            delta, value, detail = parse_change(change, rules)
+            with self.bot.sessions.editing(interaction.channel_id, interaction.guild.id) as session:
+                record = session.change_stat(name, stat, delta, value, interaction.user.id)
+                combatant = session.combatants[name.strip().lower()]
+        except ValueError as e:
+            await interaction.response.send_message(f"錯誤: {e}", ephemeral=True)
+            return
+        detail = f"（{detail}）" if detail else ""
+        sign = f"{record.delta:+d}" if delta is not None else "設定"
+        await interaction.response.send_message(f"{format_combatant(combatant)}　{stat.upper()} {sign}{detail}")
+
+    async def sanity_check(self, interaction: discord.Interaction, name: str, change: str):
+        """CoC sanity roll against the tracked SAN; loses the success or the failure amount"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+        config = self.bot.config_manager.get_guild_config(interaction.guild.id)
+        success_loss, _, failure_loss = change.partition('/')
+        try:
+            with self.bot.sessions.editing(interaction.channel_id, interaction.guild.id) as session:
+                combatant = session.combatants.get(name.strip().lower())
+                if combatant is None or combatant.san is None:
+                    raise ValueError(f"{name.strip()} 尚未設定 SAN，請先以 `/san {name.strip()} =數值` 設定")
+                result = CoCRoller.roll_coc(combatant.san, config.coc_rules)
+                if result['success_level'] <= 4:
+                    loss, detail = roll_amount(success_loss, config.dnd_rules)
+                else:
+                    # A fumbled sanity roll loses the maximum of the failure amount
+                    loss, detail = roll_amount(failure_loss, config.dnd_rules, maximum=result['success_level'] == 6)
+                session.change_stat(name, "san", -loss, None, interaction.user.id)
+                combatant = session.combatants[name.strip().lower()]
+        except ValueError as e:
+            await interaction.response.send_message(f"錯誤: {e}", ephemeral=True)
+            return
+        detail = f"（{detail}）" if detail else ""
+        await interaction.response.send_message(
+            f"🧠 理智檢定 {result['roll']} → {CoCRoller.format_success_level(result['success_level'])}\n"
+            f"{format_combatant(combatant)}　SAN -{loss}{detail}"
+        )
+
+    def build_session_embed(self, session: ChannelSession) -> discord.Embed:
+        current = session.current() if session.started else None
+        lines = [
+            f"{'▶' if combatant is current else '・'} {format_combatant(combatant)}"
+            for combatant in session.ordered()
+        ]
+        others = [combatant for combatant in session.combatants.values() if combatant.initiative is None]
+        if others:
+            lines.append("\n未加入先攻：")
+            lines.extend(f"・ {format_combatant(combatant)}" for combatant in others)
+        if session.history:
+            lines.append("\n最近變化：")
+            lines.extend(
+                f"・ {change.name} {change.stat.upper()} {change.delta:+d} → {change.value}"
+                for change in list(session.history)[-3:]
+            )
+        title = f"先攻順序（第 {session.round} 輪）" if session.started else "先攻順序（尚未開始）"
+        return discord.Embed(title=title, description="\n".join(lines)[:4000], color=0x7289DA)
@@ -0,0 +1,129 @@
+import discord
+import json
+from discord.ext import commands
+from models.character_sheet import parse_sheet_text, MAX_SHEET_SKILLS
+from typing import Dict, Optional
+
+# Largest sheet attachment read by /sheet import
+MAX_SHEET_FILE_BYTES = 64 * 1024
+
+
+# Character sheet commands
+class SheetCommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @discord.app_commands.command(name="sheet", description="角色卡指令")
+    @discord.app_commands.describe(
+        action="操作 import、show、list、use 或 delete",
+        name="角色名稱 (import、use、delete 必填)",
+        data="技能列表，例如「偵查 60, 聆聽 50, 圖書館使用 70」(import 時與附件擇一)",
+        file="技能列表文字檔或 JSON 物件 (import 時與 data 擇一)"
+    )
+    @discord.app_commands.choices(action=[
+        discord.app_commands.Choice(name="import", value="import"),
+        discord.app_commands.Choice(name="show", value="show"),
+        discord.app_commands.Choice(name="list", value="list"),
+        discord.app_commands.Choice(name="use", value="use"),
+        discord.app_commands.Choice(name="delete", value="delete")
+    ])
+    async def sheet(self, interaction: discord.Interaction,
+                    action: discord.app_commands.Choice[str],
+                    name: Optional[str] = None,
+                    data: Optional[str] = None,
+                    file: Optional[discord.Attachment] = None):
+        """角色卡指令"""
+        if not interaction.guild:
+            await interaction.response.send_message("此指令只能在伺服器中使用", ephemeral=True)
+            return
+
+        sheets = self.bot.character_sheets
+        guild_id = interaction.guild.id
+        user_id = interaction.user.id
+
+        if action.value in ["import", "use", "delete"] and (not name or not name.strip()):
+            await interaction.response.send_message("請提供角色名稱", ephemeral=True)
+            return
+
+        if action.value == "import":
+            try:
+                skills = await self.read_skills(data, file)
+            except ValueError as e:
+                embed = discord.Embed(title="角色卡匯入失敗", description=f"錯誤: {str(e)}", color=0xFF0000)
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+
+            if sheets.import_sheet(guild_id, user_id, name.strip(), skills):
+                embed = discord.Embed(
+                    title="角色卡已匯入",
+                    description=f"**角色**: {name.strip()}\n**技能數**: {len(skills)}\n已設為目前使用的角色，`/coc` 可直接輸入技能名稱",
+                    color=0x00AA00
+                )
+            else:
+                embed = discord.Embed(title="角色卡匯入失敗", description="無法儲存角色卡", color=0xFF0000)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        elif action.value == "show":
+            sheet = sheets.get_active_sheet(guild_id, user_id)
+            if sheet is None:
+                await interaction.response.send_message("尚未匯入角色卡，請使用 `/sheet import`", ephemeral=True)
+                return
+            entries = sorted(sheet.skills.values(), key=lambda skill: skill[0])
+            description = "、".join(f"{skill_name} {value}" for skill_name, value in entries)
+            if len(description) > 4000:
+                description = description[:3999] + "…"
+            embed = discord.Embed(title=f"角色卡：{sheet.name}", description=description, color=0x7289DA)
+            embed.set_footer(text=f"{len(entries)} 項技能")
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        elif action.value == "list":
+            characters = sheets.list_characters(guild_id, user_id)
+            if not characters:
+                await interaction.response.send_message("尚未匯入角色卡，請使用 `/sheet import`", ephemeral=True)
+                return
+            lines = [
+                f"{'▶' if active else '・'} {character_name}（{count} 項技能）"
+                for character_name, active, count in characters
+            ]
+            await interaction.response.send_message("你的角色：\n" + "\n".join(lines), ephemeral=True)
+
+        elif action.value == "use":
+            if sheets.set_active(guild_id, user_id, name):
+                await interaction.response.send_message(f"已切換至角色 {name.strip()}", ephemeral=True)
+            else:
+                await interaction.response.send_message(f"找不到角色 `{name}`", ephemeral=True)
+
+        elif action.value == "delete":
+            if sheets.delete_character(guild_id, user_id, name):
+                await interaction.response.send_message(f"已刪除角色 {name.strip()}", ephemeral=True)
+            else:
+                await interaction.response.send_message(f"找不到角色 `{name}`", ephemeral=True)
+
+    async def read_skills(self, data: Optional[str], file: Optional[discord.Attachment]) -> Dict[str, int]:
+        """Skills from the data option or an attached text/JSON file"""
+        if file is None:
+            if not data:
+                raise ValueError("請提供技能列表或附件")
+            return parse_sheet_text(data)
+
+        if file.size > MAX_SHEET_FILE_BYTES:
+            raise ValueError(f"附件過大（上限 {MAX_SHEET_FILE_BYTES // 1024} KB）")
+        try:
+            text = (await file.read()).decode('utf-8-sig')
+        except (discord.HTTPException, UnicodeDecodeError) as e:
+            raise ValueError(f"無法讀取附件：{e}")
+
+        if text.lstrip().startswith('{'):
+            try:
+                raw = json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"JSON 格式錯誤：{e}")
+            skills = {}
+            for skill_name, value in raw.items():
+                if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 999:
+                    raise ValueError(f"技能值必須是 0-999 的整數：{skill_name}")
+                skills[str(skill_name).strip()] = value
+            if not skills or len(skills) > MAX_SHEET_SKILLS:
+                raise ValueError(f"技能數量必須介於 1-{MAX_SHEET_SKILLS}")
+            return skills
+        return parse_sheet_text(text)
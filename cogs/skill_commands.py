@@ -1,38 +1,70 @@
 import discord
+import asyncio
+import time
+import weakref
 from discord.ext import commands
 from models.database import SkillsDB
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 
 # View for skill deletion confirmation
 class SkillDeleteView(discord.ui.View):
-    def __init__(self, bot, guild_id: int, normalized_name: str, author: discord.User):
-        super().__init__(timeout=30)
+    def __init__(self, bot, guild_id: int, normalized_name: str, author: discord.abc.Snowflake,
+                 timeout: Optional[float] = 30):
+        super().__init__(timeout=timeout)
         self.bot = bot
         self.guild_id = guild_id
         self.normalized_name = normalized_name
         self.author = author
+        self.message_id: Optional[int] = None
+        self.expires_at = time.time() + (timeout or 0)
 
-    @discord.ui.button(label="確認刪除", style=discord.ButtonStyle.danger)
+    def to_state(self) -> Dict[str, Any]:
+        """Serializable state for the restart snapshot"""
+        return {
+            'message_id': self.message_id,
+            'guild_id': self.guild_id,
+            'normalized_name': self.normalized_name,
+            'author_id': self.author.id,
+            'expires_at': self.expires_at
+        }
+
+    @classmethod
+    def from_state(cls, bot, state: Dict[str, Any]) -> Optional['SkillDeleteView']:
+        """Re-attach a view to its message after a restart; None if it has expired"""
+        remaining = state['expires_at'] - time.time()
+        if remaining <= 0:
+            return None
+        # add_view requires timeout=None, so the remaining lifetime is scheduled separately
+        view = cls(bot, state['guild_id'], state['normalized_name'], discord.Object(id=state['author_id']), timeout=None)
+        view.message_id = state['message_id']
+        view.expires_at = state['expires_at']
+        bot.add_view(view, message_id=view.message_id)
+        asyncio.get_running_loop().call_later(remaining, view.stop)
+        return view
+
+    @discord.ui.button(label="確認刪除", style=discord.ButtonStyle.danger, custom_id="skill_delete:confirm")
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.author.id:
             await interaction.response.send_message("您無法執行此操作", ephemeral=True)
             return
         
+        self.stop()
         success = self.bot.skills_db.delete_skill(self.guild_id, self.normalized_name)
         if success:
-            summary = f"{self.author.mention} 刪除了技能 `{self.normalized_name}`"
+            summary = f"{interaction.user.mention} 刪除了技能 `{self.normalized_name}`"
             await interaction.response.edit_message(content=summary, view=None)
         else:
             await interaction.response.edit_message(content="刪除失敗", view=None)
 
-    @discord.ui.button(label="取消", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="取消", style=discord.ButtonStyle.secondary, custom_id="skill_delete:cancel")
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
         if interaction.user.id != self.author.id:
             await interaction.response.send_message("您無法執行此操作", ephemeral=True)
             return
         
-        await interaction.response.edit_message(content=f"{self.author.mention} 取消刪除操作", view=None)
+        self.stop()
+        await interaction.response.edit_message(content=f"{interaction.user.mention} 取消刪除操作", view=None)
 
 
 
@@ -41,6 +73,18 @@ class SkillDeleteView(discord.ui.View):
 class SkillCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Deletion confirmations still waiting for a click, keyed by message id
+        self.open_views: "weakref.WeakValueDictionary[int, SkillDeleteView]" = weakref.WeakValueDictionary()
+        bot.handoff.register('skill_delete_views', self.dump_views, self.load_views)
+
+    def dump_views(self) -> List[Dict[str, Any]]:
+        return [view.to_state() for view in list(self.open_views.values()) if not view.is_finished()]
+
+    def load_views(self, states: List[Dict[str, Any]]):
+        for state in states:
+            view = SkillDeleteView.from_state(self.bot, state)
+            if view:
+                self.open_views[view.message_id] = view
 
     @discord.app_commands.command(name="skill", description="技能資料庫指令")
     @discord.app_commands.describe(
@@ -159,4 +203,6 @@ class SkillCommands(commands.Cog):
                 ),
                 color=0x8B0000
             )
-            await interaction.response.send_message(embed=embed, view=view)
\ No newline at end of file
+            await interaction.response.send_message(embed=embed, view=view)
+            view.message_id = (await interaction.original_response()).id
+            self.open_views[view.message_id] = view
\ No newline at end of file
@@ -1,20 +1,70 @@
+import itertools
 import random
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, List, Any, Tuple
+
+
+# Most bonus or penalty dice a single roll may take (7e caps them at two)
+MAX_BONUS_DICE = 2
+
+
+def _rules_key(rules: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    """Hashable form of coc_rules for the outcome table caches"""
+    return tuple(sorted(rules.items()))
+
+
+@lru_cache(maxsize=4096)
+def _outcome_table(skill_value: int, rules_key: Tuple[Tuple[str, Any], ...]) -> Tuple[int, ...]:
+    """Success level of every d100 result (index 1-100) for one skill value"""
+    rules = dict(rules_key)
+    return (0,) + tuple(CoCRoller.determine_success_level(roll, skill_value, rules) for roll in range(1, 101))
+
+
+@lru_cache(maxsize=4096)
+def _level_chances(skill_value: int, bonus: int, rules_key: Tuple[Tuple[str, Any], ...]) -> Tuple[float, ...]:
+    """Exact probability of each success level (index 1-6) with the given bonus/penalty dice"""
+    table = _outcome_table(skill_value, rules_key)
+    counts = [0] * 7
+    tens_dice = 1 + abs(bonus)
+    for units in range(10):
+        for tens in itertools.product(range(10), repeat=tens_dice):
+            counts[table[CoCRoller.combine_dice(tens, units, bonus)]] += 1
+    total = 10 ** (tens_dice + 1)
+    return tuple(count / total for count in counts)
 
 
 # CoC utilities
 class CoCRoller:
     @staticmethod
-    def roll_coc(skill_value: int, rules: Dict[str, Any]) -> Dict[str, Any]:
-        """Roll for Call of Cthulhu 7th edition"""
-        roll = random.randint(1, 100)
-        success_level = CoCRoller.determine_success_level(roll, skill_value, rules)
+    def combine_dice(tens: Tuple[int, ...], units: int, bonus: int) -> int:
+        """
+        d100 result from tens digits (0-9) and a units digit: the lowest candidate with
+        bonus dice, the highest with penalty dice; 00 + 0 reads as 100
+        """
+        candidates = [(ten * 10 + units) or 100 for ten in tens]
+        if bonus > 0:
+            return min(candidates)
+        if bonus < 0:
+            return max(candidates)
+        return candidates[0]
+
+    @staticmethod
+    def roll_coc(skill_value: int, rules: Dict[str, Any], bonus: int = 0) -> Dict[str, Any]:
+        """Roll for Call of Cthulhu 7th edition; bonus > 0 adds bonus dice, bonus < 0 penalty dice"""
+        # All tens digits are drawn in one call, then the level is a table lookup
+        tens = random.choices(range(10), k=1 + abs(bonus))
+        units = random.randrange(10)
+        roll = CoCRoller.combine_dice(tens, units, bonus)
+        success_level = _outcome_table(skill_value, _rules_key(rules))[roll]
         
         is_critical_success = roll == rules['critical_success']
         is_critical_fail = CoCRoller.is_critical_failure(roll, skill_value, rules)
         
         return {
             'roll': roll,
+            'tens': tens,
+            'units': units,
+            'bonus': bonus,
             'skill_value': skill_value,
             'success_level': success_level,
             'is_critical_success': is_critical_success,
@@ -22,10 +72,38 @@ class CoCRoller:
         }
 
     @staticmethod
-    def roll_coc_multi(skill_value: int, times: int, rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def success_chances(skill_value: int, rules: Dict[str, Any], bonus: int = 0) -> Dict[int, float]:
+        """Probability of each success level (1-6), from the cached outcome tables"""
+        chances = _level_chances(skill_value, bonus, _rules_key(rules))
+        return {level: chances[level] for level in range(1, 7)}
+
+    @staticmethod
+    def resolve_opposed(first: Dict[str, Any], second: Dict[str, Any]) -> int:
+        """
+        Winner of an opposed roll: 1 for the first roller, -1 for the second, 0 for none.
+        The better success level wins and equal levels go to the higher skill; a critical
+        failure counts as a failure, and when both sides fail nobody wins.
+        """
+        first_level = min(first['success_level'], 5)
+        second_level = min(second['success_level'], 5)
+        if first_level == second_level == 5:
+            return 0
+        if first_level != second_level:
+            return 1 if first_level < second_level else -1
+        if first['skill_value'] != second['skill_value']:
+            return 1 if first['skill_value'] > second['skill_value'] else -1
+        return 0
+
+    @staticmethod
+    def roll_coc_multi(skill_value: int, times: int, rules: Dict[str, Any], bonus: int = 0) -> List[Dict[str, Any]]:
         """Roll multiple times for Call of Cthulhu 7th edition"""
         count = max(1, times)
-        return [CoCRoller.roll_coc(skill_value, rules) for _ in range(count)]
+        return [CoCRoller.roll_coc(skill_value, rules, bonus) for _ in range(count)]
+
+    @staticmethod
+    def roll_coc_batch(skill_values: List[int], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Roll once for each skill value (one entry per participant)"""
+        return [CoCRoller.roll_coc(skill_value, rules) for skill_value in skill_values]
 
     @staticmethod
     def determine_success_level(roll: int, skill_value: int, rules: Dict[str, Any]) -> int:
@@ -69,4 +147,15 @@ class CoCRoller:
             5: "失敗 (Failure)",
             6: "大失敗 (Critical Failure)"
         }
-        return levels.get(level, "未知 (Unknown)")
\ No newline at end of file
+        return levels.get(level, "未知 (Unknown)")
+
+    @staticmethod
+    def format_chances(chances: Dict[int, float]) -> str:
+        """Cumulative readout: any success, hard or better, extreme or better, and the crits"""
+        success = sum(chances[level] for level in range(1, 5))
+        hard = sum(chances[level] for level in range(1, 4))
+        extreme = chances[1] + chances[2]
+        return (
+            f"成功率 {success:.1%}（困難 {hard:.1%} · 極限 {extreme:.1%} · "
+            f"大成功 {chances[1]:.1%} · 大失敗 {chances[6]:.1%}）"
+        )
@@ -0,0 +1,44 @@
+import hashlib
+import struct
+from typing import List
+
+
+# Counter-based random generator for auditable rolls
+class CounterRNG:
+    """
+    Keyed BLAKE2b over (counter, block index) yields 64-byte blocks of sixteen 32-bit
+    words; faces are drawn from those words by rejection sampling. The output depends
+    only on (key, counter), so any roll can be reproduced without replaying earlier ones,
+    and a roll needing many faces hashes its blocks one after another.
+    """
+
+    WORDS_PER_BLOCK = 16
+
+    def __init__(self, key: bytes, counter: int):
+        self.key = key
+        self.counter = counter
+        self._block_index = 0
+        self._words: List[int] = []
+
+    def _next_block(self):
+        digest = hashlib.blake2b(
+            struct.pack('<QI', self.counter, self._block_index), key=self.key, digest_size=64
+        ).digest()
+        self._block_index += 1
+        # Reversed so pop() returns the words in order
+        self._words = list(struct.unpack('<16I', digest))[::-1]
+
+    def next_word(self) -> int:
+        if not self._words:
+            self._next_block()
+        return self._words.pop()
+
+    def randint(self, low: int, high: int) -> int:
+        """Uniform integer in [low, high], like random.randint"""
+        span = high - low + 1
+        # Reject the top partial range so every face is equally likely
+        limit = (1 << 32) - (1 << 32) % span
+        while True:
+            word = self.next_word()
+            if word < limit:
+                return low + word % span
@@ -43,14 +43,15 @@ class DiceRoller:
         return count, sides, modifier, comparison
 
     @staticmethod
-    def roll_single_dice(sides: int) -> int:
-        """Roll a single dice with given sides"""
-        return random.randint(1, sides)
+    def roll_single_dice(sides: int, rng=None) -> int:
+        """Roll a single dice with given sides; rng defaults to the random module"""
+        return (rng or random).randint(1, sides)
 
     @staticmethod
-    def roll_dice(count: int, sides: int, modifier: int, comparison: Optional[Tuple[str, int]] = None) -> Dict[str, Any]:
+    def roll_dice(count: int, sides: int, modifier: int, comparison: Optional[Tuple[str, int]] = None,
+                  rng=None) -> Dict[str, Any]:
         """Roll multiple dice and return results"""
-        rolls = [DiceRoller.roll_single_dice(sides) for _ in range(count)]
+        rolls = [DiceRoller.roll_single_dice(sides, rng) for _ in range(count)]
         total = sum(rolls) + modifier
         
         # Check for critical success/fail (for d20)
@@ -86,25 +87,57 @@ class DiceRoller:
         }
 
     @staticmethod
-    def roll_multiple_dice(expr: str, rules: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Parse and roll multiple dice expressions (for consecutive rolls)"""
+    def compile_expression(expr: str, rules: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Parse and validate an expression once, including the "+N expr" repeat prefix.
+        The result is JSON-serializable and can be rolled with roll_compiled().
+        """
         # Check if expression is in the format "+N expr" for multiple rolls
         match = re.match(r'^\+?(\d+)\s+(.+)$', expr.strip())
+        roll_count = 1
         if match:
             roll_count = int(match.group(1))
             if roll_count == 0:
                 raise ValueError("Roll count must be at least 1")
             if roll_count > rules['max_dice_count']:
                 raise ValueError(f"Too many rolls (max {rules['max_dice_count']})")
-            
-            dice_expr = match.group(2).strip()
-            count, sides, modifier, comparison = DiceRoller.parse_dice_expr(dice_expr, rules)
-            
-            results = []
-            for _ in range(roll_count):
-                # 每次都使用相同的骰子配置進行擲骰
-                results.append(DiceRoller.roll_dice(count, sides, modifier, comparison))
-            return results
-        else:
-            count, sides, modifier, comparison = DiceRoller.parse_dice_expr(expr, rules)
-            return [DiceRoller.roll_dice(count, sides, modifier, comparison)]
\ No newline at end of file
+            expr = match.group(2).strip()
+        
+        count, sides, modifier, comparison = DiceRoller.parse_dice_expr(expr, rules)
+        return {
+            'roll_count': roll_count,
+            'count': count,
+            'sides': sides,
+            'modifier': modifier,
+            'comparison': list(comparison) if comparison else None
+        }
+
+    @staticmethod
+    def roll_compiled(compiled: Dict[str, Any], rng=None) -> List[Dict[str, Any]]:
+        """Roll a compiled expression without parsing or validating it again"""
+        comparison = tuple(compiled['comparison']) if compiled['comparison'] else None
+        # 每次都使用相同的骰子配置進行擲骰
+        return [
+            DiceRoller.roll_dice(compiled['count'], compiled['sides'], compiled['modifier'], comparison, rng)
+            for _ in range(compiled['roll_count'])
+        ]
+
+    @staticmethod
+    def roll_multiple_dice(expr: str, rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Parse and roll multiple dice expressions (for consecutive rolls)"""
+        return DiceRoller.roll_compiled(DiceRoller.compile_expression(expr, rules))
+
+    @staticmethod
+    def roll_batch(expressions: List[str], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Roll one result per expression; repeated expressions are parsed once"""
+        parsed: Dict[str, Tuple[int, int, int, Optional[Tuple[str, int]]]] = {}
+        results = []
+        for expr in expressions:
+            spec = parsed.get(expr)
+            if spec is None:
+                try:
+                    spec = parsed[expr] = DiceRoller.parse_dice_expr(expr, rules)
+                except ValueError as e:
+                    raise ValueError(f"{expr}: {e}")
+            results.append(DiceRoller.roll_dice(*spec))
+        return results
@@ -0,0 +1,50 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+
+MAX_GROUP_ENTRIES = 25
+
+# Entries are separated by commas, semicolons or new lines; a label may be a user mention
+_ENTRY_SEPARATORS = re.compile(r'[,，、;；\n]+')
+_MENTION_PATTERN = re.compile(r'^<@!?(\d+)>$')
+
+
+class GroupEntry(NamedTuple):
+    label: str
+    user_id: Optional[int]  # set when the label is a mention
+    argument: str           # dice expression, skill value or skill name; may be empty
+
+
+def _split_entry(part: str) -> Tuple[str, str]:
+    """
+    (label, argument) of one entry. A last word containing a digit is the dice expression
+    or skill value and everything before it the label ("Old Tom d20+1"); otherwise the
+    first word is the label and the rest a skill name ("Alice Spot Hidden").
+    """
+    head, _, last = part.rpartition(' ')
+    if head and any(character.isdigit() for character in last):
+        return head.strip(), last
+    label, _, argument = part.partition(' ')
+    return label, argument
+
+
+def parse_group_entries(text: str) -> List[GroupEntry]:
+    """Parse "Alice d20+3, <@123> d20+1" into one entry per participant"""
+    entries = []
+    for part in _ENTRY_SEPARATORS.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        label, argument = _split_entry(part)
+        mention = _MENTION_PATTERN.match(label)
+        entries.append(GroupEntry(label, int(mention.group(1)) if mention else None, argument.strip()))
+    if not entries:
+        raise ValueError("請至少提供一位參與者")
+    if len(entries) > MAX_GROUP_ENTRIES:
+        raise ValueError(f"參與者過多（上限 {MAX_GROUP_ENTRIES}）")
+    return entries
+
+
+def count_group_entries(text: str) -> int:
+    """Cheap entry count used for rate-limit cost estimates"""
+    return len([part for part in _ENTRY_SEPARATORS.split(text) if part.strip()])
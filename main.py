@@ -1,29 +1,85 @@
 import os
-from dotenv import load_dotenv
 import sys
+import argparse
 import logging
 
 # 添加當前目錄到 sys.path 以確保能正確導入
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from utils.bot import TRPGDiscordBot
+# Imported first so the profiler's origin is as close to process start as possible;
+# discord.py, dotenv, models and cogs are imported only when they are needed
+from utils.startup import startup_profiler
 
 
-# Load environment variables
-load_dotenv()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="TRPG Discord Bot")
+    parser.add_argument(
+        "--shards",
+        help="分片數量 (整數或 auto，預設讀取 SHARD_COUNT)；未設定時以單一連線運行"
+    )
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        help="分片叢集行程數 (預設讀取 SHARD_CLUSTERS)；大於 1 時由監督行程啟動各叢集並在崩潰時重啟"
+    )
+    parser.add_argument(
+        "--memory-profile",
+        choices=["minimal", "standard"],
+        help="閘道快取設定 (預設讀取 MEMORY_PROFILE，否則為 standard)"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="連線就緒後輸出各啟動階段的耗時"
+    )
+    return parser.parse_args(argv)
 
 
 # Main function
 def main():
+    args = parse_args()
+    startup_profiler.enabled = args.profile_startup
+    
+    # Load environment variables
+    with startup_profiler.phase('import dotenv'):
+        from dotenv import load_dotenv
+    with startup_profiler.phase('load env'):
+        load_dotenv()
+    
+    if args.memory_profile:
+        # Exported so that spawned shard cluster workers use the same profile
+        os.environ["MEMORY_PROFILE"] = args.memory_profile
+    
     bot_token = os.getenv("DISCORD_TOKEN")
     if not bot_token:
         raise ValueError("預期 DISCORD_TOKEN 環境變數，但找不到!")
     
-    # Initialize and run the bot
-    bot = TRPGDiscordBot()
+    # CLI flags take precedence over values from the environment / .env
+    shards = args.shards or os.getenv("SHARD_COUNT")
+    clusters = args.clusters or int(os.getenv("SHARD_CLUSTERS", "1"))
+    
+    if not shards:
+        with startup_profiler.phase('import bot'):
+            from utils.bot import TRPGDiscordBot
+        # Initialize and run the bot
+        bot = TRPGDiscordBot()
+        bot.run(bot_token)
+        return
+    
+    shard_count = None if shards == "auto" else int(shards)
+    if clusters <= 1:
+        with startup_profiler.phase('import bot'):
+            from utils.bot import ShardedTRPGDiscordBot
+        # All shards in this process; "auto" uses Discord's recommended shard count
+        bot = ShardedTRPGDiscordBot(shard_count=shard_count)
+        bot.run(bot_token)
+        return
     
-    # Run the bot
-    bot.run(bot_token)
+    if shard_count is None:
+        raise ValueError("多行程模式需要明確指定 --shards 數量")
+    from utils.launcher import ClusterSupervisor
+    logging.basicConfig(level=logging.INFO)
+    ClusterSupervisor(bot_token, shard_count, clusters).run()
 
 
 if __name__ == "__main__":
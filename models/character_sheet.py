@@ -0,0 +1,311 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from models.database import connect_db
+from utils.metrics import metrics
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+logger.setLevel(logging.INFO)
+
+# Separators between sheet entries, and one "name value" entry (":", "：" or "=" allowed)
+_ENTRY_SEPARATORS = re.compile(r'[,，、;；\n]+')
+_ENTRY_PATTERN = re.compile(r'^(.+?)\s*[:：=]?\s*(\d{1,3})$')
+MAX_SHEET_SKILLS = 300
+
+
+def normalize_skill_name(name: str) -> str:
+    return name.strip().lower()
+
+
+def parse_sheet_text(text: str) -> Dict[str, int]:
+    """Parse "偵查 60, 聆聽:50、圖書館使用=70" into {display name: value}"""
+    skills: Dict[str, int] = {}
+    for entry in _ENTRY_SEPARATORS.split(text):
+        entry = entry.strip()
+        if not entry:
+            continue
+        match = _ENTRY_PATTERN.match(entry)
+        if not match:
+            raise ValueError(f"無法解析的項目：{entry}")
+        skills[match.group(1).strip()] = int(match.group(2))
+    if not skills:
+        raise ValueError("角色卡內容為空")
+    if len(skills) > MAX_SHEET_SKILLS:
+        raise ValueError(f"技能數量超過上限 {MAX_SHEET_SKILLS}")
+    return skills
+
+
+# One character's skills as held in memory
+@dataclass
+class CharacterSheet:
+    character_id: int
+    name: str
+    skills: Dict[str, Tuple[str, int]]  # normalized name -> (display name, value)
+
+    def lookup(self, query: str) -> Optional[Tuple[str, int]]:
+        """Exact match first, otherwise the closest name containing the query"""
+        normalized = normalize_skill_name(query)
+        exact = self.skills.get(normalized)
+        if exact is not None:
+            return exact
+        matches = self.matching(query, limit=1)
+        return matches[0] if matches else None
+
+    def matching(self, query: str, limit: int = 25) -> List[Tuple[str, int]]:
+        """Skills whose name contains the query, closest length first (for autocomplete)"""
+        normalized = normalize_skill_name(query)
+        candidates = [key for key in self.skills if normalized in key]
+        candidates.sort(key=lambda key: (not key.startswith(normalized), len(key), key))
+        return [self.skills[key] for key in candidates[:limit]]
+
+
+# Per-user character sheets and saved parties, stored next to the skills table
+class CharacterSheetDB:
+    """
+    Each (guild, user) may keep several characters, one of them active. The active
+    sheet is loaded with a single query and kept in an LRU cache of cache_size
+    entries; users without a sheet are cached too, so autocomplete never repeats
+    a query. Every write invalidates the user's entry. Parties (named participant
+    lists for group rolls) are cached the same way.
+    """
+
+    _NO_SHEET = object()
+
+    def __init__(self, db_path: str = "skills.db", cache_size: int = 1024):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, int], object]" = OrderedDict()
+        self._party_cache: "OrderedDict[Tuple[int, str], Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the character tables"""
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS characters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                normalized_name TEXT NOT NULL,
+                active INTEGER NOT NULL DEFAULT 0,
+                UNIQUE(guild_id, user_id, normalized_name)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS character_skills (
+                character_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                normalized_name TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                UNIQUE(character_id, normalized_name)
+            )
+        ''')
+        # Saved participant lists for group rolls
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS parties (
+                guild_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                normalized_name TEXT NOT NULL,
+                entries TEXT NOT NULL,
+                UNIQUE(guild_id, normalized_name)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def cached_users(self) -> List[Tuple[int, int]]:
+        """(guild_id, user_id) of the cached active sheets, least recently used first"""
+        with self._lock:
+            return list(self._cache)
+
+    def _invalidate(self, guild_id: int, user_id: int):
+        with self._lock:
+            self._cache.pop((guild_id, user_id), None)
+
+    def get_active_sheet(self, guild_id: int, user_id: int) -> Optional[CharacterSheet]:
+        """The user's active character, from the cache or one database query"""
+        key = (guild_id, user_id)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            metrics.inc('trpg_cache_hits_total', 'character_sheet')
+            return None if cached is self._NO_SHEET else cached
+
+        metrics.inc('trpg_cache_misses_total', 'character_sheet')
+        sheet = self._load_active_sheet(guild_id, user_id)
+        with self._lock:
+            self._cache[key] = sheet if sheet is not None else self._NO_SHEET
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return sheet
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'load_sheet')
+    def _load_active_sheet(self, guild_id: int, user_id: int) -> Optional[CharacterSheet]:
+        conn = connect_db(self.db_path)
+        try:
+            rows = conn.execute('''
+                SELECT c.id, c.name, s.name, s.normalized_name, s.value
+                FROM characters c
+                LEFT JOIN character_skills s ON s.character_id = c.id
+                WHERE c.guild_id = ? AND c.user_id = ? AND c.active = 1
+            ''', (guild_id, user_id)).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading character sheet: {e}")
+            return None
+        finally:
+            conn.close()
+        if not rows:
+            return None
+        skills = {normalized: (name, value) for _, _, name, normalized, value in rows if normalized is not None}
+        return CharacterSheet(character_id=rows[0][0], name=rows[0][1], skills=skills)
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'import_sheet')
+    def import_sheet(self, guild_id: int, user_id: int, name: str, skills: Dict[str, int]) -> bool:
+        """Create or replace a character's skills in one transaction and make it active"""
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                normalized_name = normalize_skill_name(name)
+                conn.execute('''
+                    INSERT OR IGNORE INTO characters (guild_id, user_id, name, normalized_name)
+                    VALUES (?, ?, ?, ?)
+                ''', (guild_id, user_id, name, normalized_name))
+                character_id = conn.execute('''
+                    SELECT id FROM characters WHERE guild_id = ? AND user_id = ? AND normalized_name = ?
+                ''', (guild_id, user_id, normalized_name)).fetchone()[0]
+                conn.execute('UPDATE characters SET name = ? WHERE id = ?', (name, character_id))
+                conn.execute('DELETE FROM character_skills WHERE character_id = ?', (character_id,))
+                conn.executemany('''
+                    INSERT OR REPLACE INTO character_skills (character_id, name, normalized_name, value)
+                    VALUES (?, ?, ?, ?)
+                ''', [(character_id, skill, normalize_skill_name(skill), value) for skill, value in skills.items()])
+                conn.execute('''
+                    UPDATE characters SET active = (id = ?) WHERE guild_id = ? AND user_id = ?
+                ''', (character_id, guild_id, user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error importing character sheet: {e}")
+            return False
+        finally:
+            conn.close()
+            self._invalidate(guild_id, user_id)
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'set_active_character')
+    def set_active(self, guild_id: int, user_id: int, name: str) -> bool:
+        """Switch the active character; False if the user has no character by that name"""
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                row = conn.execute('''
+                    SELECT id FROM characters WHERE guild_id = ? AND user_id = ? AND normalized_name = ?
+                ''', (guild_id, user_id, normalize_skill_name(name))).fetchone()
+                if row is None:
+                    return False
+                conn.execute('''
+                    UPDATE characters SET active = (id = ?) WHERE guild_id = ? AND user_id = ?
+                ''', (row[0], guild_id, user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error switching character: {e}")
+            return False
+        finally:
+            conn.close()
+            self._invalidate(guild_id, user_id)
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'delete_character')
+    def delete_character(self, guild_id: int, user_id: int, name: str) -> bool:
+        """Delete a character and its skills"""
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                row = conn.execute('''
+                    SELECT id FROM characters WHERE guild_id = ? AND user_id = ? AND normalized_name = ?
+                ''', (guild_id, user_id, normalize_skill_name(name))).fetchone()
+                if row is None:
+                    return False
+                conn.execute('DELETE FROM character_skills WHERE character_id = ?', (row[0],))
+                conn.execute('DELETE FROM characters WHERE id = ?', (row[0],))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting character: {e}")
+            return False
+        finally:
+            conn.close()
+            self._invalidate(guild_id, user_id)
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'list_characters')
+    def list_characters(self, guild_id: int, user_id: int) -> List[Tuple[str, bool, int]]:
+        """(name, active, skill count) for each of the user's characters"""
+        conn = connect_db(self.db_path)
+        try:
+            rows = conn.execute('''
+                SELECT c.name, c.active, COUNT(s.normalized_name)
+                FROM characters c
+                LEFT JOIN character_skills s ON s.character_id = c.id
+                WHERE c.guild_id = ? AND c.user_id = ?
+                GROUP BY c.id
+                ORDER BY c.normalized_name
+            ''', (guild_id, user_id)).fetchall()
+            return [(name, bool(active), count) for name, active, count in rows]
+        except Exception as e:
+            logger.error(f"Error listing characters: {e}")
+            return []
+        finally:
+            conn.close()
+
+    def get_party(self, guild_id: int, name: str) -> Optional[str]:
+        """A saved party's entry text, from the cache or one database query"""
+        key = (guild_id, normalize_skill_name(name))
+        with self._lock:
+            if key in self._party_cache:
+                self._party_cache.move_to_end(key)
+                metrics.inc('trpg_cache_hits_total', 'party')
+                return self._party_cache[key]
+
+        metrics.inc('trpg_cache_misses_total', 'party')
+        conn = connect_db(self.db_path)
+        try:
+            row = conn.execute('''
+                SELECT entries FROM parties WHERE guild_id = ? AND normalized_name = ?
+            ''', key).fetchone()
+        except Exception as e:
+            logger.error(f"Error loading party: {e}")
+            return None
+        finally:
+            conn.close()
+        entries = row[0] if row else None
+        with self._lock:
+            self._party_cache[key] = entries
+            if len(self._party_cache) > self.cache_size:
+                self._party_cache.popitem(last=False)
+        return entries
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'save_party')
+    def save_party(self, guild_id: int, name: str, entries: str) -> bool:
+        """Create or replace a saved party"""
+        key = (guild_id, normalize_skill_name(name))
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO parties (guild_id, name, normalized_name, entries)
+                    VALUES (?, ?, ?, ?)
+                ''', (guild_id, name.strip(), key[1], entries))
+            return True
+        except Exception as e:
+            logger.error(f"Error saving party: {e}")
+            return False
+        finally:
+            conn.close()
+            with self._lock:
+                self._party_cache.pop(key, None)
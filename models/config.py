@@ -1,7 +1,26 @@
 import os
 import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, asdict
+from utils.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Default token-bucket settings for command rate limiting (per user and per guild)
+DEFAULT_RATE_LIMIT = {
+    'enabled': True,
+    'user_capacity': 20,
+    'user_refill_per_second': 1.0,
+    'guild_capacity': 200,
+    'guild_refill_per_second': 20.0
+}
 
 
 # Data classes for configuration
@@ -35,6 +54,8 @@ class GuildConfig:
     crit_fail_channel: Optional[int]
     dnd_rules: Dict[str, Any]
     coc_rules: Dict[str, Any]
+    rate_limit: Dict[str, Any]
+    roll_audit: bool = False
 
     def __post_init__(self):
         if not hasattr(self, 'log_channel'):
@@ -61,12 +82,125 @@ class GuildConfig:
                 'skill_divisor_hard': 2,
                 'skill_divisor_extreme': 5
             }
+        if not hasattr(self, 'rate_limit'):
+            self.rate_limit = dict(DEFAULT_RATE_LIMIT)
+        if not hasattr(self, 'roll_audit'):
+            self.roll_audit = False
+
+
+def global_config_from_dict(global_data: Dict[str, Any]) -> GlobalConfig:
+    """Build a GlobalConfig from its JSON representation"""
+    return GlobalConfig(
+        developers=global_data.get('developers', []),
+        restart_mode=global_data.get('restart_mode', 'execv'),
+        restart_service=global_data.get('restart_service'),
+        global_stream_enabled=global_data.get('global_stream_enabled', False),
+        global_stream_channel=global_data.get('global_stream_channel')
+    )
+
+
+def rate_limit_from_dict(config_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Rate limit settings over the defaults; capacities and refill rates must be positive"""
+    settings = {**DEFAULT_RATE_LIMIT, **config_data}
+    for key, default in DEFAULT_RATE_LIMIT.items():
+        value = settings[key]
+        if key != 'enabled' and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            print(f"Invalid rate_limit.{key} {value!r}, using {default}")
+            settings[key] = default
+    return settings
+
+
+def guild_config_from_dict(config_data: Dict[str, Any]) -> GuildConfig:
+    """Build a GuildConfig from its JSON representation"""
+    return GuildConfig(
+        log_channel=config_data.get('log_channel'),
+        stream_mode=config_data.get('stream_mode', 'Batch'),
+        stream_throttle=config_data.get('stream_throttle', 1000),
+        crit_success_channel=config_data.get('crit_success_channel'),
+        crit_fail_channel=config_data.get('crit_fail_channel'),
+        dnd_rules=config_data.get('dnd_rules', {
+            'critical_success': 20,
+            'critical_fail': 1,
+            'max_dice_count': 50,
+            'max_dice_sides': 1000
+        }),
+        coc_rules=config_data.get('coc_rules', {
+            'critical_success': 1,
+            'critical_fail': 100,
+            'skill_divisor_hard': 2,
+            'skill_divisor_extreme': 5
+        }),
+        rate_limit=rate_limit_from_dict(config_data.get('rate_limit', {})),
+        roll_audit=config_data.get('roll_audit', False)
+    )
+
+
+@contextmanager
+def config_file_lock(lock_path: str):
+    """Exclusive inter-process lock around config.json reads and writes"""
+    if fcntl is None:
+        # No advisory locks on this platform; single-process use only
+        yield
+        return
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _ReadOnlyDict(dict):
+    """Rule tables of the shared default; still a dict, so lookups and json.dumps work as usual"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("The shared default GuildConfig is read-only; use ConfigManager.edit_guild_config")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+# Settings seen by every guild that has not changed anything
+class _DefaultGuildConfig(GuildConfig):
+    """Shared, read-only; ConfigManager.edit_guild_config hands out a private copy to change"""
+
+    def __setattr__(self, name: str, value: Any):
+        if getattr(self, '_sealed', False):
+            raise AttributeError("The shared default GuildConfig is read-only; use ConfigManager.edit_guild_config")
+        super().__setattr__(name, value)
+
+
+def _default_guild_config() -> GuildConfig:
+    fields = asdict(guild_config_from_dict({}))
+    default = _DefaultGuildConfig(**{
+        key: _ReadOnlyDict(value) if isinstance(value, dict) else value for key, value in fields.items()
+    })
+    object.__setattr__(default, '_sealed', True)
+    return default
+
+
+def _compact(config_data: Dict[str, Any]) -> str:
+    return json.dumps(config_data, ensure_ascii=False, separators=(',', ':'))
 
 
 # Configuration manager
 class ConfigManager:
-    def __init__(self, config_path: str = "config.json"):
+    """
+    config.json may be shared by several shard processes. Writes are made under an
+    exclusive lock file and merged with the on-disk copy, so each process only
+    overwrites the entries it changed; reads pick up other processes' writes by
+    checking the file's modification time.
+
+    Configured guilds are kept as compact JSON text and materialized into GuildConfig
+    objects on first use. At most max_resident are held, and those unused for idle_ttl
+    seconds are dropped by a sweep that runs at most every sweep_interval seconds.
+    Guilds without stored settings all read one shared default and are never stored.
+    """
+
+    def __init__(self, config_path: str = "config.json", idle_ttl: float = 900.0,
+                 max_resident: int = 1000, sweep_interval: float = 60.0):
         self.config_path = config_path
+        self.lock_path = config_path + ".lock"
         self.global_config = GlobalConfig(
             developers=[],
             restart_mode="execv",
@@ -74,94 +208,202 @@ class ConfigManager:
             global_stream_enabled=False,
             global_stream_channel=None
         )
-        self.guilds = {}
+        self.default_guild_config = _default_guild_config()
+        self._default_text = _compact(asdict(guild_config_from_dict({})))
+        self.idle_ttl = idle_ttl
+        self.max_resident = max_resident
+        self.sweep_interval = sweep_interval
+        # Materialized configs, least recently used first, and when each was last read
+        self.guilds: "OrderedDict[int, GuildConfig]" = OrderedDict()
+        self._last_used: Dict[int, float] = {}
+        self._last_sweep = time.monotonic()
+        # guild_id -> compact JSON of every configured guild
+        self._stored: Dict[int, str] = {}
+        self._global_dirty = False
+        self._dirty_guilds = set()
+        self._loaded_mtime = None
         self.load_config()
 
     def load_config(self):
         """Load configuration from JSON file"""
         if os.path.exists(self.config_path):
             try:
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if 'global' in data and data['global']:
-                        global_data = data['global']
-                        self.global_config = GlobalConfig(
-                            developers=global_data.get('developers', []),
-                            restart_mode=global_data.get('restart_mode', 'execv'),
-                            restart_service=global_data.get('restart_service'),
-                            global_stream_enabled=global_data.get('global_stream_enabled', False),
-                            global_stream_channel=global_data.get('global_stream_channel')
-                        )
-                    if 'guilds' in data and data['guilds']:
-                        self.guilds = {}
-                        for guild_id, config_data in data['guilds'].items():
-                            self.guilds[int(guild_id)] = GuildConfig(
-                                log_channel=config_data.get('log_channel'),
-                                stream_mode=config_data.get('stream_mode', 'Batch'),
-                                stream_throttle=config_data.get('stream_throttle', 1000),
-                                crit_success_channel=config_data.get('crit_success_channel'),
-                                crit_fail_channel=config_data.get('crit_fail_channel'),
-                                dnd_rules=config_data.get('dnd_rules', {
-                                    'critical_success': 20,
-                                    'critical_fail': 1,
-                                    'max_dice_count': 50,
-                                    'max_dice_sides': 1000
-                                }),
-                                coc_rules=config_data.get('coc_rules', {
-                                    'critical_success': 1,
-                                    'critical_fail': 100,
-                                    'skill_divisor_hard': 2,
-                                    'skill_divisor_extreme': 5
-                                })
-                            )
+                with config_file_lock(self.lock_path):
+                    data = self._read_file()
+                if data is not None:
+                    self._apply(data)
             except Exception as e:
                 print(f"Error loading config: {e}")
         else:
             self.save_config()
 
+    def _read_file(self) -> Optional[Dict[str, Any]]:
+        """Read config.json and remember its modification time"""
+        if not os.path.exists(self.config_path):
+            return None
+        self._loaded_mtime = os.stat(self.config_path).st_mtime_ns
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _apply(self, data: Dict[str, Any]):
+        """Adopt on-disk values for every entry this process has not modified"""
+        if 'global' in data and data['global'] and not self._global_dirty:
+            self.global_config = global_config_from_dict(data['global'])
+        stored = {}
+        for guild_id, config_data in (data.get('guilds') or {}).items():
+            text = _compact(asdict(guild_config_from_dict(config_data)))
+            # Entries equal to the defaults (older versions stored one per guild seen) are dropped
+            if text != self._default_text:
+                stored[int(guild_id)] = text
+        for guild_id in self._dirty_guilds:
+            if guild_id in self._stored:
+                stored[guild_id] = self._stored[guild_id]
+            else:
+                stored.pop(guild_id, None)
+        # Materialized entries changed by another process are rebuilt on their next read
+        for guild_id in list(self.guilds):
+            if stored.get(guild_id) != self._stored.get(guild_id):
+                del self.guilds[guild_id]
+                self._last_used.pop(guild_id, None)
+        self._stored = stored
+
+    def reload(self):
+        """Discard in-memory state, including unsaved changes, and read config.json again"""
+        self.guilds.clear()
+        self._last_used.clear()
+        self._stored = {}
+        self._global_dirty = False
+        self._dirty_guilds.clear()
+        self._loaded_mtime = None
+        self.load_config()
+
+    def reload_if_changed(self):
+        """Pick up writes made by other processes (a single stat call when unchanged)"""
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            metrics.inc('trpg_cache_hits_total', 'config_file')
+        else:
+            metrics.inc('trpg_cache_misses_total', 'config_file')
+            try:
+                data = self._read_file()
+                if data is not None:
+                    self._apply(data)
+            except (OSError, ValueError) as e:
+                # A concurrent atomic replace may be in progress; retry on the next read
+                print(f"Error reloading config: {e}")
+
+    @metrics.timed('trpg_config_save_duration_seconds', 'config.json')
     def save_config(self):
         """Save configuration to JSON file"""
         try:
-            data = {
-                'global': asdict(self.global_config),
-                'guilds': {str(guild_id): asdict(config) for guild_id, config in self.guilds.items()}
-            }
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with config_file_lock(self.lock_path):
+                # Merge in entries written by other processes since our last read
+                disk_data = self._read_file()
+                if disk_data is not None:
+                    self._apply(disk_data)
+                data = {
+                    'global': asdict(self.global_config),
+                    'guilds': {str(guild_id): json.loads(text) for guild_id, text in self._stored.items()}
+                }
+                # Write to a temporary file and swap it in so readers never see a torn file
+                tmp_path = f"{self.config_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.config_path)
+                self._loaded_mtime = os.stat(self.config_path).st_mtime_ns
+                self._global_dirty = False
+                self._dirty_guilds.clear()
         except Exception as e:
             print(f"Error saving config: {e}")
 
     def get_guild_config(self, guild_id: int) -> GuildConfig:
-        """Get guild-specific configuration"""
-        if guild_id not in self.guilds:
-            self.guilds[guild_id] = GuildConfig(
-                log_channel=None,
-                stream_mode="Batch",
-                stream_throttle=1000,
-                crit_success_channel=None,
-                crit_fail_channel=None,
-                dnd_rules={
-                    'critical_success': 20,
-                    'critical_fail': 1,
-                    'max_dice_count': 50,
-                    'max_dice_sides': 1000
-                },
-                coc_rules={
-                    'critical_success': 1,
-                    'critical_fail': 100,
-                    'skill_divisor_hard': 2,
-                    'skill_divisor_extreme': 5
-                }
-            )
-        return self.guilds[guild_id]
+        """
+        Get guild-specific configuration. Guilds without stored settings get the shared
+        default, which must not be changed; use edit_guild_config() before modifying.
+        """
+        self.reload_if_changed()
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self.evict_idle(now)
+
+        config = self.guilds.get(guild_id)
+        if config is not None:
+            metrics.inc('trpg_cache_hits_total', 'guild_config')
+            self.guilds.move_to_end(guild_id)
+            self._last_used[guild_id] = now
+            return config
+
+        text = self._stored.get(guild_id)
+        if text is None:
+            metrics.inc('trpg_cache_hits_total', 'guild_config_default')
+            return self.default_guild_config
+
+        metrics.inc('trpg_cache_misses_total', 'guild_config')
+        config = guild_config_from_dict(json.loads(text))
+        self._materialize(guild_id, config, now)
+        return config
+
+    def edit_guild_config(self, guild_id: int) -> GuildConfig:
+        """A config the caller may modify and pass to set_guild_config()"""
+        config = self.get_guild_config(guild_id)
+        if config is self.default_guild_config:
+            return guild_config_from_dict({})
+        return config
+
+    def _materialize(self, guild_id: int, config: GuildConfig, now: float):
+        self.guilds[guild_id] = config
+        self.guilds.move_to_end(guild_id)
+        self._last_used[guild_id] = now
+        while len(self.guilds) > self.max_resident:
+            # The compact copy in _stored stays, so an evicted guild is simply rebuilt later
+            evicted, _ = self.guilds.popitem(last=False)
+            self._last_used.pop(evicted, None)
+            metrics.inc('trpg_cache_evictions_total', 'guild_config')
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop materialized configs unused for idle_ttl seconds; returns how many were dropped"""
+        if now is None:
+            now = time.monotonic()
+        self._last_sweep = now
+        cutoff = now - self.idle_ttl
+        idle = [guild_id for guild_id, last_used in self._last_used.items() if last_used < cutoff]
+        for guild_id in idle:
+            del self.guilds[guild_id]
+            del self._last_used[guild_id]
+        if idle:
+            metrics.inc('trpg_cache_evictions_total', 'guild_config', len(idle))
+        return len(idle)
+
+    def resident_guilds(self) -> List[int]:
+        """Guilds with a materialized config, least recently used first"""
+        return list(self.guilds)
+
+    def configured_count(self) -> int:
+        """Number of guilds with stored settings"""
+        return len(self._stored)
 
     def set_guild_config(self, guild_id: int, config: GuildConfig):
         """Set guild-specific configuration"""
-        self.guilds[guild_id] = config
+        text = _compact(asdict(config))
+        if text == self._default_text:
+            # Back to the defaults: the guild reads the shared default again and is not stored
+            self.guilds.pop(guild_id, None)
+            self._last_used.pop(guild_id, None)
+            self._stored.pop(guild_id, None)
+        else:
+            if isinstance(config, _DefaultGuildConfig):
+                config = guild_config_from_dict(json.loads(text))
+            self._materialize(guild_id, config, time.monotonic())
+            self._stored[guild_id] = text
+        self._dirty_guilds.add(guild_id)
         self.save_config()
 
     def is_developer(self, user_id: int) -> bool:
         """Check if user is a developer"""
+        self.reload_if_changed()
         return user_id in self.global_config.developers
 
     def add_developer(self, user_id: int) -> bool:
@@ -169,6 +411,7 @@ class ConfigManager:
         if user_id in self.global_config.developers:
             return False
         self.global_config.developers.append(user_id)
+        self._global_dirty = True
         self.save_config()
         return True
 
@@ -177,5 +420,6 @@ class ConfigManager:
         if user_id not in self.global_config.developers:
             return False
         self.global_config.developers.remove(user_id)
+        self._global_dirty = True
         self.save_config()
         return True
\ No newline at end of file
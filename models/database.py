@@ -1,6 +1,8 @@
 import sqlite3
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from typing import Callable, Dict, List, Optional, Any
+from utils.metrics import metrics
 
 
 # Initialize logging
@@ -8,6 +10,48 @@ logger = logging.getLogger('trpg_bot')
 logger.setLevel(logging.INFO)
 
 
+# Seconds a connection waits for a lock held by another shard process. Most queries
+# run on the event loop, where a long wait would stall the gateway heartbeat
+SQLITE_BUSY_TIMEOUT = 3.0
+# Longer wait for batched flushes and backups, which run in worker threads
+SQLITE_BACKGROUND_BUSY_TIMEOUT = 30.0
+
+
+def connect_db(db_path: str, timeout: float = SQLITE_BUSY_TIMEOUT, **kwargs) -> sqlite3.Connection:
+    """Open a connection that waits on locks instead of failing with 'database is locked'"""
+    return sqlite3.connect(db_path, timeout=timeout, **kwargs)
+
+
+# Base of the stores that queue rows in memory and write them in batches
+class WriteBehindQueue:
+    """
+    Subclasses keep their queued rows in _pending (guarded by _lock) and write them in
+    flush(). Once flush_size rows are queued, on_full is called so the owner can run
+    flush() in a worker thread; without an on_full hook the queue is flushed inline.
+    """
+
+    def __init__(self, flush_size: int = 100):
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self.on_full: Optional[Callable[[], None]] = None
+
+    def _queued(self, count: int):
+        """Call with the queue length after queueing a row, outside _lock"""
+        if count < self.flush_size:
+            return
+        if self.on_full is not None:
+            self.on_full()
+        else:
+            self.flush()
+
+    def flush(self) -> int:
+        raise NotImplementedError
+
+    def pending_count(self) -> int:
+        """Number of rows not yet written to the database"""
+        return len(self._pending)
+
+
 # Database class for skill management
 class SkillsDB:
     def __init__(self, db_path: str = "skills.db"):
@@ -16,8 +60,10 @@ class SkillsDB:
 
     def init_db(self):
         """Initialize the skills database and create table if it doesn't exist"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect_db(self.db_path)
         cursor = conn.cursor()
+        # WAL lets readers in other processes proceed while one process writes
+        cursor.execute('PRAGMA journal_mode=WAL')
         # Create skills table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS skills (
@@ -33,9 +79,10 @@ class SkillsDB:
         conn.commit()
         conn.close()
 
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'add_skill')
     def add_skill(self, guild_id: int, name: str, skill_type: str, level: str, effect: str) -> bool:
         """Add or update a skill in the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect_db(self.db_path)
         cursor = conn.cursor()
         try:
             normalized_name = name.lower()
@@ -51,9 +98,10 @@ class SkillsDB:
         finally:
             conn.close()
 
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'find_skill')
     def find_skill(self, guild_id: int, name: str) -> Optional[Dict[str, str]]:
         """Find a skill by guild and name (with fuzzy matching)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect_db(self.db_path)
         cursor = conn.cursor()
         try:
             normalized = name.lower()
@@ -83,9 +131,10 @@ class SkillsDB:
         finally:
             conn.close()
 
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'delete_skill')
     def delete_skill(self, guild_id: int, normalized_name: str) -> bool:
         """Delete a skill by guild and normalized name"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect_db(self.db_path)
         cursor = conn.cursor()
         try:
             cursor.execute('''
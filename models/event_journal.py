@@ -0,0 +1,112 @@
+import logging
+import time
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+from models.database import SQLITE_BACKGROUND_BUSY_TIMEOUT, WriteBehindQueue, connect_db
+from utils.metrics import metrics
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+logger.setLevel(logging.INFO)
+
+
+# Journal of roll and critical events, persisted alongside the skills table
+class EventJournal(WriteBehindQueue):
+    def __init__(self, db_path: str = "skills.db", flush_size: int = 100):
+        super().__init__(flush_size)
+        self.db_path = db_path
+        self._pending: List[Tuple[int, Optional[int], Optional[int], str, str, str, float]] = []
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the events table and its time index"""
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER,
+                user_id INTEGER,
+                user_name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_events_guild_time
+            ON events (guild_id, created_at)
+        ''')
+        conn.commit()
+        conn.close()
+
+    def record(self, guild_id: int, channel_id: Optional[int], user_id: Optional[int],
+               user_name: str, kind: str, content: str, created_at: Optional[float] = None):
+        """Queue an event; it is written on the next flush"""
+        row = (guild_id, channel_id, user_id, user_name, kind, content,
+               created_at if created_at is not None else time.time())
+        with self._lock:
+            self._pending.append(row)
+            queued = len(self._pending)
+        self._queued(queued)
+
+    def discard(self) -> int:
+        """Drop queued events without writing them (after a backup restore); returns how many"""
+        with self._lock:
+            dropped, self._pending = len(self._pending), []
+        return dropped
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'flush_events')
+    def flush(self) -> int:
+        """Write all queued events in a single transaction"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        conn = connect_db(self.db_path, timeout=SQLITE_BACKGROUND_BUSY_TIMEOUT)
+        try:
+            conn.executemany('''
+                INSERT INTO events (guild_id, channel_id, user_id, user_name, kind, content, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error flushing events: {e}")
+            # Put the rows back so they are retried on the next flush
+            with self._lock:
+                self._pending[:0] = rows
+            return 0
+        finally:
+            conn.close()
+
+    def iter_events(self, guild_id: int, start: float, end: float,
+                    batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Yield events of a guild in [start, end) ordered by time, fetching in batches"""
+        self.flush()
+        # The generator may be advanced from different worker threads
+        conn = connect_db(self.db_path, check_same_thread=False)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT created_at, channel_id, user_id, user_name, kind, content
+                FROM events
+                WHERE guild_id = ? AND created_at >= ? AND created_at < ?
+                ORDER BY created_at, id
+            ''', (guild_id, start, end))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {
+                        'created_at': row[0],
+                        'channel_id': row[1],
+                        'user_id': row[2],
+                        'user_name': row[3],
+                        'kind': row[4],
+                        'content': row[5]
+                    }
+        finally:
+            conn.close()
@@ -0,0 +1,180 @@
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from core.dice_roller import DiceRoller
+from models.database import connect_db
+from utils.metrics import metrics
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+logger.setLevel(logging.INFO)
+
+MACRO_NAME_PATTERN = re.compile(r'^[\w\-]{1,32}$')
+MAX_GUILD_MACROS = 100
+
+
+def rules_fingerprint(rules: Dict[str, Any]) -> str:
+    """Identifies the dnd_rules a macro was validated against"""
+    return json.dumps(rules, sort_keys=True, separators=(',', ':'))
+
+
+# A saved expression together with its compiled form
+@dataclass
+class Macro:
+    name: str
+    expression: str
+    compiled: Optional[Dict[str, Any]]
+    error: Optional[str] = None  # set when the expression no longer fits the guild's rules
+
+
+# Per-guild dice macros stored next to the skills table
+class MacroDB:
+    """
+    Macros are validated and compiled with DiceRoller.compile_expression when saved, and
+    the compiled form is stored as JSON with the fingerprint of the rules it was checked
+    against. A guild's macros are loaded into memory on first use; later invocations roll
+    the compiled form directly. The in-memory map is dropped when a macro is written, and
+    rebuilt (recompiling against the new rules) when the guild's dnd_rules change.
+    """
+
+    def __init__(self, db_path: str = "skills.db", cache_size: int = 1024):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        # guild_id -> (rules fingerprint, normalized name -> Macro)
+        self._cache: "OrderedDict[int, Tuple[str, Dict[str, Macro]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the macros table"""
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS macros (
+                guild_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                normalized_name TEXT NOT NULL,
+                expression TEXT NOT NULL,
+                compiled TEXT NOT NULL,
+                rules_fingerprint TEXT NOT NULL,
+                UNIQUE(guild_id, normalized_name)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def cached_guilds(self) -> List[int]:
+        """Guilds whose macros are in memory, least recently used first"""
+        with self._lock:
+            return list(self._cache)
+
+    def _invalidate(self, guild_id: int):
+        with self._lock:
+            self._cache.pop(guild_id, None)
+
+    def get_guild_macros(self, guild_id: int, rules: Dict[str, Any]) -> Dict[str, Macro]:
+        """The guild's macros keyed by normalized name, compiled for the given rules"""
+        fingerprint = rules_fingerprint(rules)
+        with self._lock:
+            cached = self._cache.get(guild_id)
+            if cached is not None and cached[0] == fingerprint:
+                self._cache.move_to_end(guild_id)
+                metrics.inc('trpg_cache_hits_total', 'macro')
+                return cached[1]
+
+        metrics.inc('trpg_cache_misses_total', 'macro')
+        macros = self._load_guild_macros(guild_id, rules, fingerprint)
+        with self._lock:
+            self._cache[guild_id] = (fingerprint, macros)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return macros
+
+    def get_macro(self, guild_id: int, name: str, rules: Dict[str, Any]) -> Optional[Macro]:
+        return self.get_guild_macros(guild_id, rules).get(name.strip().lower())
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'load_macros')
+    def _load_guild_macros(self, guild_id: int, rules: Dict[str, Any], fingerprint: str) -> Dict[str, Macro]:
+        conn = connect_db(self.db_path)
+        try:
+            rows = conn.execute('''
+                SELECT name, normalized_name, expression, compiled, rules_fingerprint
+                FROM macros WHERE guild_id = ?
+            ''', (guild_id,)).fetchall()
+            macros: Dict[str, Macro] = {}
+            recompiled = []
+            for name, normalized_name, expression, compiled, stored_fingerprint in rows:
+                if stored_fingerprint == fingerprint:
+                    macros[normalized_name] = Macro(name, expression, json.loads(compiled))
+                    continue
+                # The guild's rules changed since this macro was saved: validate it again
+                try:
+                    compiled_form = DiceRoller.compile_expression(expression, rules)
+                except ValueError as e:
+                    macros[normalized_name] = Macro(name, expression, None, str(e))
+                    continue
+                macros[normalized_name] = Macro(name, expression, compiled_form)
+                recompiled.append((json.dumps(compiled_form), fingerprint, guild_id, normalized_name))
+            if recompiled:
+                with conn:
+                    conn.executemany('''
+                        UPDATE macros SET compiled = ?, rules_fingerprint = ?
+                        WHERE guild_id = ? AND normalized_name = ?
+                    ''', recompiled)
+            return macros
+        except Exception as e:
+            logger.error(f"Error loading macros: {e}")
+            return {}
+        finally:
+            conn.close()
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'add_macro')
+    def add_macro(self, guild_id: int, name: str, expression: str, rules: Dict[str, Any]) -> Macro:
+        """Validate, compile and save a macro; raises ValueError if it is invalid or cannot be saved"""
+        name = name.strip().lstrip('@')
+        if not MACRO_NAME_PATTERN.match(name):
+            raise ValueError("巨集名稱只能包含文字、數字、底線或連字號（最多 32 字）")
+        compiled = DiceRoller.compile_expression(expression, rules)
+        existing = self.get_guild_macros(guild_id, rules)
+        if name.lower() not in existing and len(existing) >= MAX_GUILD_MACROS:
+            raise ValueError(f"巨集數量已達上限 {MAX_GUILD_MACROS}")
+
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO macros (guild_id, name, normalized_name, expression, compiled, rules_fingerprint)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (guild_id, name, name.lower(), expression.strip(), json.dumps(compiled), rules_fingerprint(rules)))
+        except Exception as e:
+            logger.error(f"Error saving macro: {e}")
+            raise ValueError("巨集儲存時發生資料庫錯誤，請稍後再試")
+        finally:
+            conn.close()
+            self._invalidate(guild_id)
+        return Macro(name, expression.strip(), compiled)
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'delete_macro')
+    def delete_macro(self, guild_id: int, name: str) -> bool:
+        """Delete a macro by name"""
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                cursor = conn.execute('''
+                    DELETE FROM macros WHERE guild_id = ? AND normalized_name = ?
+                ''', (guild_id, name.strip().lstrip('@').lower()))
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error deleting macro: {e}")
+            return False
+        finally:
+            conn.close()
+            self._invalidate(guild_id)
+
+    def list_macros(self, guild_id: int, rules: Dict[str, Any]) -> List[Macro]:
+        return sorted(self.get_guild_macros(guild_id, rules).values(), key=lambda macro: macro.name.lower())
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from core.counter_rng import CounterRNG
+from core.dice_roller import DiceRoller
+from models.database import SQLITE_BACKGROUND_BUSY_TIMEOUT, WriteBehindQueue, connect_db
+from utils.metrics import metrics
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+logger.setLevel(logging.INFO)
+
+
+def parse_audit_id(audit_id: str) -> Tuple[int, int]:
+    """Split an audit id "seed-counter" into its two integers"""
+    try:
+        seed_id, counter = audit_id.strip().split('-', 1)
+        return int(seed_id), int(counter)
+    except ValueError:
+        raise ValueError(f"無效的稽核編號：{audit_id}")
+
+
+def seed_commitment(seed: bytes) -> str:
+    """Public fingerprint of a seed, shown without revealing the seed itself"""
+    return hashlib.sha256(seed).hexdigest()[:16]
+
+
+# Audited rolls: a per-guild secret seed plus a counter per roll
+class RollAuditLog(WriteBehindQueue):
+    """
+    Each audited roll takes the next counter of its guild's seed and draws its faces from
+    CounterRNG(seed, counter). Only (seed id, counter), the compiled expression and who
+    rolled are stored; the faces are recomputed on verification, which costs the same
+    regardless of how many rolls came before. Counters are reserved from the database in
+    blocks of reserve_size so a restart never hands out a counter twice, and audit rows
+    are queued and written in batches like the event journal.
+    """
+
+    def __init__(self, db_path: str = "skills.db", flush_size: int = 100, reserve_size: int = 1000):
+        super().__init__(flush_size)
+        self.db_path = db_path
+        self.reserve_size = reserve_size
+        # guild_id -> [seed_id, seed, next counter, end of the reserved block]
+        self._seeds: Dict[int, List[Any]] = {}
+        self._seed_keys: Dict[int, bytes] = {}
+        self._pending: Dict[Tuple[int, int], Tuple[int, int, int, int, str, str, float]] = {}
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the seed and audit tables"""
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS audit_seeds (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                seed BLOB NOT NULL,
+                reserved INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS roll_audit (
+                seed_id INTEGER NOT NULL,
+                counter INTEGER NOT NULL,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                expression TEXT NOT NULL,
+                compiled TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (seed_id, counter)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'reserve_audit_counters')
+    def _reserve(self, guild_id: int, state: Optional[List[Any]]) -> List[Any]:
+        """Reserve the next block of counters, creating the guild's seed on first use"""
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                if state is None:
+                    row = conn.execute('''
+                        SELECT id, seed, reserved FROM audit_seeds
+                        WHERE guild_id = ? ORDER BY id DESC LIMIT 1
+                    ''', (guild_id,)).fetchone()
+                    if row is None:
+                        seed = os.urandom(32)
+                        cursor = conn.execute('''
+                            INSERT INTO audit_seeds (guild_id, seed, created_at) VALUES (?, ?, ?)
+                        ''', (guild_id, seed, time.time()))
+                        row = (cursor.lastrowid, seed, 0)
+                    state = [row[0], bytes(row[1]), row[2], row[2]]
+                end = state[3] + self.reserve_size
+                conn.execute('UPDATE audit_seeds SET reserved = ? WHERE id = ?', (end, state[0]))
+                state[3] = end
+            return state
+        finally:
+            conn.close()
+
+    def begin_roll(self, guild_id: int) -> Tuple[str, CounterRNG]:
+        """Allocate the next counter of the guild's seed; returns (audit id, generator)"""
+        with self._lock:
+            state = self._seeds.get(guild_id)
+            if state is None or state[2] >= state[3]:
+                state = self._seeds[guild_id] = self._reserve(guild_id, state)
+                self._seed_keys[state[0]] = state[1]
+            seed_id, seed, counter = state[0], state[1], state[2]
+            state[2] += 1
+        return f"{seed_id}-{counter}", CounterRNG(seed, counter)
+
+    def record(self, audit_id: str, guild_id: int, user_id: int, expression: str,
+               compiled: Dict[str, Any], created_at: Optional[float] = None):
+        """Queue an audited roll; it is written on the next flush"""
+        seed_id, counter = parse_audit_id(audit_id)
+        row = (seed_id, counter, guild_id, user_id, expression, json.dumps(compiled),
+               created_at if created_at is not None else time.time())
+        with self._lock:
+            self._pending[(seed_id, counter)] = row
+            queued = len(self._pending)
+        self._queued(queued)
+
+    def discard(self) -> int:
+        """
+        Drop queued rows and reserved counter blocks after a backup restore; counters are
+        reserved again from the restored database on the next roll
+        """
+        with self._lock:
+            dropped, self._pending = len(self._pending), {}
+            self._seeds.clear()
+            self._seed_keys.clear()
+        return dropped
+
+    def high_water(self) -> Dict[str, Any]:
+        """Highest seed id ever created and each seed's reserved counter, read before a restore"""
+        conn = connect_db(self.db_path)
+        try:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'audit_seeds'").fetchone()
+            reserved = dict(conn.execute('SELECT id, reserved FROM audit_seeds'))
+        finally:
+            conn.close()
+        return {'sequence': row[0] if row else 0, 'reserved': reserved}
+
+    def advance_to(self, marks: Dict[str, Any]):
+        """
+        After a restore, move seed ids and counters past marks from high_water() so audit
+        ids shown before the restore are never handed out again
+        """
+        self.init_db()
+        conn = connect_db(self.db_path)
+        try:
+            with conn:
+                conn.executemany('UPDATE audit_seeds SET reserved = MAX(reserved, ?) WHERE id = ?',
+                                 [(reserved, seed_id) for seed_id, reserved in marks['reserved'].items()])
+                # AUTOINCREMENT continues after sqlite_sequence, so seeds lost in the restore keep their ids
+                updated = conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'audit_seeds'",
+                                       (marks['sequence'],)).rowcount
+                if not updated and marks['sequence']:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('audit_seeds', ?)",
+                                 (marks['sequence'],))
+        finally:
+            conn.close()
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'flush_roll_audit')
+    def flush(self) -> int:
+        """Write all queued audit rows in a single transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        conn = connect_db(self.db_path, timeout=SQLITE_BACKGROUND_BUSY_TIMEOUT)
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO roll_audit (seed_id, counter, guild_id, user_id, expression, compiled, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', list(pending.values()))
+            conn.commit()
+            return len(pending)
+        except Exception as e:
+            logger.error(f"Error flushing roll audit: {e}")
+            # Put the rows back so they are retried on the next flush
+            with self._lock:
+                for key, row in pending.items():
+                    self._pending.setdefault(key, row)
+            return 0
+        finally:
+            conn.close()
+
+    def _seed_key(self, seed_id: int) -> Optional[bytes]:
+        with self._lock:
+            seed = self._seed_keys.get(seed_id)
+        if seed is not None:
+            return seed
+        conn = connect_db(self.db_path)
+        try:
+            row = conn.execute('SELECT seed FROM audit_seeds WHERE id = ?', (seed_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        with self._lock:
+            self._seed_keys[seed_id] = bytes(row[0])
+        return bytes(row[0])
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'verify_roll')
+    def verify(self, guild_id: int, audit_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up an audited roll of this guild and recompute its results from
+        (seed, counter). Returns None if the id is unknown; raises ValueError if it is malformed.
+        """
+        seed_id, counter = parse_audit_id(audit_id)
+        with self._lock:
+            row = self._pending.get((seed_id, counter))
+        if row is None:
+            conn = connect_db(self.db_path)
+            try:
+                row = conn.execute('''
+                    SELECT seed_id, counter, guild_id, user_id, expression, compiled, created_at
+                    FROM roll_audit WHERE seed_id = ? AND counter = ?
+                ''', (seed_id, counter)).fetchone()
+            finally:
+                conn.close()
+        if row is None or row[2] != guild_id:
+            return None
+        seed = self._seed_key(seed_id)
+        if seed is None:
+            return None
+
+        compiled = json.loads(row[5])
+        return {
+            'audit_id': f"{seed_id}-{counter}",
+            'user_id': row[3],
+            'expression': row[4],
+            'created_at': row[6],
+            'commitment': seed_commitment(seed),
+            'results': DiceRoller.roll_compiled(compiled, CounterRNG(seed, counter))
+        }
+
+    def commitment(self, guild_id: int) -> str:
+        """Commitment of the seed the guild rolls with, creating the seed if it has none yet"""
+        with self._lock:
+            state = self._seeds.get(guild_id)
+            if state is None:
+                state = self._seeds[guild_id] = self._reserve(guild_id, None)
+                self._seed_keys[state[0]] = state[1]
+        return seed_commitment(state[1])
@@ -0,0 +1,351 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from models.database import SQLITE_BACKGROUND_BUSY_TIMEOUT, connect_db
+from utils.metrics import metrics
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+logger.setLevel(logging.INFO)
+
+MAX_SESSION_COMBATANTS = 50
+# Recent HP/SAN changes kept per channel
+HISTORY_SIZE = 10
+
+
+# One tracked participant; replaced with _replace() on every change
+class Combatant(NamedTuple):
+    name: str
+    initiative: Optional[int] = None
+    hp: Optional[int] = None
+    max_hp: Optional[int] = None
+    san: Optional[int] = None
+
+
+# One HP or SAN change
+class StatChange(NamedTuple):
+    name: str
+    stat: str  # "hp" or "san"
+    delta: int
+    value: int
+    user_id: int
+    at: float
+
+
+# Initiative order and stats of one channel
+class ChannelSession:
+    def __init__(self, channel_id: int, guild_id: int):
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.combatants: Dict[str, Combatant] = {}
+        # Sorted (-initiative, insertion number, key); the first entry acts first
+        self.order: List[Tuple[int, int, str]] = []
+        self.turn = 0
+        self.round = 1
+        self.started = False
+        self.history: Deque[StatChange] = deque(maxlen=HISTORY_SIZE)
+        self._sequence = 0
+        self.last_used = time.monotonic()
+
+    def current(self) -> Optional[Combatant]:
+        if not self.order:
+            return None
+        return self.combatants[self.order[self.turn][2]]
+
+    def ordered(self) -> List[Combatant]:
+        return [self.combatants[key] for _, _, key in self.order]
+
+    def _unorder(self, key: str):
+        for index, entry in enumerate(self.order):
+            if entry[2] == key:
+                del self.order[index]
+                # Whoever follows the removed entry keeps or takes over the turn
+                if index < self.turn:
+                    self.turn -= 1
+                if self.turn >= len(self.order):
+                    # The last combatant of the round was removed on their turn
+                    self.turn = 0
+                    if self.started and self.order:
+                        self.round += 1
+                return
+
+    def set_initiative(self, name: str, initiative: int) -> Combatant:
+        key = name.strip().lower()
+        existing = self.combatants.get(key)
+        if existing is None and len(self.combatants) >= MAX_SESSION_COMBATANTS:
+            raise ValueError(f"每個頻道最多追蹤 {MAX_SESSION_COMBATANTS} 名角色")
+        combatant = (existing or Combatant(name.strip()))._replace(initiative=initiative)
+        self.combatants[key] = combatant
+        # Whoever is acting keeps the turn, even when it is the combatant being re-rolled
+        acting = self.order[self.turn][2] if self.started and self.order else None
+        self.order = [entry for entry in self.order if entry[2] != key]
+        self._sequence += 1
+        bisect.insort(self.order, (-initiative, self._sequence, key))
+        if acting is not None:
+            self.turn = next(index for index, entry in enumerate(self.order) if entry[2] == acting)
+        return combatant
+
+    def advance(self) -> Optional[Combatant]:
+        if not self.order:
+            return None
+        if not self.started:
+            # The first advance announces the top of the order
+            self.started = True
+            return self.current()
+        self.turn += 1
+        if self.turn >= len(self.order):
+            self.turn = 0
+            self.round += 1
+        return self.current()
+
+    def remove(self, name: str) -> bool:
+        key = name.strip().lower()
+        if key not in self.combatants:
+            return False
+        self._unorder(key)
+        del self.combatants[key]
+        return True
+
+    def change_stat(self, name: str, stat: str, delta: Optional[int], value: Optional[int], user_id: int) -> StatChange:
+        """Apply a delta to, or set, a combatant's hp or san; creates the combatant if needed"""
+        key = name.strip().lower()
+        combatant = self.combatants.get(key)
+        if combatant is None:
+            if len(self.combatants) >= MAX_SESSION_COMBATANTS:
+                raise ValueError(f"每個頻道最多追蹤 {MAX_SESSION_COMBATANTS} 名角色")
+            combatant = Combatant(name.strip())
+        current = getattr(combatant, stat)
+        if value is None:
+            if current is None:
+                raise ValueError(f"{combatant.name} 尚未設定 {stat.upper()}，請先以 `=數值` 設定")
+            value = current + delta
+        if stat == "hp":
+            max_hp = combatant.max_hp
+            if max_hp is None or (delta is None and value > max_hp):
+                max_hp = value
+            value = max(0, min(value, max_hp))
+            combatant = combatant._replace(hp=value, max_hp=max_hp)
+        else:
+            value = max(0, min(value, 99))
+            combatant = combatant._replace(san=value)
+        self.combatants[key] = combatant
+        change = StatChange(combatant.name, stat, value - (current or 0), value, user_id, time.time())
+        self.history.append(change)
+        return change
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'combatants': [list(combatant) for combatant in self.combatants.values()],
+            'order': [[key, -negated] for negated, _, key in self.order],
+            'turn': self.turn,
+            'round': self.round,
+            'started': self.started,
+            'history': [list(change) for change in self.history]
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, channel_id: int, guild_id: int, data: str) -> 'ChannelSession':
+        raw = json.loads(data)
+        session = cls(channel_id, guild_id)
+        for fields in raw['combatants']:
+            combatant = Combatant(*fields)
+            session.combatants[combatant.name.lower()] = combatant
+        for key, initiative in raw['order']:
+            session._sequence += 1
+            session.order.append((-initiative, session._sequence, key))
+        session.turn = raw['turn']
+        session.round = raw['round']
+        session.started = raw['started']
+        session.history.extend(StatChange(*fields) for fields in raw['history'])
+        return session
+
+
+# Per-channel sessions held in memory and written behind
+class SessionTracker:
+    """
+    Sessions live in an LRU map of at most max_sessions channels. Commands mutate them
+    in memory and only mark the channel dirty; flush() (run periodically off the event
+    loop) serializes every dirty session and writes them in one transaction. Sessions
+    idle for idle_ttl seconds, or pushed out by the size cap, are serialized into the
+    pending writes before they are dropped, and are loaded again from the pending
+    writes or the database the next time their channel uses a command.
+    """
+
+    def __init__(self, db_path: str = "skills.db", idle_ttl: float = 3600.0, max_sessions: int = 2000):
+        self.db_path = db_path
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[int, ChannelSession]" = OrderedDict()
+        self._dirty: Set[int] = set()
+        # channel_id -> (guild_id, data) or None for a deletion, not yet written
+        self._pending: Dict[int, Optional[Tuple[int, str]]] = {}
+        # Rows taken by a flush that is still writing them; readable until it commits
+        self._inflight: Dict[int, Optional[Tuple[int, str]]] = {}
+        self._lock = threading.RLock()
+        self.evicted = 0
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the sessions table"""
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                channel_id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def resident_channels(self) -> List[Tuple[int, int]]:
+        """(channel_id, guild_id) of the sessions in memory, least recently used first"""
+        with self._lock:
+            return [(channel_id, session.guild_id) for channel_id, session in self._sessions.items()]
+
+    def get(self, channel_id: int, guild_id: int, create: bool = False) -> Optional[ChannelSession]:
+        """The channel's session from memory, the pending writes or the database"""
+        with self._lock:
+            session = self._sessions.get(channel_id)
+            if session is not None:
+                self._sessions.move_to_end(channel_id)
+                session.last_used = time.monotonic()
+                metrics.inc('trpg_cache_hits_total', 'session')
+                return session
+            metrics.inc('trpg_cache_misses_total', 'session')
+            data = self._unwritten(channel_id)
+            if data is False:
+                data = self._load(channel_id)
+            if data is not None:
+                session = ChannelSession.from_json(channel_id, guild_id, data)
+            elif create:
+                session = ChannelSession(channel_id, guild_id)
+            else:
+                return None
+            self._sessions[channel_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._evict(next(iter(self._sessions)))
+            return session
+
+    def _unwritten(self, channel_id: int):
+        """Data queued for or being written by a flush (None for a deletion); False if there is none"""
+        for queue in (self._pending, self._inflight):
+            if channel_id in queue:
+                row = queue[channel_id]
+                return row[1] if row else None
+        return False
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'load_session')
+    def _load(self, channel_id: int) -> Optional[str]:
+        conn = connect_db(self.db_path)
+        try:
+            row = conn.execute('SELECT data FROM sessions WHERE channel_id = ?', (channel_id,)).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error loading session: {e}")
+            return None
+        finally:
+            conn.close()
+
+    @contextmanager
+    def editing(self, channel_id: int, guild_id: int) -> Iterator[ChannelSession]:
+        """
+        The channel's session, created if needed, locked against a concurrent flush while
+        the caller changes it; it is written on the next flush
+        """
+        with self._lock:
+            session = self.get(channel_id, guild_id, create=True)
+            yield session
+            self._dirty.add(channel_id)
+
+    def end(self, channel_id: int) -> bool:
+        """Drop a channel's session; the row is deleted on the next flush"""
+        with self._lock:
+            existed = self._sessions.pop(channel_id, None) is not None
+            if not existed:
+                data = self._unwritten(channel_id)
+                existed = (self._load(channel_id) if data is False else data) is not None
+            self._dirty.discard(channel_id)
+            self._pending[channel_id] = None
+            return existed
+
+    def _evict(self, channel_id: int):
+        session = self._sessions.pop(channel_id)
+        if channel_id in self._dirty:
+            self._dirty.discard(channel_id)
+            self._pending[channel_id] = (session.guild_id, session.to_json())
+        self.evicted += 1
+        metrics.inc('trpg_cache_evictions_total', 'session')
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop sessions unused for idle_ttl seconds, queueing their unsaved changes"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            idle = [channel_id for channel_id, session in self._sessions.items()
+                    if now - session.last_used >= self.idle_ttl]
+            for channel_id in idle:
+                self._evict(channel_id)
+        return len(idle)
+
+    def pending_count(self) -> int:
+        """Number of sessions with changes not yet written to the database"""
+        return len(self._dirty) + len(self._pending)
+
+    def discard(self) -> int:
+        """Forget every resident session and unwritten change (after a backup restore)"""
+        with self._lock:
+            dropped = self.pending_count()
+            self._sessions.clear()
+            self._dirty.clear()
+            self._pending.clear()
+        return dropped
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'flush_sessions')
+    def flush(self) -> int:
+        """Evict idle sessions, then write every changed session in a single transaction"""
+        self.evict_idle()
+        with self._lock:
+            for channel_id in self._dirty:
+                session = self._sessions[channel_id]
+                self._pending[channel_id] = (session.guild_id, session.to_json())
+            self._dirty.clear()
+            pending, self._pending = self._pending, {}
+            self._inflight = pending
+        if not pending:
+            return 0
+        now = time.time()
+        conn = connect_db(self.db_path, timeout=SQLITE_BACKGROUND_BUSY_TIMEOUT)
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO sessions (channel_id, guild_id, data, updated_at) VALUES (?, ?, ?, ?)
+                ''', [(channel_id, row[0], row[1], now) for channel_id, row in pending.items() if row is not None])
+                conn.executemany('DELETE FROM sessions WHERE channel_id = ?',
+                                 [(channel_id,) for channel_id, row in pending.items() if row is None])
+            return len(pending)
+        except Exception as e:
+            logger.error(f"Error flushing sessions: {e}")
+            # Keep newer changes made while writing; retry the rest on the next flush
+            with self._lock:
+                for channel_id, row in pending.items():
+                    self._pending.setdefault(channel_id, row)
+            return 0
+        finally:
+            conn.close()
+            with self._lock:
+                self._inflight = {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {'resident': len(self._sessions), 'dirty': len(self._dirty), 'evicted': self.evicted}
@@ -1,4 +1,12 @@
 # Utils package initialization
-from .bot import TRPGDiscordBot
+# TRPGDiscordBot is resolved lazily so that light helpers such as utils.metrics
+# can be imported from models without importing discord.py or creating a cycle
 
-__all__ = ['TRPGDiscordBot']
\ No newline at end of file
+__all__ = ['TRPGDiscordBot']
+
+
+def __getattr__(name):
+    if name == 'TRPGDiscordBot':
+        from .bot import TRPGDiscordBot
+        return TRPGDiscordBot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+from models.config import config_file_lock, global_config_from_dict, guild_config_from_dict
+from models.database import SQLITE_BACKGROUND_BUSY_TIMEOUT, connect_db
+from utils.metrics import metrics
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+logger.setLevel(logging.INFO)
+
+MANIFEST_NAME = "manifest.json"
+# Written by a cluster worker so the supervisor restores with every cluster stopped
+RESTORE_REQUEST_NAME = "restore-request.json"
+# Tables a snapshot must contain to be restored
+REQUIRED_TABLES = ('skills', 'events')
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def env_number(name: str, default, parse=int):
+    """Non-negative number from an environment variable; bad values are logged and fall back to default"""
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        value = parse(raw)
+    except ValueError:
+        value = -1
+    if not math.isfinite(value) or value < 0:
+        logger.error(f"Invalid {name} {raw!r}; using the default {default}")
+        return default
+    return value
+
+
+# Generations of skills.db and config.json taken while the bot is running
+class BackupManager:
+    """
+    The database is copied with SQLite's online backup API, pages_per_step pages at a
+    time with step_pause seconds between steps, so the copy runs in a worker thread
+    without holding the database lock; writers proceed between steps (a step that
+    sees a concurrent write restarts the copy). config.json is copied under its
+    inter-process lock, so it always matches a complete save. Each generation is
+    written to a temporary directory and renamed into place with a manifest of
+    checksums, and only the newest keep generations are retained.
+    """
+
+    def __init__(self, db_path: str = "skills.db", config_path: str = "config.json",
+                 backup_dir: str = "backups", keep: int = 7,
+                 pages_per_step: int = 64, step_pause: float = 0.005):
+        self.db_path = db_path
+        self.config_path = config_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+
+    def _path(self, name: str) -> str:
+        """Directory of an existing generation; KeyError for unknown names"""
+        if name not in self.list_backups():
+            raise KeyError(f"找不到備份 {name}")
+        return os.path.join(self.backup_dir, name)
+
+    @classmethod
+    def from_env(cls) -> 'BackupManager':
+        """Manager for BACKUP_DIR and BACKUP_KEEP"""
+        return cls(backup_dir=os.getenv("BACKUP_DIR", "backups"), keep=env_number("BACKUP_KEEP", 7))
+
+    def _created_at(self, name: str) -> float:
+        try:
+            with open(os.path.join(self.backup_dir, name, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                return float(json.load(f).get('created_at', 0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            return 0.0
+
+    def list_backups(self) -> List[str]:
+        """Names of complete generations, oldest first by their manifest's creation time"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [
+            name for name in os.listdir(self.backup_dir)
+            if os.path.isfile(os.path.join(self.backup_dir, name, MANIFEST_NAME))
+        ]
+        # Names only order to the second, and same-second suffixes do not sort as numbers
+        return sorted(names, key=lambda name: (self._created_at(name), name))
+
+    def manifest(self, name: str) -> Dict[str, Any]:
+        with open(os.path.join(self._path(name), MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _copy_database(self, source_path: str, target_path: str) -> int:
+        """Copy one SQLite database into another in page steps; returns the page count"""
+        pages = 0
+
+        def progress(status, remaining, total):
+            nonlocal pages
+            pages = total
+
+        source = connect_db(source_path, timeout=SQLITE_BACKGROUND_BUSY_TIMEOUT)
+        target = connect_db(target_path, timeout=SQLITE_BACKGROUND_BUSY_TIMEOUT)
+        try:
+            source.backup(target, pages=self.pages_per_step, progress=progress, sleep=self.step_pause)
+        finally:
+            target.close()
+            source.close()
+        return pages
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'backup')
+    def create(self, prune: bool = True) -> str:
+        """Take a new generation and, unless prune is False, apply retention; returns its name"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+        suffix = 1
+        while os.path.exists(os.path.join(self.backup_dir, name)):
+            suffix += 1
+            name = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{suffix}"
+        partial = os.path.join(self.backup_dir, f".{name}.partial")
+        os.makedirs(partial)
+        try:
+            db_copy = os.path.join(partial, os.path.basename(self.db_path))
+            pages = self._copy_database(self.db_path, db_copy)
+
+            config_copy = None
+            if os.path.exists(self.config_path):
+                config_copy = os.path.join(partial, os.path.basename(self.config_path))
+                with config_file_lock(self.config_path + ".lock"):
+                    shutil.copyfile(self.config_path, config_copy)
+
+            manifest = {
+                'created_at': time.time(),
+                'pages': pages,
+                'files': {
+                    os.path.basename(path): _sha256(path)
+                    for path in (db_copy, config_copy) if path is not None
+                }
+            }
+            with open(os.path.join(partial, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(partial, os.path.join(self.backup_dir, name))
+        except Exception:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+        if prune:
+            self.prune()
+        return name
+
+    def prune(self) -> List[str]:
+        """Delete all but the newest keep generations, and leftovers of interrupted backups"""
+        removed = self.list_backups()[:-self.keep] if self.keep > 0 else []
+        for name in removed:
+            shutil.rmtree(os.path.join(self.backup_dir, name), ignore_errors=True)
+        for name in os.listdir(self.backup_dir):
+            if name.endswith('.partial'):
+                shutil.rmtree(os.path.join(self.backup_dir, name), ignore_errors=True)
+        return removed
+
+    def validate(self, name: str) -> List[str]:
+        """Problems that make a generation unsafe to restore; an empty list means it is valid"""
+        path = self._path(name)
+        try:
+            manifest = self.manifest(name)
+        except ValueError as e:
+            return [f"manifest 無法解析：{e}"]
+
+        problems = []
+        db_name = os.path.basename(self.db_path)
+        if db_name not in manifest['files']:
+            return [f"缺少 {db_name}"]
+        for filename, checksum in manifest['files'].items():
+            file_path = os.path.join(path, filename)
+            if not os.path.exists(file_path):
+                problems.append(f"缺少 {filename}")
+            elif _sha256(file_path) != checksum:
+                problems.append(f"{filename} 校驗碼不符")
+        if problems:
+            return problems
+
+        # Opened immutable so validating neither changes its checksum nor leaves -wal/-shm files behind
+        conn = sqlite3.connect(f"file:{os.path.join(path, db_name)}?mode=ro&immutable=1", uri=True)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                problems.append(f"資料庫完整性檢查失敗：{result}")
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            problems.extend(f"資料庫缺少資料表 {table}" for table in REQUIRED_TABLES if table not in tables)
+        except sqlite3.DatabaseError as e:
+            problems.append(f"資料庫無法讀取：{e}")
+        finally:
+            conn.close()
+
+        config_name = os.path.basename(self.config_path)
+        if config_name in manifest['files']:
+            try:
+                with open(os.path.join(path, config_name), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                global_config_from_dict(data.get('global') or {})
+                for config_data in (data.get('guilds') or {}).values():
+                    guild_config_from_dict(config_data)
+            except (ValueError, TypeError, AttributeError) as e:
+                problems.append(f"設定檔無法解析：{e}")
+        return problems
+
+    @metrics.timed('trpg_sqlite_query_duration_seconds', 'restore')
+    def restore(self, name: str):
+        """
+        Validate a generation and copy it over the live files. The database is written
+        through the backup API, so other connections see either the old or the restored
+        content; config.json is swapped in atomically under its lock. Roll audit seed ids
+        and counters are kept past the live database's, so audit ids handed out since the
+        backup are not reused.
+        """
+        problems = self.validate(name)
+        if problems:
+            raise ValueError("；".join(problems))
+        from models.roll_audit import RollAuditLog
+        path = self._path(name)
+        audit = RollAuditLog(self.db_path)
+        marks = audit.high_water()
+        self._copy_database(os.path.join(path, os.path.basename(self.db_path)), self.db_path)
+        audit.advance_to(marks)
+
+        config_copy = os.path.join(path, os.path.basename(self.config_path))
+        if os.path.exists(config_copy):
+            tmp_path = f"{self.config_path}.{os.getpid()}.tmp"
+            with config_file_lock(self.config_path + ".lock"):
+                shutil.copyfile(config_copy, tmp_path)
+                os.replace(tmp_path, self.config_path)
+        logger.info(f"Restored backup {name}")
+
+    def request_restore(self, name: str):
+        """Leave a restore for the cluster supervisor to carry out once every worker has stopped"""
+        self._path(name)
+        os.makedirs(self.backup_dir, exist_ok=True)
+        with open(os.path.join(self.backup_dir, RESTORE_REQUEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump({'name': name, 'requested_at': time.time()}, f)
+
+    def take_restore_request(self) -> Optional[str]:
+        """Name of a requested restore, consuming the request"""
+        path = os.path.join(self.backup_dir, RESTORE_REQUEST_NAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['name']
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Unreadable restore request: {e}")
+            return None
+        finally:
+            os.remove(path)
+
+    def describe(self, name: str) -> Optional[str]:
+        """One line per generation for listings"""
+        try:
+            manifest = self.manifest(name)
+        except (KeyError, OSError, ValueError):
+            return None
+        size = sum(
+            os.path.getsize(os.path.join(self.backup_dir, name, filename))
+            for filename in manifest['files']
+            if os.path.exists(os.path.join(self.backup_dir, name, filename))
+        )
+        return f"{name}  {size / 1024:.1f} KB  {manifest.get('pages', 0)} pages"
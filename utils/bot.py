@@ -1,9 +1,36 @@
 import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
 import logging
+import threading
+import multiprocessing
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
 import discord
 from discord.ext import commands
-from models.config import ConfigManager
-from models.database import SkillsDB
+from utils.global_stream import GlobalStreamAggregator
+from utils.command_tree import InstrumentedCommandTree
+from utils.metrics import metrics, MetricsServer
+from utils.startup import startup_profiler
+from utils.restart import StateHandoff, RESTART_EXIT_CODE, RESTORE_EXIT_CODE
+from utils.memory_profile import client_options, DEFAULT_MEMORY_PROFILE
+from utils.rate_limit import TokenBucketLimiter
+from utils.loop_monitor import LoopLagMonitor, LoopWatchdog
+from utils.backup import BackupManager, env_number
+
+if TYPE_CHECKING:
+    from models.config import ConfigManager
+    from models.database import SkillsDB
+    from models.event_journal import EventJournal
+    from models.character_sheet import CharacterSheetDB
+    from models.macros import MacroDB
+    from models.roll_audit import RollAuditLog
+    from models.session_tracker import SessionTracker
+
+# Text prefixes handled by the quick roll fast path
+QUICK_ROLL_PREFIXES = ('!r ', '!coc ')
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -13,39 +40,467 @@ logger.setLevel(logging.INFO)
 
 # Bot class
 class TRPGDiscordBot(commands.Bot):
-    def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True  # Required to read message content
-        intents.guilds = True
+    def __init__(self, sync_commands: bool = True, memory_profile: Optional[str] = None,
+                 cluster_index: int = 0, **options):
+        # Intents and gateway caches come from the memory profile; explicit options win
+        self.memory_profile = memory_profile or os.getenv("MEMORY_PROFILE", DEFAULT_MEMORY_PROFILE)
+        client = client_options(self.memory_profile)
+        client.update(options)
+        
+        super().__init__(command_prefix="!", tree_cls=InstrumentedCommandTree, **client)
+        
+        # Only one process of a sharded deployment needs to push the global command list
+        self.sync_commands = sync_commands
+        # Position of this process among the shard clusters (0 when not clustered)
+        self.cluster_index = cluster_index
+        self.command_hash_path = os.getenv("COMMAND_HASH_PATH", ".command_tree.sha256")
+        
+        # Components are created on first use, or prewarmed in worker threads during login
+        self._components: Dict[str, Any] = {}
+        self._component_locks = {name: threading.Lock() for name in ('config', 'skills_db', 'journal', 'sheets', 'macros', 'audit', 'sessions')}
+        self._prewarm_task = None
+        self._journal_flush_task = None
+        # Set (from any thread) to run the periodic flush early when a write queue fills up
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        self._flush_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.global_stream = GlobalStreamAggregator(self)
+        self.metrics_server = None
+        self.rate_limiter = TokenBucketLimiter()
+        self.loop_monitor = LoopLagMonitor()
+        # Optional stall detector, started at boot when WATCHDOG_THRESHOLD_MS is set
+        watchdog_threshold = os.getenv("WATCHDOG_THRESHOLD_MS")
+        self.watchdog = LoopWatchdog()
+        self._watchdog_at_boot = False
+        if watchdog_threshold:
+            try:
+                threshold_ms = float(watchdog_threshold)
+            except ValueError:
+                threshold_ms = 0.0
+            if threshold_ms > 0:
+                self.watchdog = LoopWatchdog(threshold=threshold_ms / 1000)
+                self._watchdog_at_boot = True
+            else:
+                logger.error(f"Invalid WATCHDOG_THRESHOLD_MS {watchdog_threshold!r}; the watchdog stays off")
+        # Scheduled online backups of skills.db and config.json; 0 minutes disables them
+        self.backups = BackupManager.from_env()
+        self.backup_interval = env_number("BACKUP_INTERVAL_MINUTES", 360.0, float) * 60
+        self._backup_task = None
+        
+        # State carried across /admin restart; each shard cluster keeps its own snapshot
+        shard_ids = options.get('shard_ids')
+        snapshot_name = f"restart_state.{min(shard_ids)}.json" if shard_ids else "restart_state.json"
+        self.handoff = StateHandoff(os.getenv("RESTART_STATE_PATH", snapshot_name))
+        self.handoff.register('global_stream', self.global_stream.dump_state, self.global_stream.load_state)
+        # Rate limits survive a restart so it cannot be used to reset them
+        self.handoff.register('rate_limits', self.rate_limiter.dump_state, self.rate_limiter.load_state)
+        self.handoff.register('warm_caches', self.dump_warm_keys, self.load_warm_keys)
+        self._warm_task = None
+        self._restarting = False
+        
+    def _component(self, name: str, factory: Callable[[], Any]) -> Any:
+        component = self._components.get(name)
+        if component is None:
+            with self._component_locks[name]:
+                component = self._components.get(name)
+                if component is None:
+                    with startup_profiler.phase(f"{name} init"):
+                        component = factory()
+                    self._components[name] = component
+        return component
+    
+    @property
+    def config_manager(self) -> 'ConfigManager':
+        def create():
+            from models.config import ConfigManager
+            return ConfigManager()
+        return self._component('config', create)
+    
+    @property
+    def skills_db(self) -> 'SkillsDB':
+        def create():
+            from models.database import SkillsDB
+            return SkillsDB()
+        return self._component('skills_db', create)
+    
+    @property
+    def event_journal(self) -> 'EventJournal':
+        def create():
+            from models.event_journal import EventJournal
+            journal = EventJournal()
+            journal.on_full = self.request_flush
+            return journal
+        return self._component('journal', create)
+    
+    @property
+    def character_sheets(self) -> 'CharacterSheetDB':
+        def create():
+            from models.character_sheet import CharacterSheetDB
+            return CharacterSheetDB()
+        return self._component('sheets', create)
+    
+    @property
+    def macros(self) -> 'MacroDB':
+        def create():
+            from models.macros import MacroDB
+            return MacroDB()
+        return self._component('macros', create)
+    
+    @property
+    def roll_audit(self) -> 'RollAuditLog':
+        def create():
+            from models.roll_audit import RollAuditLog
+            audit = RollAuditLog()
+            audit.on_full = self.request_flush
+            return audit
+        return self._component('audit', create)
+    
+    @property
+    def sessions(self) -> 'SessionTracker':
+        def create():
+            from models.session_tracker import SessionTracker
+            return SessionTracker()
+        return self._component('sessions', create)
+    
+    async def _prewarm_components(self):
+        """Load config and initialize the database concurrently, off the event loop"""
+        await asyncio.gather(
+            asyncio.to_thread(lambda: self.config_manager),
+            asyncio.to_thread(lambda: self.skills_db),
+            asyncio.to_thread(lambda: self.event_journal),
+            asyncio.to_thread(lambda: self.character_sheets),
+            asyncio.to_thread(lambda: self.macros),
+            asyncio.to_thread(lambda: self.roll_audit),
+            asyncio.to_thread(lambda: self.sessions),
+        )
+    
+    def dump_warm_keys(self) -> Dict[str, Any]:
+        """Keys of the resident cache entries, for the restart snapshot"""
+        keys: Dict[str, Any] = {}
+        if 'config' in self._components:
+            keys['guild_configs'] = self.config_manager.resident_guilds()
+        if 'sheets' in self._components:
+            keys['sheets'] = self.character_sheets.cached_users()
+        if 'macros' in self._components:
+            keys['macros'] = self.macros.cached_guilds()
+        if 'sessions' in self._components:
+            keys['sessions'] = self.sessions.resident_channels()
+        return keys
+    
+    def load_warm_keys(self, keys: Dict[str, Any]):
+        """
+        Reload the caches the previous process had warm. Guild configs are parsed from
+        memory on the loop; sheets, macros and sessions are read in a worker thread in the
+        background, so startup does not wait for them.
+        """
+        for guild_id in keys.get('guild_configs', []):
+            self.config_manager.get_guild_config(guild_id)
+        macro_rules = [(guild_id, self.config_manager.get_guild_config(guild_id).dnd_rules)
+                       for guild_id in keys.get('macros', [])]
+        sheets = keys.get('sheets', [])
+        sessions = keys.get('sessions', [])
         
-        super().__init__(command_prefix="!", intents=intents)
+        def warm():
+            for guild_id, user_id in sheets:
+                self.character_sheets.get_active_sheet(guild_id, user_id)
+            for guild_id, rules in macro_rules:
+                self.macros.get_guild_macros(guild_id, rules)
+            for channel_id, guild_id in sessions:
+                self.sessions.get(channel_id, guild_id)
         
-        # Initialize components
-        self.config_manager = ConfigManager()
-        self.skills_db = SkillsDB()
+        async def warm_in_background():
+            try:
+                await asyncio.to_thread(warm)
+            except Exception as e:
+                logger.error(f"Failed to prewarm caches after restart: {e}")
         
+        if sheets or macro_rules or sessions:
+            self._warm_task = asyncio.create_task(warm_in_background())
+    
+    async def login(self, token: str):
+        """Overlap disk initialization with the HTTP login"""
+        self._prewarm_task = asyncio.ensure_future(self._prewarm_components())
+        startup_profiler.begin('login')
+        await super().login(token)
+    
     async def setup_hook(self):
         """Setup hook for the bot"""
+        startup_profiler.end('login')
+        with startup_profiler.phase('storage wait'):
+            await self._prewarm_task
+        
         # Add cogs
+        startup_profiler.begin('cogs')
         from cogs.dice_commands import DiceCommands
         from cogs.skill_commands import SkillCommands
         from cogs.log_commands import LogCommands
         from cogs.admin_commands import AdminCommands
         from cogs.help_commands import HelpCommands
+        from cogs.sheet_commands import SheetCommands
+        from cogs.macro_commands import MacroCommands
+        from cogs.session_commands import SessionCommands
         
         await self.add_cog(DiceCommands(self))
         await self.add_cog(SkillCommands(self))
         await self.add_cog(LogCommands(self))
         await self.add_cog(AdminCommands(self))
         await self.add_cog(HelpCommands(self))
+        await self.add_cog(SheetCommands(self))
+        await self.add_cog(MacroCommands(self))
+        await self.add_cog(SessionCommands(self))
+        startup_profiler.end('cogs')
+        
+        # Rehydrate state handed over by the previous process (cogs have registered their sections)
+        restored = self.handoff.restore()
+        if restored:
+            logger.info(f"Restored restart state: {', '.join(restored)}")
+        
+        # Synchronize slash commands with Discord, skipped when the tree is unchanged
+        if self.sync_commands:
+            with startup_profiler.phase('sync'):
+                await self.sync_command_tree()
+        
+        # Report app command errors to the log and the global stream
+        self.tree.error(self.on_app_command_error)
+        
+        # Periodically write queued journal events
+        self.start_flusher()
+        # Like command sync, only the process holding shard 0 takes scheduled backups
+        if self.sync_commands and self.backup_interval > 0:
+            self._backup_task = asyncio.create_task(self._backup_periodically())
+        self.global_stream.start()
+        self.loop_monitor.start()
+        if self._watchdog_at_boot:
+            self.watchdog.start()
         
-        # Synchronize slash commands with Discord
-        await self.tree.sync()
+        # Optional local Prometheus endpoint; metrics are per process, so each shard
+        # cluster serves its own on METRICS_PORT + its cluster index
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port:
+            port = int(metrics_port) + self.cluster_index
+            self.metrics_server = MetricsServer(metrics, os.getenv("METRICS_HOST", "127.0.0.1"), port)
+            await self.metrics_server.start()
         
-        logger.info("Bot setup complete")
+        timings = startup_profiler.durations()
+        logger.info("Bot setup complete (" + ", ".join(f"{name}: {seconds * 1000:.1f} ms" for name, seconds in timings.items()) + ")")
+        startup_profiler.begin('gateway connect')
+    
+    def command_tree_hash(self) -> str:
+        """Stable hash of the serialized global command tree"""
+        payload = []
+        for command in self.tree.get_commands():
+            try:
+                payload.append(command.to_dict(self.tree))
+            except TypeError:
+                # discord.py < 2.4 takes no tree argument
+                payload.append(command.to_dict())
+        payload.sort(key=lambda data: (data.get('type', 1), data['name']))
+        serialized = json.dumps(
+            {'application_id': self.application_id, 'commands': payload},
+            sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+    
+    async def sync_command_tree(self, force: bool = False) -> bool:
+        """Sync the command tree if its hash differs from the last synced one; returns whether it synced"""
+        digest = self.command_tree_hash()
+        stored = None
+        if not force and os.path.exists(self.command_hash_path):
+            with open(self.command_hash_path, 'r', encoding='utf-8') as f:
+                stored = f.read().strip()
+        if stored == digest:
+            logger.info("Command tree unchanged, skipping sync")
+            return False
+        
+        synced = await self.tree.sync()
+        with open(self.command_hash_path, 'w', encoding='utf-8') as f:
+            f.write(digest)
+        logger.info(f"Synced {len(synced)} commands (hash {digest[:12]})")
+        return True
+    
+    def start_flusher(self):
+        """Start the periodic write-behind flush on the running loop"""
+        self._flush_wakeup = asyncio.Event()
+        self._flush_loop = asyncio.get_running_loop()
+        self._journal_flush_task = asyncio.create_task(self._flush_journal_periodically())
+    
+    def request_flush(self):
+        """Wake the periodic flush early; safe to call from any thread"""
+        if self._flush_loop is not None and not self._flush_loop.is_closed():
+            self._flush_loop.call_soon_threadsafe(self._flush_wakeup.set)
+    
+    async def _flush_journal_periodically(self, interval: float = 5.0):
+        """
+        Flush the event journal, roll audit and session trackers in a worker thread at a
+        fixed interval, or as soon as a full write queue calls request_flush()
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            if self.event_journal.pending_count():
+                await asyncio.to_thread(self.event_journal.flush)
+            if self.roll_audit.pending_count():
+                await asyncio.to_thread(self.roll_audit.flush)
+            # Also runs with nothing pending so idle sessions are evicted
+            if len(self.sessions) or self.sessions.pending_count():
+                await asyncio.to_thread(self.sessions.flush)
+    
+    async def _backup_periodically(self):
+        """Take a backup generation in a worker thread every backup_interval seconds"""
+        while True:
+            await asyncio.sleep(self.backup_interval)
+            try:
+                await self.create_backup()
+            except Exception as e:
+                logger.error(f"Scheduled backup failed: {e}")
+    
+    async def create_backup(self, prune: bool = True) -> str:
+        """Write queued rows, then copy the database and config without blocking the loop"""
+        await asyncio.to_thread(self.event_journal.flush)
+        await asyncio.to_thread(self.roll_audit.flush)
+        await asyncio.to_thread(self.sessions.flush)
+        name = await asyncio.to_thread(self.backups.create, prune)
+        logger.info(f"Backup {name} written to {self.backups.backup_dir}")
+        return name
+    
+    async def restore_backup(self, name: str):
+        """
+        Restore a validated generation, keeping a backup of the current state first, then
+        restart so every cache is rebuilt from the restored files. A cluster worker hands
+        the restore to the supervisor, which stops every cluster before copying the files
+        and then starts them all, so no cluster writes stale caches over the restored data.
+        """
+        problems = await asyncio.to_thread(self.backups.validate, name)
+        if problems:
+            raise ValueError("；".join(problems))
+        clustered = multiprocessing.parent_process() is not None
+        if not clustered:
+            self.check_restart_config()
+        # Retention is applied later so the generation being restored is not pruned
+        safety = await self.create_backup(prune=False)
+        logger.info(f"Saved current state as {safety} before restoring {name}")
+        
+        if clustered:
+            await asyncio.to_thread(self.backups.request_restore, name)
+            self.handoff.write_snapshot()
+            self._restarting = True
+            await self.close()
+            logging.shutdown()
+            os._exit(RESTORE_EXIT_CODE)
+        
+        # Stop periodic writes while the database is replaced, then drop everything
+        # buffered before the restore instead of writing it into the restored files
+        if self._journal_flush_task:
+            self._journal_flush_task.cancel()
+        try:
+            await asyncio.to_thread(self.backups.restore, name)
+        except Exception:
+            self._journal_flush_task = asyncio.create_task(self._flush_journal_periodically())
+            raise
+        self.event_journal.discard()
+        self.roll_audit.discard()
+        self.sessions.discard()
+        self.config_manager.reload()
+        await self.restart()
+    
+    async def on_message(self, message: discord.Message):
+        """
+        Quick text rolls ("!r", "!coc"). No prefix commands are registered, so the default
+        process_commands pass is skipped and ordinary chat is rejected by one prefix check.
+        """
+        if not message.content.startswith(QUICK_ROLL_PREFIXES) or message.author.bot:
+            return
+        dice = self.get_cog('DiceCommands')
+        if dice is not None:
+            await dice.quick_roll(message)
+    
+    def _observe_command(self, interaction: discord.Interaction, command_name: str):
+        started_at = interaction.extras.get('started_at')
+        if started_at is not None:
+            metrics.observe('trpg_command_duration_seconds', command_name, time.perf_counter() - started_at)
+    
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        """Record the latency of a successful app command"""
+        self._observe_command(interaction, command.qualified_name)
+    
+    async def on_app_command_error(self, interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
+        """Log app command errors and mirror them to the global stream"""
+        command = interaction.command.qualified_name if interaction.command else "unknown"
+        self._observe_command(interaction, command)
+        metrics.inc('trpg_command_errors_total', command)
+        logger.error(f"Error in /{command}: {error}", exc_info=error)
+        guild_id = interaction.guild.id if interaction.guild else None
+        self.global_stream.publish("error", f"/{command}: {type(error).__name__}: {error}", guild_id)
+    
+    def check_restart_config(self):
+        """Raise ValueError if restart() cannot run with the current GlobalConfig"""
+        global_config = self.config_manager.global_config
+        if global_config.restart_mode == "service" and not global_config.restart_service:
+            raise ValueError("restart_mode 為 service 時必須設定 restart_service")
+    
+    async def restart(self):
+        """Persist in-flight state, then restart according to GlobalConfig.restart_mode"""
+        self.check_restart_config()
+        global_config = self.config_manager.global_config
+        
+        # Flush pending writes and snapshot in-memory state before the process goes away
+        self.config_manager.save_config()
+        await asyncio.to_thread(self.event_journal.flush)
+        await asyncio.to_thread(self.roll_audit.flush)
+        await asyncio.to_thread(self.sessions.flush)
+        sections = self.handoff.write_snapshot()
+        self._restarting = True
+        logger.info(f"Restart requested ({global_config.restart_mode}); saved state: {', '.join(sections)}")
+        
+        if global_config.restart_mode == "service":
+            # The service manager stops this process and starts a new one
+            process = await asyncio.create_subprocess_exec(
+                "systemctl", "--no-block", "restart", global_config.restart_service
+            )
+            await process.wait()
+            await self.close()
+            return
+        
+        await self.close()
+        logging.shutdown()
+        if multiprocessing.parent_process() is not None:
+            # Cluster worker: the supervisor starts a replacement immediately
+            os._exit(RESTART_EXIT_CODE)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    
+    async def close(self):
+        """Flush pending journal events before closing the connection"""
+        if self._journal_flush_task:
+            self._journal_flush_task.cancel()
+        if self._backup_task:
+            self._backup_task.cancel()
+        self.loop_monitor.stop()
+        self.watchdog.stop()
+        if 'journal' in self._components:
+            self.event_journal.flush()
+        if 'audit' in self._components:
+            self.roll_audit.flush()
+        if 'sessions' in self._components:
+            self.sessions.flush()
+        await self.global_stream.stop(flush=not self._restarting)
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await super().close()
     
     async def on_ready(self):
         """Event when bot is ready"""
+        if startup_profiler.running('gateway connect'):
+            startup_profiler.end('gateway connect')
+            if startup_profiler.enabled:
+                print("Startup profile:\n" + startup_profiler.report(), flush=True)
         logger.info(f"{self.user} has logged in!")
         logger.info(f"Connected to {len(self.guilds)} guilds")
-        logger.info(f" Serving {len(self.users)} users")
\ No newline at end of file
+        # member_count comes with each guild payload, so this works without a member cache
+        logger.info(f" Serving {sum(guild.member_count or 0 for guild in self.guilds)} members (memory profile: {self.memory_profile})")
+
+
+# Sharded variant: runs several gateway shards (all, or the given shard_ids) in one process
+class ShardedTRPGDiscordBot(TRPGDiscordBot, commands.AutoShardedBot):
+    pass
@@ -0,0 +1,37 @@
+import time
+import discord
+from discord import app_commands
+from utils.metrics import metrics
+from utils.rate_limit import charge_command, estimate_cost, roll_cost
+
+
+# Command tree that stamps and rate-limits every interaction before its handler runs
+class InstrumentedCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """Record the start time and running command, then apply the guild's rate limit"""
+        interaction.extras['started_at'] = time.perf_counter()
+        if interaction.command:
+            # The handler runs in this same task, so stalls in it can be attributed
+            self.client.watchdog.track(interaction.command.qualified_name)
+        if interaction.type is not discord.InteractionType.application_command or not interaction.guild:
+            return True
+        
+        retry_after = self.check_rate_limit(interaction)
+        if retry_after:
+            command_name = interaction.command.qualified_name if interaction.command else "unknown"
+            metrics.inc('trpg_rate_limited_total', command_name)
+            await interaction.response.send_message(f"指令使用過於頻繁，請在 {retry_after:.1f} 秒後再試", ephemeral=True)
+            return False
+        return True
+
+    def check_rate_limit(self, interaction: discord.Interaction) -> float:
+        """Charge the user's and the guild's token buckets; returns seconds to wait, or 0"""
+        bot = self.client
+        config = bot.config_manager.get_guild_config(interaction.guild.id)
+        command_name = interaction.command.qualified_name if interaction.command else ""
+        expression = getattr(interaction.namespace, 'expression', None)
+        if command_name == 'roll' and expression:
+            cost = roll_cost(str(expression), bot.macros, interaction.guild.id, config.dnd_rules)
+        else:
+            cost = estimate_cost(command_name, interaction.namespace)
+        return charge_command(bot.rate_limiter, config.rate_limit, interaction.guild.id, interaction.user.id, cost)
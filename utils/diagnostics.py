@@ -0,0 +1,122 @@
+import gc
+import math
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+import discord
+
+from utils.memory_profile import read_rss_bytes
+from utils.metrics import metrics, Histogram
+
+EMBED_FIELD_LIMIT = 1024
+PROCESS_STARTED_AT = time.time()
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f} ms"
+
+
+def _mib(size: int) -> str:
+    return f"{size / 2 ** 20:.1f} MiB"
+
+
+def _histogram_lines(histograms: Dict[str, Histogram], limit: int = 12) -> List[str]:
+    """One line per label, busiest first: count, mean and estimated p50/p99"""
+    lines = []
+    for label, histogram in sorted(histograms.items(), key=lambda item: -item[1].count)[:limit]:
+        mean = histogram.sum / histogram.count if histogram.count else 0.0
+        lines.append(
+            f"`{label}` ×{histogram.count}  平均 {_ms(mean)}  "
+            f"p50 {_ms(histogram.quantile(0.5))}  p99 {_ms(histogram.quantile(0.99))}"
+        )
+    return lines
+
+
+def _field(lines: List[str]) -> str:
+    text = "\n".join(lines) or "尚無資料"
+    if len(text) > EMBED_FIELD_LIMIT:
+        text = text[:EMBED_FIELD_LIMIT - 1] + "…"
+    return text
+
+
+def _gateway_latency(bot) -> str:
+    latencies = getattr(bot, 'latencies', None)
+    if latencies:
+        # Sharded bot: one heartbeat latency per shard
+        return "、".join(
+            f"#{shard_id} {_ms(latency)}" if not math.isnan(latency) and not math.isinf(latency) else f"#{shard_id} -"
+            for shard_id, latency in latencies
+        )
+    latency = bot.latency
+    return _ms(latency) if not math.isnan(latency) and not math.isinf(latency) else "尚未連線"
+
+
+def build_stats_embed(bot) -> discord.Embed:
+    """Render the always-on counters as a diagnostics embed; reads memory only, no I/O"""
+    embed = discord.Embed(title="執行狀態", color=0x5865F2)
+
+    monitor = bot.loop_monitor
+    loop_lines = [
+        f"p50 {_ms(monitor.percentile(0.5))}、p99 {_ms(monitor.percentile(0.99))}、"
+        f"最大 {_ms(max(monitor.samples, default=0.0))}",
+        f"（最近 {monitor.window_seconds:.0f} 秒，{len(monitor.samples)} 筆樣本）",
+    ]
+    if bot.watchdog.running or bot.watchdog.stalls:
+        loop_lines.append(f"監視器：已記錄 {bot.watchdog.stalls} 次阻塞")
+    embed.add_field(name="事件迴圈延遲", value="\n".join(loop_lines), inline=False)
+
+    memory = [f"RSS {_mib(read_rss_bytes())}"]
+    if tracemalloc.is_tracing():
+        # Bytes held by the Python heap are only known while tracemalloc is tracing
+        current, peak = tracemalloc.get_traced_memory()
+        memory.append(f"Python 堆積 {_mib(current)}（峰值 {_mib(peak)}，tracemalloc）")
+    else:
+        memory.append(f"Python 配置區塊 {sys.getallocatedblocks():,} 個（以 `/admin heap start` 追蹤可顯示位元組數）")
+    memory.append("GC 計數 " + "/".join(str(count) for count in gc.get_count()))
+    embed.add_field(name="記憶體", value="\n".join(memory), inline=False)
+
+    uptime = int(time.time() - PROCESS_STARTED_AT)
+    embed.add_field(
+        name="連線",
+        value=f"閘道延遲 {_gateway_latency(bot)}\n伺服器 {len(bot.guilds)}、運行 {uptime // 3600}時{uptime % 3600 // 60}分",
+        inline=False
+    )
+
+    errors = metrics.get_counter('trpg_command_errors_total')
+    limited = metrics.get_counter('trpg_rate_limited_total')
+    command_lines = _histogram_lines(metrics.get_histograms('trpg_command_duration_seconds'))
+    if errors or limited:
+        command_lines.append(
+            f"錯誤 {int(sum(errors.values()))}、頻率限制拒絕 {int(sum(limited.values()))}"
+        )
+    embed.add_field(name="指令", value=_field(command_lines), inline=False)
+
+    embed.add_field(
+        name="SQLite 查詢",
+        value=_field(_histogram_lines(metrics.get_histograms('trpg_sqlite_query_duration_seconds'))),
+        inline=False
+    )
+
+    saves = metrics.get_histograms('trpg_config_save_duration_seconds')
+    embed.add_field(name="設定檔儲存", value=_field(_histogram_lines(saves)), inline=False)
+
+    hits = metrics.get_counter('trpg_cache_hits_total')
+    misses = metrics.get_counter('trpg_cache_misses_total')
+    evictions = metrics.get_counter('trpg_cache_evictions_total')
+    cache_lines = []
+    for cache in sorted(set(hits) | set(misses)):
+        total = hits.get(cache, 0) + misses.get(cache, 0)
+        line = f"`{cache}` 命中率 {hits.get(cache, 0) / total:.1%}（{int(total)} 次查詢）"
+        if evictions.get(cache):
+            line += f"，逐出 {int(evictions[cache])}"
+        cache_lines.append(line)
+    embed.add_field(name="快取", value=_field(cache_lines), inline=False)
+
+    stream = bot.global_stream.stats()
+    embed.set_footer(
+        text=f"全域串流：已發布 {stream['published']}、佇列 {stream['queued']}、"
+             f"捨棄 {stream['dropped_overflow'] + stream['dropped_quota']}；頻率限制桶 {len(bot.rate_limiter)}"
+    )
+    return embed
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import discord
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+
+# (timestamp, kind, guild_id, content)
+StreamEvent = Tuple[float, str, Optional[int], str]
+
+KIND_LABELS = {
+    'crit_success': '✨ 大成功',
+    'crit_fail': '💥 大失敗',
+    'admin': '🛠️ 管理操作',
+    'error': '⚠️ 錯誤',
+}
+EMBED_DESCRIPTION_LIMIT = 4000
+
+
+# Mirrors selected events from every guild into the developers' global channel
+class GlobalStreamAggregator:
+    """
+    Events are buffered in a bounded queue and sent once per interval as a single digest embed.
+    Two overflow policies are supported:
+      - "drop-oldest": the queue keeps the most recent events
+      - "sample": the queue keeps a uniform random sample of the interval (reservoir sampling)
+    Each guild may contribute at most guild_quota events per interval; the rest are only counted.
+    """
+
+    POLICIES = ("drop-oldest", "sample")
+
+    def __init__(self, bot, max_queue: int = 200, policy: str = "drop-oldest",
+                 interval: float = 1.0, guild_quota: int = 10, max_lines: int = 20):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.bot = bot
+        self.max_queue = max_queue
+        self.policy = policy
+        self.interval = interval
+        self.guild_quota = guild_quota
+        self.max_lines = max_lines
+        self._queue: Deque[StreamEvent] = deque(maxlen=max_queue)
+        self._seen_in_window = 0
+        self._window_kinds: Counter = Counter()
+        self._window_guilds: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        # Lifetime counters
+        self.published = 0
+        self.dropped_overflow = 0
+        self.dropped_quota = 0
+        self.digests_sent = 0
+        self.send_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        global_config = self.bot.config_manager.global_config
+        return global_config.global_stream_enabled and global_config.global_stream_channel is not None
+
+    def publish(self, kind: str, content: str, guild_id: Optional[int] = None):
+        """Queue an event for the next digest; O(1) and never blocks"""
+        if not self.enabled:
+            return
+        self.published += 1
+        self._window_kinds[kind] += 1
+        self._window_guilds[guild_id] += 1
+        if guild_id is not None and self._window_guilds[guild_id] > self.guild_quota:
+            self.dropped_quota += 1
+            return
+
+        event = (time.time(), kind, guild_id, content)
+        self._seen_in_window += 1
+        if len(self._queue) < self.max_queue:
+            self._queue.append(event)
+        elif self.policy == "drop-oldest":
+            # deque(maxlen) discards the oldest entry
+            self._queue.append(event)
+            self.dropped_overflow += 1
+        else:
+            # Reservoir sampling keeps every accepted event with equal probability
+            self.dropped_overflow += 1
+            slot = random.randrange(self._seen_in_window)
+            if slot < self.max_queue:
+                self._queue[slot] = event
+
+    def start(self):
+        """Start the periodic digest task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, flush: bool = True):
+        """Stop the digest task and, unless handed over to a restart snapshot, send what is queued"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if flush:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Global stream flush failed: {e}")
+
+    def _drain(self) -> Tuple[List[StreamEvent], Counter, int]:
+        events = sorted(self._queue)
+        kinds = self._window_kinds
+        total = sum(kinds.values())
+        self._queue.clear()
+        self._seen_in_window = 0
+        self._window_kinds = Counter()
+        self._window_guilds = Counter()
+        return events, kinds, total
+
+    def build_digest(self, events: List[StreamEvent], kinds: Counter, total: int) -> discord.Embed:
+        """Render one interval's events as a single embed"""
+        summary = "、".join(f"{KIND_LABELS.get(kind, kind)} ×{count}" for kind, count in kinds.most_common())
+        lines = []
+        for _, kind, guild_id, content in events[:self.max_lines]:
+            guild = self.bot.get_guild(guild_id) if guild_id else None
+            source = guild.name if guild else (str(guild_id) if guild_id else "全域")
+            lines.append(f"{KIND_LABELS.get(kind, kind)} [{source}] {content}")
+        omitted = total - min(len(events), self.max_lines)
+        if omitted > 0:
+            lines.append(f"……另有 {omitted} 筆事件未顯示")
+
+        description = f"{summary}\n\n" + "\n".join(lines)
+        if len(description) > EMBED_DESCRIPTION_LIMIT:
+            description = description[:EMBED_DESCRIPTION_LIMIT - 1] + "…"
+        embed = discord.Embed(title="全域事件摘要", description=description, color=0x5865F2)
+        if self.dropped_overflow or self.dropped_quota:
+            embed.set_footer(text=f"累計捨棄：佇列溢出 {self.dropped_overflow}、伺服器配額 {self.dropped_quota}")
+        return embed
+
+    async def flush(self):
+        """Send the queued events as one digest embed"""
+        if not self._window_kinds:
+            return
+        events, kinds, total = self._drain()
+        if not self.enabled:
+            return
+        channel = self.bot.get_channel(self.bot.config_manager.global_config.global_stream_channel)
+        if channel is None:
+            return
+        try:
+            await channel.send(embed=self.build_digest(events, kinds, total))
+            self.digests_sent += 1
+        except Exception as e:
+            self.send_failures += 1
+            logger.error(f"Failed to send global stream digest: {e}")
+
+    def dump_state(self) -> Dict[str, Any]:
+        """Queued events and window counters, for the restart snapshot"""
+        return {
+            'queue': [list(event) for event in self._queue],
+            'kinds': dict(self._window_kinds),
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        """Re-queue events carried over from the previous process"""
+        for event in state.get('queue', []):
+            self._queue.append(tuple(event))
+        self._window_kinds.update(state.get('kinds', {}))
+        self._seen_in_window = len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """Lifetime counters for diagnostics"""
+        return {
+            'published': self.published,
+            'queued': len(self._queue),
+            'dropped_overflow': self.dropped_overflow,
+            'dropped_quota': self.dropped_quota,
+            'digests_sent': self.digests_sent,
+            'send_failures': self.send_failures,
+        }
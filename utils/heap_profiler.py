@@ -0,0 +1,114 @@
+import gc
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import List
+
+import discord
+
+
+# Modules whose classes are counted by object_counts()
+OWN_MODULE_PREFIXES = ('cogs.', 'models.', 'utils.')
+# Deepest traceback tracemalloc.start() accepts
+MAX_TRACE_FRAMES = 65535
+
+
+# Developer-facing tracemalloc control, snapshots and diffs
+class HeapProfiler:
+    """
+    Tracing is off by default and costs nothing until start(). Snapshots are kept by name,
+    at most max_snapshots of them (oldest dropped first), filtered to leave out the
+    allocations made by tracemalloc and the import machinery themselves. Snapshots survive
+    stop(), so a diff can still be rendered after tracing is turned off.
+    """
+
+    def __init__(self, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self.snapshots: "OrderedDict[str, tracemalloc.Snapshot]" = OrderedDict()
+        # name -> (taken at, traced bytes)
+        self._info = {}
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        """Start tracing; more frames give better tracebacks at a higher cost"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def take_snapshot(self, name: str) -> tracemalloc.Snapshot:
+        """Take and store a named snapshot; tracing must be on"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc 尚未啟動")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        self.snapshots.pop(name, None)
+        self.snapshots[name] = snapshot
+        self._info[name] = (time.time(), sum(trace.size for trace in snapshot.traces))
+        while len(self.snapshots) > self.max_snapshots:
+            dropped, _ = self.snapshots.popitem(last=False)
+            self._info.pop(dropped, None)
+        return snapshot
+
+    def list_snapshots(self) -> List[str]:
+        lines = []
+        for name in self.snapshots:
+            taken_at, size = self._info[name]
+            lines.append(f"{name}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken_at))}  {size / 2 ** 20:.1f} MiB traced")
+        return lines
+
+    def _get(self, name: str) -> tracemalloc.Snapshot:
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            raise KeyError(f"找不到快照：{name}")
+        return snapshot
+
+    def top(self, name: str, limit: int = 40) -> str:
+        """Largest allocation sites of one snapshot, grouped by file and line"""
+        stats = self._get(name).statistics('lineno')
+        lines = [f"snapshot {name}: top {min(limit, len(stats))} of {len(stats)} allocation sites"]
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines) + "\n"
+
+    def diff(self, old_name: str, new_name: str, limit: int = 40) -> str:
+        """Allocation growth from one snapshot to another, grouped by file and line"""
+        stats = self._get(new_name).compare_to(self._get(old_name), 'lineno')
+        total = sum(stat.size_diff for stat in stats)
+        lines = [f"diff {old_name} -> {new_name}: {total / 1024:+.1f} KiB across {len(stats)} allocation sites"]
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"{stat.size_diff / 1024:>+10.1f} KiB {stat.count_diff:>+8} blocks "
+                f"(now {stat.size / 1024:.1f} KiB)  {frame.filename}:{frame.lineno}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+def object_counts(limit: int = 40) -> str:
+    """
+    Live instances of the bot's own classes and of discord.ui views and items, from a full
+    scan of the garbage collector's objects. Costs one pass over the heap; run on demand only.
+    """
+    counts: Counter = Counter()
+    for obj in gc.get_objects():
+        cls = type(obj)
+        module = cls.__module__
+        if not isinstance(module, str):
+            # Some extension types expose __module__ as a descriptor
+            continue
+        if module.startswith(OWN_MODULE_PREFIXES) or isinstance(obj, (discord.ui.View, discord.ui.Item)):
+            counts[f"{module}.{cls.__qualname__}"] += 1
+    lines = [f"live objects of bot and discord.ui classes ({sum(counts.values())} total)"]
+    for name, count in counts.most_common(limit):
+        lines.append(f"{count:>8}  {name}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+import logging
+import multiprocessing
+import signal
+import time
+from typing import Dict, List, Optional
+from utils.restart import RESTART_EXIT_CODE, RESTORE_EXIT_CODE
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+
+# A worker that stays up this long is considered healthy and its crash backoff is reset
+HEALTHY_UPTIME = 60.0
+
+
+def split_shards(shard_count: int, clusters: int) -> List[List[int]]:
+    """Split shard ids 0..shard_count-1 into contiguous, evenly sized clusters"""
+    if clusters < 1 or clusters > shard_count:
+        raise ValueError("叢集數必須介於 1 與分片數之間")
+    base, extra = divmod(shard_count, clusters)
+    result = []
+    start = 0
+    for i in range(clusters):
+        size = base + (1 if i < extra else 0)
+        result.append(list(range(start, start + size)))
+        start += size
+    return result
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_cluster(token: str, shard_ids: List[int], shard_count: int, index: int = 0):
+    """Worker process entry point: run one sharded bot for the given shard ids"""
+    # Let bot.run() shut down gracefully (flushing journals) when the supervisor terminates us
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"[shards {shard_ids[0]}-{shard_ids[-1]}] %(levelname)s:%(name)s:%(message)s"
+    )
+    from utils.bot import ShardedTRPGDiscordBot
+
+    # Shard 0's cluster owns global command sync
+    bot = ShardedTRPGDiscordBot(shard_ids=shard_ids, shard_count=shard_count, sync_commands=0 in shard_ids,
+                                cluster_index=index)
+    bot.run(token, log_handler=None)
+
+
+class _Worker:
+    def __init__(self, index: int, shard_ids: List[int]):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.backoff = 1.0
+        self.restart_at: Optional[float] = None
+
+
+class ClusterSupervisor:
+    """
+    Runs one process per shard cluster and restarts workers that crash,
+    with exponential backoff. A worker exiting with code 0 (e.g. /admin shutdown)
+    is not restarted; the supervisor returns once every worker has exited cleanly.
+    RESTART_EXIT_CODE (from /admin restart) restarts the worker immediately, and
+    RESTORE_EXIT_CODE (from /admin backup restore) stops every worker, restores the
+    requested backup and starts them all again.
+    """
+
+    def __init__(self, token: str, shard_count: int, clusters: int, max_backoff: float = 60.0):
+        self.token = token
+        self.shard_count = shard_count
+        self.max_backoff = max_backoff
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: Dict[int, _Worker] = {
+            i: _Worker(i, shard_ids) for i, shard_ids in enumerate(split_shards(shard_count, clusters))
+        }
+        self._stopping = False
+
+    def _start(self, worker: _Worker):
+        worker.process = self._context.Process(
+            target=run_cluster,
+            args=(self.token, worker.shard_ids, self.shard_count, worker.index),
+            name=f"trpg-cluster-{worker.index}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        logger.info(f"Cluster {worker.index} started (pid {worker.process.pid}, shards {worker.shard_ids})")
+
+    def _stop_workers(self, timeout: float = 15.0):
+        """Terminate all workers and wait for them to exit"""
+        for worker in self._workers.values():
+            if worker.process and worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers.values():
+            if worker.process:
+                worker.process.join(max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+    def _restore(self):
+        """Carry out a worker's restore request with every cluster stopped, then start them all"""
+        from utils.backup import BackupManager
+        self._stop_workers()
+        backups = BackupManager.from_env()
+        name = backups.take_restore_request()
+        if name:
+            try:
+                backups.restore(name)
+                logger.info(f"Restored backup {name}")
+            except Exception as e:
+                logger.error(f"Restoring backup {name} failed: {e}")
+        for worker in self._workers.values():
+            worker.backoff = 1.0
+            self._start(worker)
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"Supervisor received signal {signum}, stopping workers")
+        self._stopping = True
+
+    def run(self):
+        """Start every cluster and supervise until all have exited cleanly or a signal arrives"""
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        for worker in self._workers.values():
+            self._start(worker)
+
+        try:
+            while not self._stopping and self._workers:
+                time.sleep(1.0)
+                now = time.monotonic()
+                for index, worker in list(self._workers.items()):
+                    if worker.restart_at is not None:
+                        if now >= worker.restart_at:
+                            self._start(worker)
+                        continue
+                    if worker.process.is_alive():
+                        continue
+                    exitcode = worker.process.exitcode
+                    if exitcode == 0:
+                        logger.info(f"Cluster {index} exited cleanly; not restarting")
+                        del self._workers[index]
+                        continue
+                    if exitcode == RESTORE_EXIT_CODE:
+                        logger.info(f"Cluster {index} requested a backup restore; restarting all clusters")
+                        self._restore()
+                        break
+                    if exitcode == RESTART_EXIT_CODE:
+                        logger.info(f"Cluster {index} requested a restart")
+                        self._start(worker)
+                        continue
+                    if now - worker.started_at >= HEALTHY_UPTIME:
+                        worker.backoff = 1.0
+                    logger.warning(f"Cluster {index} exited with code {exitcode}; restarting in {worker.backoff:.0f}s")
+                    worker.restart_at = now + worker.backoff
+                    worker.backoff = min(worker.backoff * 2, self.max_backoff)
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 15.0):
+        """Terminate all workers and wait for them to exit"""
+        self._stop_workers(timeout)
+        self._workers.clear()
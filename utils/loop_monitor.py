@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from utils.metrics import metrics
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+
+
+# Measures event-loop responsiveness continuously
+class LoopLagMonitor:
+    """
+    A task sleeps for interval seconds and records how late it wakes up. The overshoot is
+    the time other callbacks held the loop. The last window samples are kept for percentiles
+    and every sample also goes to the trpg_event_loop_lag_seconds histogram.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 600):
+        self.interval = interval
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start sampling on the running loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.samples.append(lag)
+            metrics.observe('trpg_event_loop_lag_seconds', 'main', lag)
+
+    def percentile(self, q: float) -> float:
+        """Lag percentile over the sliding window, in seconds"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def window_seconds(self) -> float:
+        """Approximate time span covered by the current samples"""
+        return len(self.samples) * self.interval
+
+
+# Finds which handler blocked the event loop
+class LoopWatchdog:
+    """
+    A heartbeat task stamps the time every threshold / 4 seconds. A daemon thread checks
+    the stamp every sample_interval; once it is older than threshold the loop is blocked,
+    and the thread samples the loop thread's stack until the heartbeat resumes. Each stall
+    becomes one record (duration, the app command whose task was running, the most common
+    stacks) in a ring buffer of the last capacity stalls.
+    """
+
+    def __init__(self, threshold: float = 0.25, sample_interval: float = 0.01,
+                 capacity: int = 50, max_stacks: int = 3, stack_limit: int = 25):
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.max_stacks = max_stacks
+        self.stack_limit = stack_limit
+        self.records: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Running task -> app command name, filled in by the command tree
+        self._commands: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Start the heartbeat on the running loop and the sampling thread"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        # A fresh event, so a thread from a previous start() cannot miss its stop signal
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event-loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stop.set()
+        self._thread = None
+
+    def track(self, command_name: str):
+        """Attribute stalls in the current task to an app command"""
+        if self._task is None:
+            return
+        task = asyncio.current_task()
+        if task is not None:
+            self._commands[task] = command_name
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def _running_command(self) -> Optional[str]:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        return self._commands.get(task) if task is not None else None
+
+    def _sample_stack(self) -> Optional[str]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        return "".join(traceback.format_stack(frame, limit=self.stack_limit))
+
+    def _watch(self, stop: threading.Event):
+        stall: Optional[Dict[str, Any]] = None
+        stacks: Counter = Counter()
+        while not stop.wait(self.sample_interval):
+            beat = self._beat
+            if time.monotonic() - beat < self.threshold:
+                if stall is not None:
+                    self._finish(stall, stacks, beat)
+                    stall, stacks = None, Counter()
+                continue
+            if stall is None:
+                stall = {
+                    'started_at': time.time() - (time.monotonic() - beat),
+                    'beat': beat,
+                    'command': self._running_command(),
+                }
+            stack = self._sample_stack()
+            if stack:
+                stacks[stack] += 1
+
+    def _finish(self, stall: Dict[str, Any], stacks: Counter, resumed_beat: float):
+        # The new beat bounds the stall from above; the sampling interval bounds the error
+        duration = max(0.0, resumed_beat - stall['beat'] - self.threshold / 4)
+        record = {
+            'started_at': stall['started_at'],
+            'duration': duration,
+            'command': stall['command'],
+            'samples': sum(stacks.values()),
+            'stacks': stacks.most_common(self.max_stacks),
+        }
+        self.records.append(record)
+        self.stalls += 1
+        metrics.inc('trpg_event_loop_stalls_total', stall['command'] or "unknown")
+        logger.warning(
+            f"Event loop blocked for {duration * 1000:.0f} ms"
+            + (f" in /{stall['command']}" if stall['command'] else "")
+        )
+
+    def dump(self) -> str:
+        """Render the ring buffer as plain text, newest stall first"""
+        lines: List[str] = [
+            f"event-loop watchdog: threshold {self.threshold * 1000:.0f} ms, "
+            f"{self.stalls} stalls recorded, {len(self.records)} kept"
+        ]
+        for record in reversed(self.records):
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['started_at']))
+            lines.append("")
+            lines.append(
+                f"== {started}  blocked ~{record['duration'] * 1000:.0f} ms  "
+                f"command: /{record['command'] or '?'}  samples: {record['samples']}"
+            )
+            for stack, count in record['stacks']:
+                lines.append(f"-- {count} of {record['samples']} samples:")
+                lines.append(stack.rstrip())
+        return "\n".join(lines) + "\n"
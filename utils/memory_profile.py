@@ -0,0 +1,54 @@
+import os
+import sys
+from typing import Any, Dict
+
+import discord
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Gateway cache settings selected at startup by MEMORY_PROFILE / --memory-profile
+MEMORY_PROFILES = ('minimal', 'standard')
+DEFAULT_MEMORY_PROFILE = 'standard'
+
+
+def client_options(profile: str) -> Dict[str, Any]:
+    """
+    discord.Client options for a memory profile.
+      - standard: default intents plus message content, discord.py's default caches
+      - minimal:  only the guilds intent (enough for slash commands and channel lookups),
+                  no message cache, no member cache and no member chunking
+    """
+    if profile not in MEMORY_PROFILES:
+        raise ValueError(f"Unknown memory profile: {profile} (expected one of {', '.join(MEMORY_PROFILES)})")
+
+    if profile == 'minimal':
+        intents = discord.Intents.none()
+        intents.guilds = True
+        return {
+            'intents': intents,
+            'max_messages': None,
+            'member_cache_flags': discord.MemberCacheFlags.none(),
+            'chunk_guilds_at_startup': False,
+        }
+
+    intents = discord.Intents.default()
+    intents.message_content = True  # Required to read message content
+    intents.guilds = True
+    return {'intents': intents}
+
+
+def read_rss_bytes() -> int:
+    """Current resident set size; falls back to the peak RSS where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,192 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+
+# Latency buckets in seconds, from sub-millisecond dice rolls to slow HTTP round-trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two additions"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # One extra slot for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside the matching bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bucket_count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if bucket_count and seen + bucket_count >= rank:
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, each family keyed by a single label value.
+    Rendering to the Prometheus text format happens only when scraped.
+    """
+
+    def __init__(self):
+        # name -> (type, help, label name)
+        self._families: Dict[str, Tuple[str, str, str]] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._histograms: Dict[str, Dict[str, Histogram]] = {}
+
+    def counter(self, name: str, help_text: str, label: str):
+        """Declare a counter family"""
+        self._families[name] = ('counter', help_text, label)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, label: str):
+        """Declare a histogram family"""
+        self._families[name] = ('histogram', help_text, label)
+        self._histograms.setdefault(name, {})
+
+    def inc(self, name: str, label_value: str, amount: float = 1):
+        series = self._counters[name]
+        series[label_value] = series.get(label_value, 0) + amount
+
+    def observe(self, name: str, label_value: str, value: float):
+        series = self._histograms[name]
+        histogram = series.get(label_value)
+        if histogram is None:
+            histogram = series[label_value] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, label_value: str) -> Iterator[None]:
+        """Observe the duration of the with-block, including when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label_value, time.perf_counter() - start)
+
+    def timed(self, name: str, label_value: str):
+        """Decorator form of timer() for synchronous functions"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, label_value, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def get_counter(self, name: str) -> Dict[str, float]:
+        return dict(self._counters.get(name, {}))
+
+    def get_histograms(self, name: str) -> Dict[str, Histogram]:
+        return dict(self._histograms.get(name, {}))
+
+    def render_prometheus(self) -> str:
+        """Render every family in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for name, (kind, help_text, label) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for value, amount in self._counters[name].items():
+                    lines.append(f'{name}{{{label}="{_escape(value)}"}} {amount}')
+            else:
+                for value, histogram in self._histograms[name].items():
+                    escaped = _escape(value)
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{{{label}="{escaped}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{label}="{escaped}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label}="{escaped}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}="{escaped}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Shared registry and the metric families used across the bot
+metrics = MetricsRegistry()
+metrics.histogram('trpg_command_duration_seconds', 'App command handler latency', 'command')
+metrics.counter('trpg_command_errors_total', 'App command handler errors', 'command')
+metrics.counter('trpg_rate_limited_total', 'App command calls rejected by the rate limiter', 'command')
+metrics.histogram('trpg_sqlite_query_duration_seconds', 'SQLite query latency', 'query')
+metrics.histogram('trpg_config_save_duration_seconds', 'config.json save latency', 'file')
+metrics.histogram('trpg_event_loop_lag_seconds', 'Event-loop wake-up delay', 'loop')
+metrics.counter('trpg_event_loop_stalls_total', 'Event-loop stalls caught by the watchdog', 'command')
+metrics.counter('trpg_cache_hits_total', 'In-memory cache hits', 'cache')
+metrics.counter('trpg_cache_misses_total', 'In-memory cache misses', 'cache')
+metrics.counter('trpg_cache_evictions_total', 'Entries evicted from in-memory caches', 'cache')
+
+
+class MetricsServer:
+    """Minimal HTTP listener serving GET /metrics; meant to be bound to localhost"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers; the request body is never used
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status = "200 OK"
+                body = self.registry.render_prometheus().encode('utf-8')
+            else:
+                status = "404 Not Found"
+                body = b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,166 @@
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from core.group_roll import count_group_entries
+
+
+# Matches the "+N " repeat prefix and the "XdY" part of a /roll expression
+_REPEAT_PATTERN = re.compile(r'^\+?(\d+)\s+')
+_DICE_PATTERN = re.compile(r'(\d*)d(\d+)')
+
+
+def _roll_cost(namespace: Any) -> float:
+    """One token plus one per 100 dice rolled"""
+    expression = str(getattr(namespace, 'expression', '') or '').strip()
+    repeat = _REPEAT_PATTERN.match(expression)
+    roll_count = int(repeat.group(1)) if repeat else 1
+    dice = _DICE_PATTERN.search(expression)
+    dice_count = int(dice.group(1) or 1) if dice else 1
+    return 1 + roll_count * dice_count / 100
+
+
+def compiled_roll_cost(compiled: Dict[str, Any]) -> float:
+    """The same cost as _roll_cost, from a compiled expression"""
+    return 1 + compiled['roll_count'] * compiled['count'] / 100
+
+
+def roll_cost(expression: str, macros: Any, guild_id: int, rules: Dict[str, Any]) -> float:
+    """Cost of a /roll or !r expression; a saved @macro is charged for what it expands to"""
+    expression = expression.strip()
+    if expression.startswith('@'):
+        macro = macros.get_macro(guild_id, expression[1:], rules)
+        if macro is not None and macro.compiled is not None:
+            return compiled_roll_cost(macro.compiled)
+    return _roll_cost(SimpleNamespace(expression=expression))
+
+
+def _coc_cost(namespace: Any) -> float:
+    times = getattr(namespace, 'times', None) or 1
+    return 1 + times / 10
+
+
+def _group_cost(namespace: Any) -> float:
+    """One token plus one per four participants; saved parties are assumed to have five"""
+    entries = getattr(namespace, 'entries', None)
+    return 1 + (count_group_entries(entries) if entries else 5) / 4
+
+
+# Estimated cost per command; unlisted commands cost one token
+COMMAND_COSTS: Dict[str, Callable[[Any], float]] = {
+    'roll': _roll_cost,
+    'coc': _coc_cost,
+    'roll-group': _group_cost,
+    'coc-group': _group_cost,
+    'log-export': lambda namespace: 5,
+}
+
+
+def estimate_cost(command_name: str, namespace: Any) -> float:
+    """Estimated token cost of a command invocation from its arguments"""
+    cost_function = COMMAND_COSTS.get(command_name)
+    if cost_function is None:
+        return 1
+    try:
+        return cost_function(namespace)
+    except (TypeError, ValueError):
+        return 1
+
+
+# Token buckets with lazy refill
+class TokenBucketLimiter:
+    """
+    Each key maps to a (tokens, last_update, full_at) tuple; tokens are refilled only
+    when the key is next seen. Once full_at has passed the bucket has refilled
+    completely, so it is indistinguishable from a missing one and is dropped by the
+    periodic sweep. full_at comes from the bucket's own capacity and refill rate, which
+    differ between guilds.
+    """
+
+    def __init__(self, sweep_interval: float = 60.0):
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[Hashable, Tuple[float, float, float]] = {}
+        self._last_sweep = time.monotonic()
+        self.rejected = 0
+
+    def acquire(self, key: Hashable, cost: float, capacity: float, refill_per_second: float,
+                now: Optional[float] = None) -> float:
+        """Take cost tokens; returns 0 if allowed, otherwise the seconds to wait"""
+        if now is None:
+            now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+        # A command costing more than the whole bucket still runs once the bucket is full
+        cost = min(cost, capacity)
+        if tokens < cost:
+            self._store(key, tokens, now, capacity, refill_per_second)
+            self.rejected += 1
+            return (cost - tokens) / refill_per_second
+        self._store(key, tokens - cost, now, capacity, refill_per_second)
+        return 0.0
+
+    def _store(self, key: Hashable, tokens: float, now: float, capacity: float, refill_per_second: float):
+        self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill_per_second)
+
+    def refund(self, key: Hashable, cost: float, capacity: float, refill_per_second: float):
+        """Give back tokens taken by acquire() when a later check rejected the call"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._store(key, min(capacity, bucket[0] + min(cost, capacity)), bucket[1], capacity, refill_per_second)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop buckets that have refilled completely; returns how many were removed"""
+        if now is None:
+            now = time.monotonic()
+        self._last_sweep = now
+        idle = [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def dump_state(self) -> Dict[str, Any]:
+        """Buckets that have not refilled yet, for the restart snapshot"""
+        now = time.monotonic()
+        buckets = [
+            [list(key) if isinstance(key, tuple) else key, tokens, now - last_update, full_at - now]
+            for key, (tokens, last_update, full_at) in self._buckets.items() if full_at > now
+        ]
+        return {'dumped_at': time.time(), 'buckets': buckets}
+
+    def load_state(self, state: Dict[str, Any]):
+        """
+        Restore buckets from the previous process, so a restart does not hand every user
+        a full bucket. Monotonic clocks differ between processes, so ages are carried as
+        offsets and the time spent restarting counts as refill time.
+        """
+        now = time.monotonic()
+        gap = max(0.0, time.time() - state.get('dumped_at', time.time()))
+        for key, tokens, age, full_in in state.get('buckets', []):
+            if full_in - gap <= 0:
+                continue
+            key = tuple(key) if isinstance(key, list) else key
+            self._buckets[key] = (tokens, now - gap - age, now - gap + full_in)
+
+
+def charge_command(limiter: TokenBucketLimiter, settings: Dict[str, Any], guild_id: int, user_id: int,
+                   cost: float) -> float:
+    """Charge the user's and the guild's token buckets; returns seconds to wait, or 0"""
+    if not settings.get('enabled', True):
+        return 0.0
+    user_key = (guild_id, user_id)
+    retry_after = limiter.acquire(user_key, cost, settings['user_capacity'], settings['user_refill_per_second'])
+    if retry_after:
+        return retry_after
+    retry_after = limiter.acquire(guild_id, cost, settings['guild_capacity'], settings['guild_refill_per_second'])
+    if retry_after:
+        limiter.refund(user_key, cost, settings['user_capacity'], settings['user_refill_per_second'])
+    return retry_after
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+
+# Initialize logging
+logger = logging.getLogger('trpg_bot')
+
+# Exit code a cluster worker uses to ask the supervisor for an immediate restart
+RESTART_EXIT_CODE = 75
+# Exit code a cluster worker uses to have the supervisor stop every cluster, restore a backup and start them again
+RESTORE_EXIT_CODE = 76
+# Snapshots older than this are considered stale and ignored on boot
+SNAPSHOT_MAX_AGE = 300.0
+
+
+# Carries in-memory state across a restart through a snapshot file
+class StateHandoff:
+    """
+    Components register a (dump, load) pair under a section name. dump() must return
+    JSON-serializable data; load() receives that data in the new process. Typical
+    sections are open confirmation views, buffered stream events and warm caches.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._providers: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+
+    def register(self, name: str, dump: Callable[[], Any], load: Callable[[Any], None]):
+        """Register a snapshot section"""
+        self._providers[name] = (dump, load)
+
+    def write_snapshot(self) -> List[str]:
+        """Dump every section to the snapshot file atomically; returns the sections written"""
+        sections = {}
+        for name, (dump, _) in self._providers.items():
+            try:
+                sections[name] = dump()
+            except Exception as e:
+                logger.error(f"Failed to dump restart state '{name}': {e}")
+        data = {'created_at': time.time(), 'sections': sections}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return list(sections)
+
+    def restore(self) -> List[str]:
+        """Load and consume the snapshot file, if any; returns the sections restored"""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Unreadable restart snapshot {self.path}: {e}")
+            data = None
+        finally:
+            # A snapshot is only ever applied once
+            os.remove(self.path)
+
+        if not data:
+            return []
+        age = time.time() - data.get('created_at', 0)
+        if age > SNAPSHOT_MAX_AGE:
+            logger.info(f"Ignoring stale restart snapshot ({age:.0f}s old)")
+            return []
+
+        restored = []
+        for name, section in data.get('sections', {}).items():
+            provider = self._providers.get(name)
+            if provider is None:
+                continue
+            try:
+                provider[1](section)
+                restored.append(name)
+            except Exception as e:
+                logger.error(f"Failed to restore restart state '{name}': {e}")
+        return restored
@@ -0,0 +1,69 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Records when each startup phase ran, relative to process start
+class StartupProfiler:
+    """
+    Phases may overlap (config and DB init run in worker threads during login),
+    so every phase keeps its own start offset as well as its duration.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.enabled = False
+        self._phases: Dict[str, Tuple[float, float]] = {}
+        self._open: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the with-block as a named phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter())
+
+    def begin(self, name: str):
+        """Start a phase whose end is observed elsewhere (e.g. in another callback)"""
+        self._open[name] = time.perf_counter()
+
+    def end(self, name: str):
+        """Finish a phase started with begin(); ignored if it was never started"""
+        start = self._open.pop(name, None)
+        if start is not None:
+            self._record(name, start, time.perf_counter())
+
+    def running(self, name: str) -> bool:
+        """Whether a phase was started with begin() and has not ended yet"""
+        return name in self._open
+
+    def _record(self, name: str, start: float, end: float):
+        with self._lock:
+            self._phases[name] = (start - self.origin, end - start)
+
+    def durations(self, names: Optional[List[str]] = None) -> Dict[str, float]:
+        """Durations in seconds, optionally restricted to the given phases"""
+        with self._lock:
+            return {
+                name: duration for name, (_, duration) in self._phases.items()
+                if names is None or name in names
+            }
+
+    def report(self) -> str:
+        """Human readable breakdown ordered by start time"""
+        with self._lock:
+            phases = sorted(self._phases.items(), key=lambda item: item[1][0])
+        width = max([len('phase')] + [len(name) for name, _ in phases])
+        lines = [f"{'phase'.ljust(width)}  {'start':>9}  {'duration':>9}"]
+        for name, (offset, duration) in phases:
+            lines.append(f"{name.ljust(width)}  {offset * 1000:7.1f}ms  {duration * 1000:7.1f}ms")
+        lines.append(f"{'total'.ljust(width)}  {'':>9}  {(time.perf_counter() - self.origin) * 1000:7.1f}ms")
+        return "\n".join(lines)
+
+
+# Shared profiler; main.py imports this first so the origin is close to process start
+startup_profiler = StartupProfiler()
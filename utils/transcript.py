@@ -0,0 +1,170 @@
+import csv
+import io
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, IO
+
+
+# Transcript export pipeline: events -> text lines -> byte chunks -> size-bounded parts
+TRANSCRIPT_FORMATS = {
+    # format: (file extension, compressed)
+    'csv': ('csv', False),
+    'markdown': ('md', False),
+    'gzip': ('csv.gz', True),
+}
+
+CSV_HEADER = ['time', 'channel_id', 'user_id', 'user', 'kind', 'content']
+CHUNK_SIZE = 64 * 1024
+# Parts larger than this are moved from memory to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+
+def format_timestamp(ts: float) -> str:
+    """Format a unix timestamp in the host's local time"""
+    return datetime.fromtimestamp(ts).astimezone().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def csv_header() -> str:
+    """Header line repeated at the top of every CSV part"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(CSV_HEADER)
+    return buffer.getvalue()
+
+
+def render_csv(events: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Render events as CSV lines (without header)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for event in events:
+        writer.writerow([
+            format_timestamp(event['created_at']),
+            event['channel_id'] or '',
+            event['user_id'] or '',
+            event['user_name'],
+            event['kind'],
+            event['content']
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def markdown_header() -> str:
+    """Table header repeated at the top of every Markdown part"""
+    return "| 時間 | 頻道 | 玩家 | 類型 | 內容 |\n|---|---|---|---|---|\n"
+
+
+def markdown_cell(text: Any) -> str:
+    """Escape a value for a Markdown table cell: pipes would split it, newlines end the row"""
+    return str(text or '').replace('|', '\\|').replace('\r\n', '<br>').replace('\n', '<br>').replace('\r', '<br>')
+
+
+def render_markdown(events: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Render events as Markdown table rows"""
+    for event in events:
+        channel = f"<#{event['channel_id']}>" if event['channel_id'] else ''
+        yield (
+            f"| {format_timestamp(event['created_at'])} | {channel} | {markdown_cell(event['user_name'])} "
+            f"| {markdown_cell(event['kind'])} | {markdown_cell(event['content'])} |\n"
+        )
+
+
+def encode_chunks(lines: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Group text lines into UTF-8 chunks of roughly chunk_size bytes"""
+    pending: List[bytes] = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b''.join(pending)
+
+
+class _PartWriter:
+    """A single attachment being filled, optionally as an independent gzip member"""
+
+    def __init__(self, header: bytes, compress: bool):
+        self.file: IO[bytes] = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self.size = 0
+        self.chunks = 0
+        self._compressor = zlib.compressobj(wbits=31) if compress else None
+        self.write(header, is_header=True)
+
+    def write(self, data: bytes, is_header: bool = False):
+        if self._compressor is not None:
+            # Sync-flush so that self.size is the exact compressed size so far
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.file.write(data)
+        self.size += len(data)
+        if not is_header:
+            self.chunks += 1
+
+    def finish(self) -> IO[bytes]:
+        if self._compressor is not None:
+            self.file.write(self._compressor.flush())
+        self.file.seek(0)
+        return self.file
+
+
+def iter_transcript_parts(events: Iterable[Dict[str, Any]], fmt: str,
+                          max_bytes: int) -> Iterator[IO[bytes]]:
+    """
+    Stream events into one or more attachment-sized files.
+    Each part is self-contained (own header, own gzip member) and at most max_bytes long.
+    Memory use is bounded by CHUNK_SIZE plus SPOOL_SIZE regardless of the number of events.
+    """
+    if fmt not in TRANSCRIPT_FORMATS:
+        raise ValueError(f"Unknown transcript format: {fmt}")
+    _, compress = TRANSCRIPT_FORMATS[fmt]
+    if fmt == 'markdown':
+        header = markdown_header().encode('utf-8')
+        lines = render_markdown(events)
+    else:
+        header = csv_header().encode('utf-8')
+        lines = render_csv(events)
+
+    # Worst-case growth of a chunk after deflate plus sync-flush framing
+    overhead = 64
+    part: Optional[_PartWriter] = None
+    for chunk in encode_chunks(lines):
+        if part is not None and part.chunks and part.size + len(chunk) + overhead > max_bytes:
+            yield part.finish()
+            part = None
+        if part is None:
+            part = _PartWriter(header, compress)
+        part.write(chunk)
+    if part is not None:
+        yield part.finish()
+
+
+def transcript_filename(fmt: str, start: datetime, end: datetime, index: int) -> str:
+    """Build an attachment filename such as transcript-20261019_2000-20261019_2300-part1.csv.gz"""
+    extension, _ = TRANSCRIPT_FORMATS[fmt]
+    span = f"{start.strftime('%Y%m%d_%H%M')}-{end.strftime('%Y%m%d_%H%M')}"
+    return f"transcript-{span}-part{index}.{extension}"
+
+
+def parse_time_range(start_text: str, end_text: str) -> Tuple[datetime, datetime]:
+    """
+    Parse user supplied times such as "2026-10-19" or "2026-10-19 20:00".
+    Naive values use the host's local timezone; a date-only end covers the whole day.
+    """
+    def parse(text: str, is_end: bool) -> datetime:
+        value = datetime.fromisoformat(text.strip())
+        if value.tzinfo is None:
+            value = value.astimezone()
+        if is_end and len(text.strip()) == 10:
+            value = value.replace(hour=23, minute=59, second=59, microsecond=999999)
+        return value
+
+    start = parse(start_text, False)
+    end = parse(end_text, True)
+    if end <= start:
+        raise ValueError("結束時間必須晚於開始時間")
+    return start, end